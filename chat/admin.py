@@ -1,3 +1,328 @@
-from django.contrib import admin
+"""
+Admin for the chat tables, which grow to millions of rows.
 
-# Register your models here.
+- Change lists page by primary key (``pk < cursor``) instead of OFFSET, so the
+  last page costs the same as the first. Column sorting is off for the same reason.
+- Counts stop at ``ADMIN_EXACT_COUNT_LIMIT``; an unfiltered table larger than that
+  shows the database's row estimate instead of a full ``COUNT(*)``.
+- The date hierarchy asks the index for the first and last date only, instead of
+  a ``DISTINCT`` over every row in the range.
+- Filters have fixed choices rather than ``SELECT DISTINCT`` over the table, and
+  bulk actions are single UPDATE/INSERT/DELETE statements over the selection.
+"""
+import calendar
+from datetime import date
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.utils import formats, timezone
+from django.utils.functional import cached_property
+from django.utils.text import capfirst
+
+from .deletion import soft_delete_sessions
+from .models import APIUsageLog, ChatSession, ChatSessionTag, Message, RateLimitConfig
+from .rate_limit import RateLimiter
+
+CURSOR_VAR = 'cursor'
+
+
+# ==================== COUNTS ====================
+
+def estimated_row_count(model, using):
+    """The database's own estimate of ``model``'s row count, or None if it keeps none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                       [connection.ops.quote_name(table)]),
+        'mysql': ("SELECT table_rows FROM information_schema.tables "
+                  "WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+        # Written by ANALYZE (sqlite_maintenance --analyze); stat starts with the row count
+        'sqlite': ("SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(*queries[connection.vendor])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 only exists once ANALYZE has run
+        return None
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts exactly up to ``ADMIN_EXACT_COUNT_LIMIT`` rows and estimates beyond that."""
+
+    count_label = None
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                self.count_label = f"about {estimate}"
+                return estimate
+        count = queryset.order_by()[:limit + 1].count()
+        self.count_label = f"{limit}+" if count > limit else str(count)
+        return count
+
+
+# ==================== CHANGE LIST ====================
+
+class CursorChangeList(ChangeList):
+    """Newest rows first, one page at a time after the ``cursor`` primary key."""
+
+    def __init__(self, request, *args, **kwargs):
+        cursor = request.GET.get(CURSOR_VAR, '')
+        self.cursor = int(cursor) if cursor.isdigit() else None
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+        # Filter, search and date links start again from the newest row
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_ordering(self, request, queryset):
+        return ['-pk']
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset if self.cursor is None else self.queryset.filter(pk__lt=self.cursor)
+        # One extra row says whether there is an older page, without counting
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        if len(rows) > self.list_per_page:
+            self.next_cursor = self.result_list[-1].pk
+        self.result_count = paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = paginator
+
+    def newest_url(self):
+        return self.get_query_string() if self.cursor is not None else None
+
+    def older_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}) if self.next_cursor else None
+
+    def date_drilldown(self):
+        """Context for admin/date_hierarchy.html built without scanning the date column."""
+        field = self.date_hierarchy
+        year, month, day = (self.params.get(f'{field}__{part}') for part in ('year', 'month', 'day'))
+
+        def link(filters):
+            return self.get_query_string(filters, [f'{field}__'])
+
+        if year and month and day:
+            chosen = date(int(year), int(month), int(day))
+            return {'show': True,
+                    'back': {'link': link({f'{field}__year': year, f'{field}__month': month}),
+                             'title': capfirst(formats.date_format(chosen, 'YEAR_MONTH_FORMAT'))},
+                    'choices': [{'title': capfirst(formats.date_format(chosen, 'MONTH_DAY_FORMAT'))}]}
+        if year and month:
+            days = calendar.monthrange(int(year), int(month))[1]
+            return {'show': True,
+                    'back': {'link': link({f'{field}__year': year}), 'title': year},
+                    'choices': [
+                        {'link': link({f'{field}__year': year, f'{field}__month': month, f'{field}__day': d}),
+                         'title': capfirst(formats.date_format(date(int(year), int(month), d), 'MONTH_DAY_FORMAT'))}
+                        for d in range(1, days + 1)
+                    ]}
+        if year:
+            return {'show': True,
+                    'back': {'link': link({}), 'title': 'All dates'},
+                    'choices': [
+                        {'link': link({f'{field}__year': year, f'{field}__month': m}),
+                         'title': capfirst(formats.date_format(date(int(year), m, 1), 'YEAR_MONTH_FORMAT'))}
+                        for m in range(1, 13)
+                    ]}
+        # Two index seeks for the range of years
+        first = self.queryset.order_by(field).values_list(field, flat=True).first()
+        last = self.queryset.order_by(f'-{field}').values_list(field, flat=True).first()
+        if first is None:
+            return {'show': False}
+        return {'show': True, 'back': None, 'choices': [
+            {'link': link({f'{field}__year': y}), 'title': str(y)}
+            for y in range(timezone.localtime(first).year, timezone.localtime(last).year + 1)
+        ]}
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Base admin for tables too big for OFFSET pagination and full counts."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    sortable_by = ()
+    change_list_template = 'admin/chat/cursor_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+    def get_actions(self, request):
+        # delete_selected loads and lists every object first; tables here get set-based actions
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+# ==================== FILTERS ====================
+
+class StatusClassFilter(admin.SimpleListFilter):
+    title = 'status'
+    parameter_name = 'status'
+    RANGES = {'2xx': (200, 300), '4xx': (400, 500), '5xx': (500, 600)}
+
+    def lookups(self, request, model_admin):
+        return [('2xx', 'Success'), ('429', 'Rate limited'), ('499', 'Client closed'),
+                ('4xx', 'Other 4xx'), ('5xx', 'Server error')]
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value in self.RANGES:
+            low, high = self.RANGES[value]
+            return queryset.filter(status_code__gte=low, status_code__lt=high)
+        if value in ('429', '499'):
+            return queryset.filter(status_code=int(value))
+        return queryset
+
+
+class RouteFilter(admin.SimpleListFilter):
+    title = 'route'
+    parameter_name = 'route'
+
+    def lookups(self, request, model_admin):
+        return [(tier, tier) for tier in settings.CHAT_ROUTES]
+
+    def queryset(self, request, queryset):
+        return queryset.filter(route=self.value()) if self.value() else queryset
+
+
+# ==================== RATE LIMIT ACTIONS ====================
+
+def _selected_user_ids(queryset):
+    return list(queryset.values_list('pk' if queryset.model is User else 'user_id', flat=True))
+
+
+def _set_configs(user_ids, **fields):
+    """Set ``fields`` on the users' RateLimitConfig rows in one upsert, creating missing rows."""
+    RateLimitConfig.objects.bulk_create(
+        [RateLimitConfig(user_id=pk, **{**RateLimitConfig.DEFAULT_LIMITS, **fields}) for pk in user_ids],
+        update_conflicts=True, unique_fields=['user'], update_fields=[*fields, 'updated_at'],
+    )
+    # Bulk writes send no post_save, so drop the cached limits here (and again after commit)
+    RateLimiter.invalidate_configs(user_ids)
+    transaction.on_commit(lambda: RateLimiter.invalidate_configs(user_ids))
+
+
+@admin.action(description="Reset usage quota (forgive usage so far)")
+def reset_quota(modeladmin, request, queryset):
+    user_ids = _selected_user_ids(queryset)
+    _set_configs(user_ids, quota_reset_at=timezone.now())
+    modeladmin.message_user(request, f"Reset the quota of {len(user_ids)} users.", messages.SUCCESS)
+
+
+@admin.action(description="Mark as premium")
+def make_premium(modeladmin, request, queryset):
+    user_ids = _selected_user_ids(queryset)
+    _set_configs(user_ids, is_premium=True)
+    modeladmin.message_user(request, f"Marked {len(user_ids)} users as premium.", messages.SUCCESS)
+
+
+@admin.action(description="Mark as free tier")
+def make_free(modeladmin, request, queryset):
+    user_ids = _selected_user_ids(queryset)
+    _set_configs(user_ids, is_premium=False)
+    modeladmin.message_user(request, f"Marked {len(user_ids)} users as free tier.", messages.SUCCESS)
+
+
+# ==================== MODEL ADMINS ====================
+
+@admin.register(APIUsageLog)
+class APIUsageLogAdmin(LargeTableAdmin):
+    list_display = ('timestamp', 'user', 'endpoint', 'status_code', 'response_time', 'tokens_used',
+                    'llm_model', 'route', 'fallback')
+    list_select_related = ('user',)
+    list_filter = (StatusClassFilter, RouteFilter, 'fallback')
+    date_hierarchy = 'timestamp'
+    search_fields = ('=user__username',)
+    raw_id_fields = ('user',)
+    actions = ['purge_logs']
+
+    @admin.action(description="Purge selected usage logs", permissions=['delete'])
+    def purge_logs(self, request, queryset):
+        # Nothing references usage logs, so this is a single DELETE
+        deleted, _ = queryset.order_by().delete()
+        self.message_user(request, f"Purged {deleted} usage logs.", messages.SUCCESS)
+
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    list_display = ('id', 'session', 'is_user', 'message_type', 'preview', 'timestamp')
+    list_select_related = ('session',)
+    list_filter = ('is_user',)
+    search_fields = ('=session__session_id',)
+    raw_id_fields = ('session',)
+
+    @admin.display(description='text')
+    def preview(self, obj):
+        return obj.text_content[:80]
+
+
+class ChatSessionTagInline(admin.TabularInline):
+    model = ChatSessionTag
+    raw_id_fields = ('chattag',)
+    extra = 0
+
+
+@admin.register(ChatSession)
+class ChatSessionAdmin(LargeTableAdmin):
+    list_display = ('session_id', 'title', 'user', 'created_at', 'last_activity', 'is_archived')
+    list_select_related = ('user',)
+    list_filter = ('is_archived',)
+    search_fields = ('=session_id', '=user__username')
+    raw_id_fields = ('user',)
+    inlines = [ChatSessionTagInline]
+    actions = ['soft_delete']
+
+    @admin.action(description="Delete selected sessions (queued for reaping)", permissions=['delete'])
+    def soft_delete(self, request, queryset):
+        by_user = {}
+        for session in queryset.order_by().only('pk', 'user_id', 'is_archived'):
+            by_user.setdefault(session.user_id, []).append(session)
+        for user_id, sessions in by_user.items():
+            soft_delete_sessions(user_id, sessions)
+        self.message_user(request, f"Deleted {sum(map(len, by_user.values()))} sessions.", messages.SUCCESS)
+
+
+@admin.register(RateLimitConfig)
+class RateLimitConfigAdmin(admin.ModelAdmin):
+    list_display = ('user', 'is_premium', 'messages_per_hour', 'messages_per_day', 'api_calls_per_minute',
+                    'quota_reset_at', 'updated_at')
+    list_select_related = ('user',)
+    list_filter = ('is_premium',)
+    search_fields = ('=user__username',)
+    raw_id_fields = ('user',)
+    actions = [reset_quota, make_premium, make_free]
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class ChatUserAdmin(UserAdmin):
+    """The stock user admin plus the rate limit actions, for users with or without a config row."""
+    actions = [reset_quota, make_premium, make_free]
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat"
+
+    def ready(self):
+        # Installs the per-connection query timer used by PerformanceMiddleware.
+        from . import perf  # noqa: F401
+        # Cache invalidation for per-user rate-limit configs, shard id ranges after migrate.
+        from . import signals  # noqa: F401
+        # System checks for settings that only fail at runtime.
+        from . import checks  # noqa: F401
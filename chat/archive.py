@@ -0,0 +1,87 @@
+"""
+Cold-session archival.
+
+Sessions inactive for longer than ``CHAT_ARCHIVE_AFTER_DAYS`` have their
+messages packed into a single compressed ``ArchivedSession`` row and removed
+from the hot ``Message`` table (see the ``archive_sessions`` command). The
+session row itself stays, so it is still listed. Opening or continuing an
+archived session moves its messages back with ``rehydrate_session``, under
+their original primary keys so the retrieval index and prompt caches that
+refer to them stay valid.
+"""
+import json
+import zlib
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db import router, transaction
+
+from .models import ArchivedSession, ChatSession, Message, PromptCache
+from .utils import disable_auto_now
+
+MESSAGE_FIELDS = ('id', 'text_content', 'is_user', 'message_type', 'sources', 'timestamp')
+
+
+def _pack(messages):
+    # isoformat() directly: DjangoJSONEncoder would truncate timestamps to milliseconds
+    for message in messages:
+        message['timestamp'] = message['timestamp'].isoformat()
+    return zlib.compress(json.dumps(messages).encode('utf-8'), 9)
+
+
+def _unpack(data):
+    messages = json.loads(zlib.decompress(bytes(data)))
+    for message in messages:
+        message['timestamp'] = datetime.fromisoformat(message['timestamp'])
+    return messages
+
+
+def archive_session(session_pk, cutoff, using=None):
+    """
+    Archive one session if it is still inactive since ``cutoff``.
+    Returns (message_count, packed_bytes), or None if the session was skipped.
+    """
+    using = using or router.db_for_write(ChatSession)
+    with transaction.atomic(using=using):
+        session = (ChatSession.objects.using(using).select_for_update()
+                   .filter(pk=session_pk, is_archived=False, last_activity__lt=cutoff).first())
+        if session is None:
+            return None
+        messages = list(session.messages.order_by('timestamp', 'pk').values(*MESSAGE_FIELDS))
+        data = _pack(messages)
+        ArchivedSession.objects.using(using).create(session=session, data=data, message_count=len(messages))
+        session.messages.all().delete()
+        # update() rather than save(): archiving must not bump last_activity
+        ChatSession.objects.using(using).filter(pk=session.pk).update(is_archived=True)
+    return len(messages), len(data)
+
+
+def archived_messages(session):
+    """Unsaved Message instances for an archived session, without rehydrating it."""
+    using = router.db_for_read(ArchivedSession, instance=session)
+    archive = ArchivedSession.objects.using(using).filter(session=session).first()
+    if archive is None:
+        return []
+    return [Message(session=session, **fields) for fields in _unpack(archive.data)]
+
+
+def rehydrate_session(session):
+    """Move an archived session's messages back into the Message table."""
+    using = router.db_for_write(ChatSession, instance=session)
+    with transaction.atomic(using=using):
+        archive = ArchivedSession.objects.using(using).select_for_update().filter(session=session).first()
+        if archive is not None:
+            messages = [Message(session=session, **fields) for fields in _unpack(archive.data)]
+            legacy = any(message.pk is None for message in messages)
+            with disable_auto_now(Message, 'timestamp'):
+                Message.objects.using(using).bulk_create(messages, batch_size=500)
+            if legacy:
+                # Archived before ids were kept: cached prefixes name messages that are gone
+                PromptCache.objects.using(using).filter(session=session).delete()
+            archive.delete()
+        ChatSession.objects.using(using).filter(pk=session.pk).update(is_archived=False)
+    session.is_archived = False
+    return session
+
+
+arehydrate_session = sync_to_async(rehydrate_session)
@@ -0,0 +1,76 @@
+"""
+Cached ``User`` lookups for authenticated requests.
+
+``CachedAuthenticationMiddleware`` (chat.middleware) and the WebSocket channel
+resolve the session's user here instead of reading ``auth_user`` on every
+request. The user is cached under its id for ``AUTH_USER_CACHE_TTL`` seconds
+and dropped whenever the row is saved or deleted (profile edits, password
+changes, account deletion, admin edits, ``last_login`` on login; see
+chat.signals). A cached user is only used while it is active and the session's
+auth hash matches it; anything else falls back to Django's own lookup, which
+also handles rotated secret keys. The cache is skipped unless it is shared by
+every worker: a per-process copy would keep a deactivated user or revoked
+staff rights alive on the workers that did not save the change.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+from .metrics import CACHE_REQUESTS
+from .utils import shared_cache
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _cache_key(user_id, backend_path):
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS or not shared_cache():
+        return None
+    return user_cache_key(user_id)
+
+
+def _verified(user, session_hash):
+    return user is not None and user.is_active and bool(session_hash) and constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    )
+
+
+def get_user(request):
+    """``django.contrib.auth.get_user`` through the user cache."""
+    session = request.session
+    key = _cache_key(session.get(SESSION_KEY), session.get(BACKEND_SESSION_KEY))
+    if key is None:
+        return auth.get_user(request)
+    user = cache.get(key)
+    if _verified(user, session.get(HASH_SESSION_KEY)):
+        CACHE_REQUESTS.inc(cache='auth_user', result='hit')
+        return user
+    CACHE_REQUESTS.inc(cache='auth_user', result='miss')
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+    return user
+
+
+async def aget_user(request):
+    """Async version of get_user"""
+    session = request.session
+    key = _cache_key(await session.aget(SESSION_KEY), await session.aget(BACKEND_SESSION_KEY))
+    if key is None:
+        return await auth.aget_user(request)
+    user = await cache.aget(key)
+    if _verified(user, await session.aget(HASH_SESSION_KEY)):
+        CACHE_REQUESTS.inc(cache='auth_user', result='hit')
+        return user
+    CACHE_REQUESTS.inc(cache='auth_user', result='miss')
+    user = await auth.aget_user(request)
+    if user.is_authenticated:
+        await cache.aset(key, user, settings.AUTH_USER_CACHE_TTL)
+    return user
+
+
+def invalidate(user_id):
+    cache.delete(user_cache_key(user_id))
@@ -0,0 +1,20 @@
+"""
+System checks for settings combinations that only fail at runtime.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from .utils import shared_cache
+
+
+@register(Tags.caches)
+def check_sharding_cache(app_configs, **kwargs):
+    """move_user_shard switches users by invalidating cached directory entries, which must reach every worker."""
+    if getattr(settings, 'CHAT_SHARDING', False) and not shared_cache():
+        return [Error(
+            "CHAT_SHARDING requires a cache shared by all worker processes.",
+            hint="Set REDIS_URL. With a per-process cache, other workers keep sending a moved "
+                 "user's queries to the old shard.",
+            id='chat.E001',
+        )]
+    return []
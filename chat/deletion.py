@@ -0,0 +1,132 @@
+"""
+Two-phase deletion for accounts and chat sessions.
+
+Requests only soft-delete: the session (or every session of the account) is
+hidden at once, the account is deactivated and renamed, and a ``DeletionJob``
+is queued. The ``reap_deletions`` command then removes the rows in bounded
+batches with raw bulk DELETEs, which skip Django's per-object cascade
+collection and signals, so no single transaction grows with the account size.
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.db.models import CharField, F, Sum, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .models import (
+    APIUsageLog, ArchivedSession, ChatSession, ChatTag, DeletionJob, Message, PromptCache, RateLimitConfig,
+    RetrievalSegment, ShardAssignment,
+)
+from . import stats
+from .sharding import atomic, invalidate_directory, shard_for_user
+
+# Soft-deleted sessions give up their session_id so a client can't collide with it
+DELETED_SESSION_ID = Concat(Value('deleted-'), Cast('pk', CharField()))
+
+
+def soft_delete_session(session):
+    """Hide a session immediately and queue its rows for reaping."""
+    return soft_delete_sessions(session.user_id, [session])[0]
+
+
+def soft_delete_sessions(user_id, sessions):
+    """Hide several of a user's sessions with one UPDATE and queue one job per session."""
+    using = router.db_for_write(ChatSession, instance=sessions[0])
+    live = [s.pk for s in sessions if not s.is_archived]
+    archived = [s.pk for s in sessions if s.is_archived]
+    messages = 0
+    if live:
+        messages += Message.objects.using(using).filter(session_id__in=live).count()
+    if archived:
+        messages += ArchivedSession.objects.using(using).filter(pk__in=archived).aggregate(
+            n=Sum('message_count'))['n'] or 0
+    with atomic(using):
+        updated = ChatSession.all_objects.using(using).filter(
+            pk__in=[s.pk for s in sessions], deleted_at__isnull=True,
+        ).update(deleted_at=timezone.now(), session_id=DELETED_SESSION_ID)
+        jobs = DeletionJob.objects.bulk_create([
+            DeletionJob(kind='session', user_id=user_id, session_pk=s.pk) for s in sessions
+        ])
+    if updated and user_id:
+        stats.record(user_id, sessions=-updated, messages=-messages)
+    return jobs
+
+
+def soft_delete_account(user):
+    """Deactivate and anonymise an account, hide its sessions and queue its rows for reaping."""
+    using = shard_for_user(user.pk)
+    with atomic(using):
+        # Frees the username and email for a new signup straight away
+        user.username = f"deleted-{user.pk}-{get_random_string(8)}"
+        user.email = ''
+        user.first_name = user.last_name = ''
+        user.is_active = False
+        user.set_unusable_password()
+        user.save()
+        ChatSession.all_objects.using(using).filter(user=user, deleted_at__isnull=True).update(
+            deleted_at=timezone.now(), session_id=DELETED_SESSION_ID,
+        )
+        return DeletionJob.objects.create(kind='account', user_id=user.pk)
+
+
+def _delete_steps(job):
+    """(label, model, queryset) in dependency order, so raw deletes never orphan a row."""
+    using = shard_for_user(job.user_id)
+    if job.kind == 'session':
+        sessions = ChatSession.all_objects.using(using).filter(pk=job.session_pk)
+    else:
+        sessions = ChatSession.all_objects.using(using).filter(user_id=job.user_id)
+    through = ChatSession.tags.through
+    steps = [
+        ('messages', Message, Message.objects.using(using).filter(session__in=sessions)),
+        ('session tags', through, through.objects.using(using).filter(chatsession__in=sessions)),
+        ('archives', ArchivedSession, ArchivedSession.objects.using(using).filter(session__in=sessions)),
+        ('prompt caches', PromptCache, PromptCache.objects.using(using).filter(session__in=sessions)),
+        ('sessions', ChatSession, sessions),
+    ]
+    if job.kind == 'account':
+        steps += [
+            ('tag links', through, through.objects.using(using).filter(chattag__user_id=job.user_id)),
+            ('tags', ChatTag, ChatTag.objects.using(using).filter(user_id=job.user_id)),
+            ('retrieval index', RetrievalSegment, RetrievalSegment.objects.using(using).filter(user_id=job.user_id)),
+            ('usage logs', APIUsageLog, APIUsageLog.objects.filter(user_id=job.user_id)),
+        ]
+    return steps
+
+
+def reap(job, batch_size=2000, pause=0.0, progress=None):
+    """
+    Delete a job's rows ``batch_size`` at a time, one short transaction per batch.
+    Progress is saved on the job after every batch, so an interrupted run resumes.
+    Returns the number of rows deleted by this call.
+    """
+    if job.started_at is None:
+        DeletionJob.objects.filter(pk=job.pk).update(started_at=timezone.now())
+    deleted = 0
+    for label, model, queryset in _delete_steps(job):
+        while True:
+            ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with atomic(queryset.db):
+                count = model._base_manager.using(queryset.db).filter(pk__in=ids)._raw_delete(queryset.db)
+                DeletionJob.objects.filter(pk=job.pk).update(rows_deleted=F('rows_deleted') + count)
+            deleted += count
+            if progress:
+                progress(job, label, deleted)
+            if pause:
+                time.sleep(pause)
+
+    # What is left is small and goes through the ORM: the rate-limit config (so its
+    # signals invalidate cached limits) and the user row with its group/admin-log links
+    with transaction.atomic():
+        if job.kind == 'account':
+            RateLimitConfig.objects.filter(user_id=job.user_id).delete()
+            User.objects.filter(pk=job.user_id).delete()
+            ShardAssignment.objects.filter(user_id=job.user_id).delete()
+            invalidate_directory(job.user_id)
+        DeletionJob.objects.filter(pk=job.pk).update(finished_at=timezone.now(), last_error='')
+    return deleted
@@ -0,0 +1,70 @@
+"""
+Custom model fields.
+
+``CompressedTextField`` stores long values compressed (zlib, or zstd when the
+``zstandard`` package is installed) as base64 text behind a short marker, so
+the column stays a plain text column and short values remain searchable in SQL.
+"""
+import base64
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+# Stored values starting with MARKER are compressed; the next character names the codec.
+MARKER = '\x01'
+ZLIB, ZSTD = 'z', 's'
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured("MESSAGE_COMPRESSION = 'zstd' requires the zstandard package")
+    return zstandard
+
+
+def compress_text(value, codec=None, min_length=None):
+    """Encode ``value`` for storage; returns it unchanged when compression doesn't pay off."""
+    codec = codec if codec is not None else settings.MESSAGE_COMPRESSION
+    min_length = min_length if min_length is not None else settings.MESSAGE_COMPRESSION_MIN_LENGTH
+    # Raw text that happens to start with the marker must always be encoded
+    if codec == 'none' or (len(value) < min_length and not value.startswith(MARKER)):
+        return value
+    raw = value.encode('utf-8')
+    if codec == 'zstd':
+        tag, packed = ZSTD, _zstd().ZstdCompressor(level=6).compress(raw)
+    elif codec == 'zlib':
+        tag, packed = ZLIB, zlib.compress(raw, 6)
+    else:
+        raise ImproperlyConfigured(f"Unknown MESSAGE_COMPRESSION codec: {codec!r}")
+    encoded = MARKER + tag + base64.b64encode(packed).decode('ascii')
+    if len(encoded) >= len(value) and not value.startswith(MARKER):
+        return value
+    return encoded
+
+
+def decompress_text(value):
+    """Decode a stored value written by ``compress_text``."""
+    if not value or not value.startswith(MARKER):
+        return value
+    packed = base64.b64decode(value[2:])
+    if value[1] == ZSTD:
+        return _zstd().ZstdDecompressor().decompress(packed).decode('utf-8')
+    return zlib.decompress(packed).decode('utf-8')
+
+
+def is_compressed(value):
+    return bool(value) and value.startswith(MARKER)
+
+
+class CompressedTextField(models.TextField):
+    """A TextField that transparently compresses long values."""
+
+    def from_db_value(self, value, expression, connection):
+        return decompress_text(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        return compress_text(value) if isinstance(value, str) else value
@@ -0,0 +1,102 @@
+"""
+Async HTTP client for the Gemini REST API.
+
+One pooled ``httpx.AsyncClient`` is kept per event loop so keep-alive
+connections to Gemini are reused across requests handled by the same worker.
+"""
+import asyncio
+import json
+import weakref
+
+import httpx
+from django.conf import settings
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """The pooled AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.GEMINI_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.GEMINI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+def model_url(model, method='generateContent'):
+    return f"{settings.GEMINI_API_BASE}/models/{model}:{method}"
+
+
+async def generate_content(model, payload, on_chunk=None):
+    """
+    POST ``payload`` to ``generateContent`` and return the httpx response.
+
+    With ``on_chunk`` the reply is streamed from ``streamGenerateContent``:
+    ``on_chunk`` is awaited with each piece of text as it arrives, and a successful
+    response carries the pieces merged into one ``generateContent`` result.
+    """
+    if on_chunk is None:
+        return await get_client().post(
+            model_url(model),
+            params={'key': settings.GEMINI_API_KEY},
+            json=payload,
+        )
+    async with get_client().stream(
+        'POST',
+        model_url(model, 'streamGenerateContent'),
+        params={'key': settings.GEMINI_API_KEY, 'alt': 'sse'},
+        json=payload,
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response
+        result = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': ''}]}}]}
+        async for line in response.aiter_lines():
+            if not line.startswith('data:'):
+                continue
+            chunk = json.loads(line[5:])
+            text = _merge_chunk(result, chunk)
+            if text:
+                await on_chunk(text)
+    return httpx.Response(200, json=result, request=response.request)
+
+
+def _merge_chunk(result, chunk):
+    """Fold a streamed chunk into ``result``; returns the chunk's text."""
+    candidate = (chunk.get('candidates') or [{}])[0]
+    text = ''.join(part.get('text', '') for part in candidate.get('content', {}).get('parts', []))
+    merged = result['candidates'][0]
+    merged['content']['parts'][0]['text'] += text
+    merged.update((key, value) for key, value in candidate.items() if key != 'content')
+    if 'usageMetadata' in chunk:
+        result['usageMetadata'] = chunk['usageMetadata']
+    return text
+
+
+def cache_url(name='cachedContents'):
+    return f"{settings.GEMINI_API_BASE}/{name}"
+
+
+async def create_cached_content(body):
+    """POST ``body`` to ``cachedContents``; the response holds the new handle's ``name``."""
+    return await get_client().post(cache_url(), params={'key': settings.GEMINI_API_KEY}, json=body)
+
+
+async def update_cached_content(name, ttl):
+    """Give the cached content ``name`` a new TTL of ``ttl`` seconds from now."""
+    return await get_client().patch(
+        cache_url(name),
+        params={'key': settings.GEMINI_API_KEY, 'updateMask': 'ttl'},
+        json={'ttl': f'{ttl}s'},
+    )
+
+
+async def delete_cached_content(name):
+    return await get_client().delete(cache_url(name), params={'key': settings.GEMINI_API_KEY})
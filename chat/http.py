@@ -0,0 +1,42 @@
+"""
+JSON serialisation for API responses.
+
+``JsonResponse`` is a drop-in replacement for Django's. It serialises with
+orjson when that is installed, which is several times faster on large history,
+search and export payloads, and with the stdlib encoder otherwise. Both
+encoders go through ``DjangoJSONEncoder`` for datetimes, decimals and lazy
+strings, so clients see the same values either way; only insignificant
+whitespace differs.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+_encoder = DjangoJSONEncoder()
+
+if orjson is not None:
+    # Datetimes go through DjangoJSONEncoder (millisecond precision, "Z" for UTC) like the stdlib path
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data, indent=False):
+    """``data`` as UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_encoder.default, option=_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+    return json.dumps(data, cls=DjangoJSONEncoder, indent=2 if indent else None).encode('utf-8')
+
+
+class JsonResponse(HttpResponse):
+    """``django.http.JsonResponse`` serialised with ``dumps``."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,483 @@
+"""
+Load-test helpers: synthetic data seeding, a fake Gemini server and a
+concurrent benchmark runner for the API endpoints.
+
+Used by the ``seed_load_data`` and ``benchmark_api`` management commands.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from .models import ChatSession, Message, ChatTag, APIUsageLog, RateLimitConfig
+from . import stats as user_stats
+from .utils import disable_auto_now, percentile
+
+LOAD_TEST_PREFIX = 'loadtest_'
+
+TOPICS = [
+    'refraction', 'myopia control', 'presbyopia', 'contact lens fitting', 'glaucoma screening',
+    'binocular vision', 'retinoscopy', 'keratoconus', 'dry eye clinic', 'low vision aids',
+    'pediatric exams', 'optical retail', 'practice marketing', 'tele-optometry', 'frame styling',
+]
+
+TAG_NAMES = ['Refraction', 'Business', 'Exam Prep', 'Clinical', 'Contact Lenses', 'Pathology', 'Ideas', 'Revision']
+
+WORDS = (
+    'the patient lens cornea retina acuity prism diopter cylinder axis sphere accommodation '
+    'convergence practice clinic revenue margin customer referral screening protocol fitting '
+    'tear film meibomian pressure field fundus optic nerve macula pupil vergence phoria '
+    'market pricing subscription service equipment inventory supplier training evidence study'
+).split()
+
+
+def _sentence(rng, min_words=6, max_words=18):
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return ' '.join(words).capitalize() + '.'
+
+
+def _user_prompt(rng):
+    topic = rng.choice(TOPICS)
+    return f"Can you explain {topic}? {_sentence(rng, 4, 12)}"
+
+
+def _model_reply(rng):
+    paragraphs = []
+    for _ in range(rng.randint(2, 6)):
+        paragraphs.append(' '.join(_sentence(rng) for _ in range(rng.randint(2, 5))))
+    bullets = '\n'.join(f"- **{rng.choice(WORDS).title()}**: {_sentence(rng, 4, 10)}" for _ in range(rng.randint(2, 5)))
+    return '\n\n'.join(paragraphs) + '\n\n' + bullets
+
+
+def clear_load_data(prefix=LOAD_TEST_PREFIX):
+    """Remove every synthetic user (and their data) created with ``prefix``."""
+    users = User.objects.filter(username__startswith=prefix)
+    Message.objects.filter(session__user__in=users).delete()
+    ChatSession.tags.through.objects.filter(chatsession__user__in=users).delete()
+    ChatSession.objects.filter(user__in=users).delete()
+    ChatTag.objects.filter(user__in=users).delete()
+    APIUsageLog.objects.filter(user__in=users).delete()
+    RateLimitConfig.objects.filter(user__in=users).delete()
+    deleted, _ = users.delete()
+    return deleted
+
+
+def seed_load_data(users=100, sessions_per_user=10, messages_per_session=20, tags_per_user=4,
+                   usage_logs_per_user=50, days=90, batch_size=2000, seed=42,
+                   prefix=LOAD_TEST_PREFIX, progress=None):
+    """
+    Generate synthetic users, tags, sessions, messages and usage logs with bulk_create.
+
+    Per-user counts are averages; each user gets a random amount between zero and
+    twice the average so the data has a realistic long tail. Usage logs are kept
+    older than one day so seeded users are never rate limited.
+    Returns a dict of row counts created.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password('loadtest-password')
+    start = User.objects.filter(username__startswith=prefix).count()
+    totals = {'users': 0, 'tags': 0, 'sessions': 0, 'session_tags': 0, 'messages': 0, 'usage_logs': 0}
+    through = ChatSession.tags.through
+
+    def spread(mean):
+        return rng.randint(0, 2 * mean) if mean else 0
+
+    users_per_batch = max(1, batch_size // max(1, sessions_per_user))
+    for offset in range(0, users, users_per_batch):
+        new_users = [
+            User(username=f"{prefix}{start + i}", email=f"{prefix}{start + i}@example.com", password=password)
+            for i in range(offset, min(users, offset + users_per_batch))
+        ]
+        User.objects.bulk_create(new_users, batch_size=batch_size)
+        new_users = list(User.objects.filter(username__in=[u.username for u in new_users]))
+
+        tags = [
+            ChatTag(user=user, name=name, color=f"#{rng.randrange(0x1000000):06x}")
+            for user in new_users
+            for name in rng.sample(TAG_NAMES, min(len(TAG_NAMES), tags_per_user))
+        ]
+        ChatTag.objects.bulk_create(tags, batch_size=batch_size)
+        tags_by_user = {}
+        for tag in ChatTag.objects.filter(user__in=new_users).only('id', 'user_id'):
+            tags_by_user.setdefault(tag.user_id, []).append(tag.id)
+
+        sessions = []
+        for user in new_users:
+            for _ in range(spread(sessions_per_user)):
+                created = now - timedelta(seconds=rng.randint(3600, days * 86400))
+                sessions.append(ChatSession(
+                    user=user,
+                    session_id=str(uuid.uuid4()),
+                    title=_user_prompt(rng)[:50],
+                    created_at=created,
+                    last_activity=created + timedelta(minutes=rng.randint(1, 120)),
+                ))
+        with disable_auto_now(ChatSession, 'created_at', 'last_activity'):
+            ChatSession.objects.bulk_create(sessions, batch_size=batch_size)
+        if any(s.pk is None for s in sessions):
+            ids = dict(ChatSession.objects.filter(user__in=new_users).values_list('session_id', 'pk'))
+            for s in sessions:
+                s.pk = ids[s.session_id]
+
+        links = []
+        for s in sessions:
+            user_tags = tags_by_user.get(s.user_id, [])
+            for tag_id in rng.sample(user_tags, rng.randint(0, min(2, len(user_tags)))):
+                links.append(through(chatsession_id=s.pk, chattag_id=tag_id))
+        through.objects.bulk_create(links, batch_size=batch_size)
+
+        messages = []
+        with disable_auto_now(Message, 'timestamp'):
+            for s in sessions:
+                ts = s.created_at
+                for n in range(spread(messages_per_session)):
+                    ts += timedelta(seconds=rng.randint(5, 90))
+                    is_user = n % 2 == 0
+                    messages.append(Message(
+                        session_id=s.pk,
+                        text_content=_user_prompt(rng) if is_user else _model_reply(rng),
+                        is_user=is_user,
+                        timestamp=ts,
+                    ))
+                if len(messages) >= batch_size:
+                    Message.objects.bulk_create(messages, batch_size=batch_size)
+                    totals['messages'] += len(messages)
+                    messages = []
+            Message.objects.bulk_create(messages, batch_size=batch_size)
+            totals['messages'] += len(messages)
+
+        logs = []
+        with disable_auto_now(APIUsageLog, 'timestamp'):
+            for user in new_users:
+                for _ in range(spread(usage_logs_per_user)):
+                    logs.append(APIUsageLog(
+                        user=user,
+                        endpoint='chat',
+                        timestamp=now - timedelta(seconds=rng.randint(86400 + 60, max(86400 + 61, days * 86400))),
+                        response_time=rng.uniform(0.8, 12.0),
+                        status_code=rng.choices([200, 429, 502, 504], weights=[94, 3, 2, 1])[0],
+                        tokens_used=rng.randint(50, 2048),
+                    ))
+            APIUsageLog.objects.bulk_create(logs, batch_size=batch_size)
+
+        user_stats.rebuild([user.pk for user in new_users], batch_size=batch_size)
+
+        totals['users'] += len(new_users)
+        totals['tags'] += len(tags)
+        totals['sessions'] += len(sessions)
+        totals['session_tags'] += len(links)
+        totals['usage_logs'] += len(logs)
+        if progress:
+            progress(totals)
+
+    return totals
+
+
+# ==================== FAKE GEMINI ====================
+
+class FakeGeminiServer:
+    """
+    Minimal local stand-in for the Gemini REST API.
+
+    Answers ``generateContent`` with a canned reply after ``latency`` seconds and
+    fails a fraction of requests with HTTP 500 when ``error_rate`` is set, and
+    every request for a model in ``failing_models`` with HTTP 503.
+    ``streamGenerateContent`` sends the same reply as server-sent events of
+    ``stream_chunk_words`` words each, spreading ``latency`` over the chunks.
+    Also implements ``cachedContents`` (create, TTL update, delete) with one
+    "token" per word: creating a cache under ``cache_min_tokens`` fails with
+    HTTP 400 and ``caching=False`` answers 404 as for a model without caching.
+    Use as a context manager; ``base_url`` is suitable for ``GEMINI_API_BASE``.
+    """
+
+    def __init__(self, latency=0.05, error_rate=0.0, reply_words=150, host='127.0.0.1', port=0, failing_models=(),
+                 caching=True, cache_min_tokens=0, stream_chunk_words=25):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.failing_models = set(failing_models)
+        self.reply_words = reply_words
+        self.caching = caching
+        self.cache_min_tokens = cache_min_tokens
+        self.stream_chunk_words = stream_chunk_words
+        self.caches = {}
+        self._cache_seq = 0
+        self.requests = []
+        self._rng = random.Random(0)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.respond('POST')
+
+            def do_PATCH(self):
+                self.respond('PATCH')
+
+            def do_DELETE(self):
+                self.respond('DELETE')
+
+            def respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                status, payload = server.handle(self.path, body, method)
+                try:
+                    self.send_response(status)
+                    if isinstance(payload, list):
+                        self.stream(payload)
+                        return
+                    data = json.dumps(payload).encode()
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (timeout or cancelled request)
+                    self.close_connection = True
+
+            def stream(self, chunks):
+                # streamGenerateContent?alt=sse: one event per chunk, as they are "generated"
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for chunk in chunks:
+                    if server.latency:
+                        time.sleep(server.latency / len(chunks))
+                    data = f"data: {json.dumps(chunk)}\r\n\r\n".encode()
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.write(b'0\r\n\r\n')
+
+        return Handler
+
+    @staticmethod
+    def count_tokens(body):
+        contents = body.get('contents', []) + [body.get('systemInstruction') or {}]
+        return sum(len(p.get('text', '').split()) for c in contents for p in c.get('parts', []))
+
+    def handle_cache(self, path, body, method):
+        if not self.caching:
+            return 404, {'error': {'code': 404, 'message': 'Caching not supported', 'status': 'NOT_FOUND'}}
+        with self._lock:
+            if method == 'POST':
+                tokens = self.count_tokens(body)
+                if tokens < self.cache_min_tokens:
+                    return 400, {'error': {'code': 400, 'message': 'Cached content is too small',
+                                           'status': 'INVALID_ARGUMENT'}}
+                self._cache_seq += 1
+                name = f"cachedContents/fake{self._cache_seq}"
+                self.caches[name] = dict(body, name=name, tokens=tokens)
+                return 200, {'name': name, 'model': body.get('model'), 'usageMetadata': {'totalTokenCount': tokens}}
+            name = path.split('?')[0].split('/v1beta/', 1)[-1]
+            if name not in self.caches:
+                return 404, {'error': {'code': 404, 'message': 'Cached content not found', 'status': 'NOT_FOUND'}}
+            if method == 'DELETE':
+                del self.caches[name]
+                return 200, {}
+            self.caches[name]['ttl'] = body.get('ttl')
+            return 200, {'name': name}
+
+    def handle(self, path, body, method='POST'):
+        with self._lock:
+            self.requests.append({'path': path, 'body': body, 'method': method})
+            fail = self._rng.random() < self.error_rate
+        if '/cachedContents' in path:
+            return self.handle_cache(path, body, method)
+        method_name = path.split('?')[0].rsplit(':', 1)[-1]
+        if self.latency and method_name != 'streamGenerateContent':
+            time.sleep(self.latency)
+        if fail:
+            return 500, {'error': {'code': 500, 'message': 'Injected failure', 'status': 'INTERNAL'}}
+        if path.split('?')[0].rsplit('/', 1)[-1].split(':')[0] in self.failing_models:
+            return 503, {'error': {'code': 503, 'message': 'Model overloaded', 'status': 'UNAVAILABLE'}}
+        if method_name not in ('generateContent', 'streamGenerateContent'):
+            return 404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}}
+        cached_tokens = 0
+        if body.get('cachedContent'):
+            cache = self.caches.get(body['cachedContent'])
+            if cache is None:
+                return 403, {'error': {'code': 403, 'message': 'CachedContent not found (or permission denied)',
+                                       'status': 'PERMISSION_DENIED'}}
+            cached_tokens = cache['tokens']
+        text = ' '.join(WORDS[i % len(WORDS)] for i in range(self.reply_words))
+        prompt_tokens = cached_tokens + sum(
+            len(p.get('text', '').split()) for c in body.get('contents', []) for p in c.get('parts', []))
+        usage = {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': self.reply_words,
+            'totalTokenCount': prompt_tokens + self.reply_words,
+        }
+        if cached_tokens:
+            usage['cachedContentTokenCount'] = cached_tokens
+        if method_name == 'streamGenerateContent':
+            words = text.split()
+            starts = range(0, len(words), self.stream_chunk_words)
+            pieces = [(' ' if i else '') + ' '.join(words[i:i + self.stream_chunk_words]) for i in starts]
+            chunks = [{'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]}}]} for piece in pieces]
+            chunks[-1]['candidates'][0]['finishReason'] = 'STOP'
+            chunks[-1]['usageMetadata'] = usage
+            return 200, chunks
+        return 200, {
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+            'usageMetadata': usage,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# ==================== BENCHMARK RUNNER ====================
+
+ENDPOINTS = {
+    'chat': ('post', lambda s: '/api/chat/', lambda s: {'prompt': 'Explain accommodation briefly', 'session_id': s}),
+    'history': ('get', lambda s: f'/api/history/{s}/', None),
+    'sessions': ('get', lambda s: '/api/sessions/', None),
+    'search': ('get', lambda s: '/api/search/?q=lens', None),
+    'usage': ('get', lambda s: '/api/usage/', None),
+    'export_json': ('get', lambda s: f'/api/chat/{s}/export/json/', None),
+    'export_pdf': ('get', lambda s: f'/api/chat/{s}/export/pdf/', None),
+}
+
+
+def summarize(samples, wall_time):
+    """Reduce a list of (latency_s, status, queries) tuples to report numbers."""
+    latencies = sorted(s[0] * 1000 for s in samples)
+    queries = [s[2] for s in samples]
+    errors = sum(1 for s in samples if s[1] >= 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'throughput_rps': round(len(samples) / wall_time, 2) if wall_time else 0.0,
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'queries_max': max(queries) if queries else 0,
+    }
+
+
+class BenchmarkRunner:
+    """
+    Drive the API endpoints in-process with Django's test client from a pool of
+    threads, one logged-in synthetic user per thread.
+    """
+
+    def __init__(self, concurrency=8, requests_per_endpoint=200, prefix=LOAD_TEST_PREFIX, seed=0):
+        self.concurrency = concurrency
+        self.requests_per_endpoint = requests_per_endpoint
+        self.prefix = prefix
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next = 0
+        self.workload = []
+
+    def prepare(self):
+        """Pick one seeded user per worker and cache their session ids."""
+        users = list(
+            User.objects.filter(username__startswith=self.prefix, chat_sessions__isnull=False)
+            .distinct().order_by('?')[:self.concurrency]
+        )
+        if not users:
+            raise ValueError(f"No seeded users with sessions found (prefix '{self.prefix}'). Run seed_load_data first.")
+        for user in users:
+            RateLimitConfig.objects.update_or_create(user=user, defaults={
+                'messages_per_hour': 10 ** 6, 'messages_per_day': 10 ** 6, 'api_calls_per_minute': 10 ** 6,
+            })
+        self.workload = [
+            (user, list(ChatSession.objects.filter(user=user).values_list('session_id', flat=True)))
+            for user in users
+        ]
+        return self.workload
+
+    def _worker(self, endpoint, remaining, samples):
+        from django.test import Client
+
+        with self._lock:
+            user, session_ids = self.workload[self._next % len(self.workload)]
+            self._next += 1
+        client = Client()
+        client.force_login(user)
+        method, url, body = ENDPOINTS[endpoint]
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            while True:
+                with self._lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                    session_id = self._rng.choice(session_ids)
+                queries[0] = 0
+                with connection.execute_wrapper(count):
+                    start = time.perf_counter()
+                    if method == 'post':
+                        response = client.post(url(session_id), json.dumps(body(session_id)),
+                                               content_type='application/json')
+                    else:
+                        response = client.get(url(session_id))
+                    elapsed = time.perf_counter() - start
+                with self._lock:
+                    samples.append((elapsed, response.status_code, queries[0]))
+        finally:
+            connection.close()
+
+    def run_endpoint(self, endpoint):
+        self._next = 0
+        remaining, samples = [self.requests_per_endpoint], []
+        threads = [
+            threading.Thread(target=self._worker, args=(endpoint, remaining, samples), name=f'bench-{i}')
+            for i in range(self.concurrency)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(samples, time.perf_counter() - start)
+
+    def run(self, endpoints, progress=None):
+        results = {}
+        for endpoint in endpoints:
+            results[endpoint] = self.run_endpoint(endpoint)
+            if progress:
+                progress(endpoint, results[endpoint])
+        return results
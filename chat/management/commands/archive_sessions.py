@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.archive import archive_session
+from chat.models import ChatSession
+from chat.sharding import chat_databases
+
+
+class Command(BaseCommand):
+    help = (
+        "Move sessions inactive for more than --days into ArchivedSession (one compressed blob each). "
+        "Each session is archived in its own transaction, so the command can be stopped and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+                            help="Archive sessions idle for longer than this")
+        parser.add_argument('--batch-size', type=int, default=200, help="Candidate sessions fetched per batch")
+        parser.add_argument('--limit', type=int, help="Stop after archiving this many sessions")
+        parser.add_argument('--start-id', type=int, default=0, help="Resume after this session id")
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count candidate sessions")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        if options['dry_run']:
+            count = sum(self._candidates(alias, cutoff).count() for alias in chat_databases())
+            self.stdout.write(f"{count} sessions idle since {cutoff:%Y-%m-%d %H:%M} would be archived")
+            return
+
+        totals = [0, 0, 0]
+        start = time.perf_counter()
+        for alias in chat_databases():
+            last_id = self._archive(alias, cutoff, totals, options)
+        archived, messages, packed_bytes = totals
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} sessions ({messages} messages, {packed_bytes / 1024:.0f} KiB packed) "
+            f"in {elapsed:.1f}s; last id {last_id}"
+        ))
+
+    @staticmethod
+    def _candidates(alias, cutoff):
+        return ChatSession.objects.using(alias).filter(is_archived=False, last_activity__lt=cutoff).order_by('pk')
+
+    def _archive(self, alias, cutoff, totals, options):
+        """Archive candidates on one database; ``totals`` is [sessions, messages, bytes] across databases."""
+        candidates = self._candidates(alias, cutoff)
+        last_id = options['start_id']
+        while options['limit'] is None or totals[0] < options['limit']:
+            batch = list(candidates.filter(pk__gt=last_id).values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            for pk in batch:
+                result = archive_session(pk, cutoff, using=alias)
+                last_id = pk
+                if result is not None:
+                    totals[0] += 1
+                    totals[1] += result[0]
+                    totals[2] += result[1]
+                if options['limit'] is not None and totals[0] >= options['limit']:
+                    break
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {alias} up to id {last_id}: {totals[0]} sessions, {totals[1]} messages")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        return last_id
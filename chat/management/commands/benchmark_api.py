@@ -0,0 +1,101 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from chat.loadtest import ENDPOINTS, LOAD_TEST_PREFIX, BenchmarkRunner, FakeGeminiServer
+
+COLUMNS = ['requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_mean', 'queries_max']
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API endpoints against seeded data and a local fake Gemini server. "
+        "Reports p50/p95/p99 latency, throughput and DB query counts per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"Comma-separated endpoints ({', '.join(ENDPOINTS)})")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent client threads")
+        parser.add_argument('--gemini-latency-ms', type=float, default=50, help="Fake Gemini response delay")
+        parser.add_argument('--gemini-error-rate', type=float, default=0.0, help="Fraction of failed Gemini calls")
+        parser.add_argument('--prefix', default=LOAD_TEST_PREFIX, help="Username prefix of seeded users")
+        parser.add_argument('--json', dest='json_path', help="Write results as JSON to this path")
+        parser.add_argument('--compare', help="Compare against a previous --json result file")
+
+    def handle(self, *args, **options):
+        endpoints = [e.strip() for e in options['endpoints'].split(',') if e.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        runner = BenchmarkRunner(
+            concurrency=options['concurrency'],
+            requests_per_endpoint=options['requests'],
+            prefix=options['prefix'],
+        )
+        try:
+            runner.prepare()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"Benchmarking {len(endpoints)} endpoints, {options['requests']} requests each, "
+            f"concurrency {options['concurrency']} on {connection.vendor}"
+        )
+        self.stdout.write(self._row(['endpoint'] + COLUMNS))
+
+        fake = FakeGeminiServer(
+            latency=options['gemini_latency_ms'] / 1000.0,
+            error_rate=options['gemini_error_rate'],
+        )
+        with fake, override_settings(GEMINI_API_BASE=fake.base_url, GEMINI_API_KEY='fake-key'):
+            results = runner.run(
+                endpoints,
+                progress=lambda name, r: self.stdout.write(self._row([name] + [r[c] for c in COLUMNS])),
+            )
+
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'concurrency': options['concurrency'],
+            'requests_per_endpoint': options['requests'],
+            'gemini_latency_ms': options['gemini_latency_ms'],
+            'endpoints': results,
+        }
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _row(self, values):
+        return '  '.join(f"{v:>14}" if i else f"{v:<12}" for i, v in enumerate(values))
+
+    def _compare(self, path, results):
+        with open(path) as fh:
+            previous = json.load(fh)['endpoints']
+        self.stdout.write(f"\nChange vs {path}:")
+        self.stdout.write(self._row(['endpoint', 'p50', 'p95', 'p99', 'rps', 'queries']))
+        for name, current in results.items():
+            before = previous.get(name)
+            if not before:
+                continue
+            deltas = [
+                self._delta(before[key], current[key])
+                for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_mean')
+            ]
+            self.stdout.write(self._row([name] + deltas))
+
+    @staticmethod
+    def _delta(before, after):
+        if not before:
+            return 'n/a'
+        return f"{(after - before) / before * 100:+.1f}%"
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+
+from chat.loadtest import LOAD_TEST_PREFIX, FakeGeminiServer
+from chat.utils import percentile
+from chat.models import ChatSession, RateLimitConfig
+
+PROFILES = {
+    'wsgi': ['gunicorn', 'nicole_project.wsgi:application', '--worker-class', 'sync'],
+    'asgi': ['gunicorn', 'nicole_project.asgi:application', '-c', 'gunicorn.conf.py'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent chat capacity of the sync (WSGI) and async (ASGI) server profiles. "
+        "Starts each profile under gunicorn against a slow local fake Gemini server and fires "
+        "a burst of concurrent chat requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='wsgi,asgi', help="Comma-separated profiles to run")
+        parser.add_argument('--concurrency', type=int, default=50, help="Concurrent chat requests")
+        parser.add_argument('--workers', type=int, default=2, help="Gunicorn workers per profile")
+        parser.add_argument('--gemini-latency-ms', type=float, default=2000, help="Fake Gemini response delay")
+        parser.add_argument('--timeout', type=float, default=120, help="Client timeout per request")
+        parser.add_argument('--prefix', default=LOAD_TEST_PREFIX, help="Username prefix of seeded users")
+        parser.add_argument('--json', dest='json_path', help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        profiles = [p.strip() for p in options['profiles'].split(',') if p.strip()]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        cookies = self._login_cookies(options['concurrency'], options['prefix'])
+        results = {}
+        with FakeGeminiServer(latency=options['gemini_latency_ms'] / 1000.0) as fake:
+            for profile in profiles:
+                port = _free_port()
+                server = self._start_server(profile, port, options['workers'], fake.base_url)
+                try:
+                    self._wait_ready(port, server)
+                    results[profile] = asyncio.run(
+                        self._burst(port, cookies, options['timeout'])
+                    )
+                finally:
+                    server.terminate()
+                    server.wait(timeout=30)
+                r = results[profile]
+                self.stdout.write(
+                    f"{profile}: {r['completed']}/{r['requests']} ok in {r['wall_s']}s "
+                    f"-> {r['throughput_rps']} req/s, p50 {r['p50_ms']}ms, p95 {r['p95_ms']}ms, "
+                    f"errors {r['errors']}"
+                )
+
+        if 'wsgi' in results and 'asgi' in results and results['wsgi']['throughput_rps']:
+            gain = results['asgi']['throughput_rps'] / results['wsgi']['throughput_rps']
+            self.stdout.write(self.style.SUCCESS(f"ASGI serves {gain:.1f}x the concurrent chat throughput"))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump({'options': {k: options[k] for k in ('concurrency', 'workers', 'gemini_latency_ms')},
+                           'profiles': results}, fh, indent=2)
+
+    def _login_cookies(self, count, prefix):
+        """Create authenticated sessions for seeded users; one user per concurrent request."""
+        users = list(User.objects.filter(username__startswith=prefix).order_by('id')[:count])
+        if not users:
+            raise CommandError(f"No seeded users found (prefix '{prefix}'). Run seed_load_data first.")
+        cookies = []
+        for i in range(count):
+            user = users[i % len(users)]
+            RateLimitConfig.objects.update_or_create(user=user, defaults={
+                'messages_per_hour': 10 ** 6, 'messages_per_day': 10 ** 6, 'api_calls_per_minute': 10 ** 6,
+            })
+            store = SessionStore()
+            store[SESSION_KEY] = str(user.pk)
+            store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            store.create()
+            session = ChatSession.objects.filter(user=user).values_list('session_id', flat=True).first()
+            cookies.append((store.session_key, session or ''))
+        return cookies
+
+    def _start_server(self, profile, port, workers, gemini_base):
+        env = dict(
+            os.environ,
+            GEMINI_API_BASE=gemini_base,
+            GEMINI_API_KEY='fake-key',
+            PERF_LOG_REQUESTS='False',
+            PORT=str(port),
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'nicole_project.settings'),
+        )
+        cmd = [sys.executable, '-m'] + PROFILES[profile] + [
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--timeout', '300', '--access-logfile', os.devnull,
+        ]
+        return subprocess.Popen(cmd, cwd=settings.BASE_DIR, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @staticmethod
+    def _wait_ready(port, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited with code {server.returncode}")
+            try:
+                if httpx.get(f'http://127.0.0.1:{port}/login/', timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise CommandError("Server did not become ready")
+
+    @staticmethod
+    async def _burst(port, cookies, timeout):
+        limits = httpx.Limits(max_connections=len(cookies) + 1)
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=timeout, limits=limits) as client:
+            async def one(session_key, session_id):
+                csrf = get_random_string(32)
+                start = time.perf_counter()
+                try:
+                    response = await client.post(
+                        '/api/chat/',
+                        json={'prompt': 'Explain accommodation briefly', 'session_id': session_id},
+                        headers={'X-CSRFToken': csrf, 'Cookie': f'sessionid={session_key}; csrftoken={csrf}'},
+                    )
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 599
+                return time.perf_counter() - start, status
+
+            start = time.perf_counter()
+            samples = await asyncio.gather(*(one(*c) for c in cookies))
+            wall = time.perf_counter() - start
+
+        latencies = sorted(s[0] * 1000 for s in samples)
+        completed = sum(1 for s in samples if s[1] == 200)
+        return {
+            'requests': len(samples),
+            'completed': completed,
+            'errors': len(samples) - completed,
+            'wall_s': round(wall, 2),
+            'throughput_rps': round(completed / wall, 2) if wall else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+        }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
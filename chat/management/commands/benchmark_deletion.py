@@ -0,0 +1,102 @@
+import json
+import random
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.deletion import reap, soft_delete_account
+from chat.loadtest import _model_reply, _user_prompt
+from chat.models import APIUsageLog, ChatSession, ChatTag, Message
+
+PREFIX = 'deletebench_'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare deleting a heavy account in-request (user.delete() cascade) with soft delete "
+        "plus the batched reaper. Creates throwaway '{}*' users.".format(PREFIX)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100000, help="Messages owned by the account")
+        parser.add_argument('--per-session', type=int, default=50, help="Messages per session")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Reaper rows per batch")
+        parser.add_argument('--skip-cascade', action='store_true', help="Only measure soft delete + reaper")
+        parser.add_argument('--json', dest='json_path', help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        results = {}
+        if not options['skip_cascade']:
+            user, rows = self._seed(options['messages'], options['per_session'])
+            start = time.perf_counter()
+            with transaction.atomic():
+                user.delete()
+            cascade_s = time.perf_counter() - start
+            results['cascade'] = {'rows': rows, 'request_s': round(cascade_s, 3),
+                                  'longest_transaction_s': round(cascade_s, 3)}
+            self.stdout.write(f"cascade: user.delete() of {rows} rows took {cascade_s:.2f}s in one transaction")
+
+        user, rows = self._seed(options['messages'], options['per_session'])
+        start = time.perf_counter()
+        job = soft_delete_account(user)
+        request_s = time.perf_counter() - start
+
+        batch_times = []
+        last = [time.perf_counter()]
+
+        def progress(job, label, deleted):
+            now = time.perf_counter()
+            batch_times.append(now - last[0])
+            last[0] = now
+
+        start = time.perf_counter()
+        deleted = reap(job, batch_size=options['batch_size'], progress=progress)
+        reap_s = time.perf_counter() - start
+        results['soft_delete'] = {
+            'rows': rows,
+            'request_s': round(request_s, 4),
+            'reap_s': round(reap_s, 3),
+            'rows_per_s': round(deleted / reap_s) if reap_s else 0,
+            'batches': len(batch_times),
+            'longest_transaction_s': round(max(batch_times, default=0), 4),
+        }
+        r = results['soft_delete']
+        self.stdout.write(
+            f"soft delete: request {r['request_s'] * 1000:.1f}ms; reaper removed {deleted} rows in "
+            f"{r['reap_s']:.2f}s ({r['rows_per_s']} rows/s, {r['batches']} batches, "
+            f"longest {r['longest_transaction_s'] * 1000:.0f}ms)"
+        )
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+    def _seed(self, messages, per_session):
+        """One account with ``messages`` messages, tags, tag links and usage logs."""
+        user = User.objects.create_user(f"{PREFIX}{uuid.uuid4().hex[:8]}", password=None)
+        tags = ChatTag.objects.bulk_create([ChatTag(user=user, name=f"Tag {i}") for i in range(5)])
+        ChatSession.objects.bulk_create([
+            ChatSession(user=user, session_id=str(uuid.uuid4()), title=f"Session {i}")
+            for i in range(max(1, messages // per_session))
+        ])
+        sessions = list(ChatSession.objects.filter(user=user))
+        through = ChatSession.tags.through
+        through.objects.bulk_create([
+            through(chatsession_id=s.pk, chattag_id=tags[i % len(tags)].pk) for i, s in enumerate(sessions)
+        ])
+        rng = random.Random(0)
+        replies = [_model_reply(rng) for _ in range(50)]
+        prompts = [_user_prompt(rng) for _ in range(50)]
+        batch = []
+        for n in range(messages):
+            is_user = n % 2 == 0
+            batch.append(Message(session_id=sessions[n % len(sessions)].pk, is_user=is_user,
+                                 text_content=(prompts if is_user else replies)[n % 50]))
+            if len(batch) == 5000:
+                Message.objects.bulk_create(batch)
+                batch = []
+        Message.objects.bulk_create(batch)
+        logs = APIUsageLog.objects.bulk_create([APIUsageLog(user=user, endpoint='chat') for _ in range(messages // 2)])
+        return user, messages + len(sessions) * 2 + len(tags) + len(logs) + 1
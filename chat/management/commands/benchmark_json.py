@@ -0,0 +1,101 @@
+import gzip
+import json
+import random
+import time
+from datetime import timedelta
+
+import brotli
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse as StdlibJsonResponse
+from django.utils import timezone
+
+from chat import http
+from chat.loadtest import _model_reply, _user_prompt
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark JSON serialisation and compression for get_chat_history and "
+        "export_chat_json payloads of several sizes: the stdlib encoder against chat.http "
+        f"({'orjson' if http.orjson else 'stdlib fallback'} here), and gzip against brotli."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000,5000', help="Comma-separated messages per payload")
+        parser.add_argument('--min-time', type=float, default=0.2, help="Seconds each measurement runs for")
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        self.min_time = options['min_time']
+        self.stdout.write(
+            f"{'payload':8s} {'msgs':>6s} {'bytes':>9s} {'stdlib ms':>10s} {'fast ms':>8s} {'speedup':>8s} "
+            f"{'gzip B':>8s} {'gzip ms':>8s} {'br B':>8s} {'br ms':>7s}"
+        )
+        for size in sizes:
+            history, export = self._payloads(size)
+            self._row('history', size,
+                      lambda: StdlibJsonResponse(history).content,
+                      lambda: http.JsonResponse(history).content)
+            self._row('export', size,
+                      lambda: json.dumps(export, indent=2).encode('utf-8'),
+                      lambda: http.dumps(export, indent=True))
+
+    def _row(self, name, size, stdlib, fast):
+        content = fast()
+        stdlib_ms, fast_ms = self._time(stdlib), self._time(fast)
+        gzip_ms = self._time(lambda: gzip.compress(content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0))
+        br_ms = self._time(lambda: brotli.compress(content, quality=settings.RESPONSE_BROTLI_QUALITY))
+        gzip_bytes = len(gzip.compress(content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0))
+        br_bytes = len(brotli.compress(content, quality=settings.RESPONSE_BROTLI_QUALITY))
+        self.stdout.write(
+            f"{name:8s} {size:6d} {len(content):9d} {stdlib_ms:10.3f} {fast_ms:8.3f} {stdlib_ms / fast_ms:7.1f}x "
+            f"{gzip_bytes:8d} {gzip_ms:8.3f} {br_bytes:8d} {br_ms:7.3f}"
+        )
+
+    def _time(self, fn):
+        """Mean milliseconds per call, repeating until ``min_time`` has passed."""
+        calls, start = 0, time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.min_time:
+                return elapsed * 1000 / calls
+
+    @staticmethod
+    def _payloads(size):
+        """The get_chat_history and export_chat_json bodies for a session of ``size`` messages."""
+        rng = random.Random(size)
+        start = timezone.now() - timedelta(days=30)
+        messages = [
+            {
+                'text_content': _user_prompt(rng) if i % 2 == 0 else _model_reply(rng),
+                'is_user': i % 2 == 0,
+                'message_type': 'text',
+                'sources': [],
+                'timestamp': start + timedelta(minutes=i),
+            }
+            for i in range(size)
+        ]
+        history = {'history': [
+            {'text': m['text_content'], 'isUser': m['is_user'], 'type': m['message_type'], 'sources': m['sources']}
+            for m in messages
+        ]}
+        export = {
+            'session_id': 'benchmark',
+            'title': 'Benchmark chat',
+            'created_at': start.isoformat(),
+            'last_activity': messages[-1]['timestamp'].isoformat() if messages else start.isoformat(),
+            'user': 'benchmark',
+            'messages': [
+                {
+                    'sender': 'user' if m['is_user'] else 'nicole',
+                    'text': m['text_content'],
+                    'timestamp': m['timestamp'].isoformat(),
+                    'type': m['message_type'],
+                }
+                for m in messages
+            ],
+        }
+        return history, export
@@ -0,0 +1,160 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.utils import percentile
+
+PROFILES = {
+    'default': {'SQLITE_TUNING': 'False', 'SQLITE_WRITE_QUEUE': 'False'},
+    'tuned': {'SQLITE_TUNING': 'True', 'SQLITE_WRITE_QUEUE': 'False'},
+    'tuned+queue': {'SQLITE_TUNING': 'True', 'SQLITE_WRITE_QUEUE': 'True'},
+}
+
+# Runs in each worker process against the benchmark database. Every thread
+# repeats the write pattern of one chat turn: user message, history read,
+# model reply, usage log.
+WORKER = r'''
+import json, os, sys, threading, time
+import django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nicole_project.settings")
+django.setup()
+from django.db import OperationalError, connection, close_old_connections
+from django.core.management import call_command
+from chat.models import APIUsageLog, ChatSession, Message
+from chat.sqlite import insert
+
+mode = sys.argv[1]
+if mode == "setup":
+    call_command("migrate", verbosity=0)
+    from django.contrib.auth.models import User
+    user = User.objects.create_user("sqlitebench")
+    ChatSession.objects.bulk_create([ChatSession(user=user, session_id=f"bench-{i}") for i in range(int(sys.argv[2]))])
+    sys.exit(0)
+
+worker, threads, duration = int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4])
+results = {"ok": 0, "locked": 0, "errors": 0, "latencies": []}
+lock = threading.Lock()
+
+def run(index):
+    session = ChatSession.objects.get(session_id=f"bench-{worker * threads + index}")
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            insert(Message, session=session, text_content="How does accommodation work?", is_user=True)
+            list(Message.objects.filter(session=session).order_by("-timestamp").values_list("text_content", flat=True)[:20])
+            insert(Message, session=session, text_content="Accommodation is the eye's focusing response. " * 20)
+            insert(APIUsageLog, user_id=session.user_id, endpoint="chat", response_time=0.5)
+            outcome = "ok"
+        except OperationalError as e:
+            outcome = "locked" if "locked" in str(e) else "errors"
+        elapsed = time.perf_counter() - start
+        with lock:
+            results[outcome] += 1
+            if outcome == "ok":
+                results["latencies"].append(elapsed * 1000)
+    close_old_connections()
+    connection.close()
+
+pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+for t in pool: t.start()
+for t in pool: t.join()
+print(json.dumps(results))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent chat-write throughput and 'database is locked' errors on SQLite for the "
+        "default configuration, the tuned pragmas and the tuned pragmas plus the writer queue. "
+        "Uses throwaway database files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default=','.join(PROFILES), help="Comma-separated profiles to run")
+        parser.add_argument('--processes', type=int, default=4, help="Worker processes (gunicorn workers)")
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent requests per process")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per profile")
+        parser.add_argument('--busy-timeout', type=int, default=5, help="SQLite busy timeout in seconds")
+        parser.add_argument('--json', dest='json_path', help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        profiles = [p.strip() for p in options['profiles'].split(',') if p.strip()]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        workdir = tempfile.mkdtemp(prefix='nicole-sqlite-bench-')
+        template = os.path.join(workdir, 'template.sqlite3')
+        results = {}
+        try:
+            self._run_worker(template, PROFILES['default'], options, 'setup',
+                             str(options['processes'] * options['threads'])).check_returncode()
+            for profile in profiles:
+                path = os.path.join(workdir, f"{profile.replace('+', '-')}.sqlite3")
+                shutil.copy(template, path)
+                workers = [
+                    self._start_worker(path, PROFILES[profile], options, 'work', str(i), str(options['threads']),
+                                       str(options['duration']))
+                    for i in range(options['processes'])
+                ]
+                totals = {'ok': 0, 'locked': 0, 'errors': 0, 'latencies': []}
+                for worker in workers:
+                    out, err = worker.communicate()
+                    if worker.returncode != 0:
+                        raise CommandError(f"Worker failed:\n{err[-2000:]}")
+                    data = json.loads(out.strip().splitlines()[-1])
+                    for key in totals:
+                        totals[key] += data[key]
+                results[profile] = self._summarize(totals, options['duration'])
+                r = results[profile]
+                self.stdout.write(
+                    f"{profile:12s} {r['turns_per_s']:8.1f} chat turns/s  locked {r['locked_rate']:6.2%}  "
+                    f"errors {r['errors']}  p50 {r['p50_ms']:.1f}ms  p95 {r['p95_ms']:.1f}ms"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump({'options': {k: options[k] for k in ('processes', 'threads', 'duration')},
+                           'profiles': results}, fh, indent=2)
+
+    def _env(self, path, profile_env, options):
+        return dict(
+            os.environ, **profile_env,
+            DATABASE_URL=f"sqlite:///{path}",
+            SQLITE_BUSY_TIMEOUT=str(options['busy_timeout']),
+            PERF_LOG_REQUESTS='False',
+            METRICS_DIR='',
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'nicole_project.settings'),
+        )
+
+    def _run_worker(self, path, profile_env, options, *argv):
+        return subprocess.run([sys.executable, '-c', WORKER, *argv], cwd=settings.BASE_DIR,
+                              env=self._env(path, profile_env, options), capture_output=True, text=True)
+
+    def _start_worker(self, path, profile_env, options, *argv):
+        return subprocess.Popen([sys.executable, '-c', WORKER, *argv], cwd=settings.BASE_DIR,
+                                env=self._env(path, profile_env, options),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    @staticmethod
+    def _summarize(totals, duration):
+        attempts = totals['ok'] + totals['locked'] + totals['errors']
+        latencies = sorted(totals['latencies'])
+        return {
+            'turns': totals['ok'],
+            'locked': totals['locked'],
+            'errors': totals['errors'],
+            'locked_rate': totals['locked'] / attempts if attempts else 0.0,
+            'turns_per_s': round(totals['ok'] / duration, 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+        }
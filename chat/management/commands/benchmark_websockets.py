@@ -0,0 +1,153 @@
+import asyncio
+import json
+import resource
+import time
+
+from django.core.management.base import CommandError
+from websockets.asyncio.client import connect
+from websockets.protocol import State
+
+from chat.loadtest import LOAD_TEST_PREFIX, FakeGeminiServer
+from chat.utils import percentile
+
+from .benchmark_concurrency import Command as ConcurrencyCommand, _free_port
+
+
+class Command(ConcurrencyCommand):
+    help = (
+        "Soak-test the /ws/chat/ WebSocket channel on one ASGI worker. Holds many idle "
+        "connections to measure worker memory per connection, then streams chat turns "
+        "from a local fake Gemini server while they stay open and reports time to the "
+        "first chunk against time to the full reply."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle', type=int, default=1000, help="Idle connections to hold open")
+        parser.add_argument('--active', type=int, default=50, help="Concurrent streamed chat turns")
+        parser.add_argument('--hold', type=float, default=10, help="Seconds to hold the idle connections before measuring")
+        parser.add_argument('--gemini-latency-ms', type=float, default=2000,
+                            help="Fake Gemini generation time, spread over the streamed chunks")
+        parser.add_argument('--timeout', type=float, default=120, help="Client timeout per connection or turn")
+        parser.add_argument('--prefix', default=LOAD_TEST_PREFIX, help="Username prefix of seeded users")
+        parser.add_argument('--json', dest='json_path', help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        _raise_file_limit(options['idle'] + options['active'] + 100)
+        cookies = self._login_cookies(options['active'], options['prefix'])
+        with FakeGeminiServer(latency=options['gemini_latency_ms'] / 1000.0, stream_chunk_words=10) as fake:
+            port = _free_port()
+            server = self._start_server('asgi', port, 1, fake.base_url)
+            try:
+                self._wait_ready(port, server)
+                worker = _worker_pid(server.pid)
+                result = asyncio.run(self._soak(port, worker, cookies, options))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+        r = result
+        self.stdout.write(
+            f"idle: {r['idle_open']}/{r['idle']} connections open after {r['hold_s']}s "
+            f"(opened in {r['connect_s']}s), worker RSS {r['rss_before_kb'] // 1024} -> "
+            f"{r['rss_idle_kb'] // 1024} MiB = {r['kb_per_connection']} KiB per connection"
+        )
+        self.stdout.write(
+            f"active: {r['completed']}/{r['turns']} streamed turns ok, first chunk p50 {r['first_chunk_p50_ms']}ms "
+            f"p95 {r['first_chunk_p95_ms']}ms, full reply p50 {r['reply_p50_ms']}ms p95 {r['reply_p95_ms']}ms, "
+            f"idle connections still open {r['idle_open_after']}/{r['idle']}"
+        )
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump({'options': {k: options[k] for k in ('idle', 'active', 'hold', 'gemini_latency_ms')},
+                           'results': result}, fh, indent=2)
+
+    async def _soak(self, port, worker, cookies, options):
+        url = f'ws://127.0.0.1:{port}/ws/chat/'
+        origin = f'http://127.0.0.1:{port}'
+        timeout = options['timeout']
+
+        async def open_socket(session_key):
+            socket = await connect(url, origin=origin, additional_headers={'Cookie': f'sessionid={session_key}'},
+                                   open_timeout=timeout)
+            hello = json.loads(await socket.recv())
+            if hello['type'] != 'hello':
+                raise CommandError(f"Unexpected first message: {hello}")
+            return socket
+
+        rss_before = _rss_kb(worker)
+        start = time.perf_counter()
+        idle = []
+        # In batches, to stay inside the listen backlog
+        for i in range(0, options['idle'], 200):
+            count = min(200, options['idle'] - i)
+            idle += await asyncio.gather(*(open_socket(cookies[(i + j) % len(cookies)][0]) for j in range(count)))
+        connect_s = time.perf_counter() - start
+        await asyncio.sleep(options['hold'])
+        rss_idle = _rss_kb(worker)
+        idle_open = sum(socket.state is State.OPEN for socket in idle)
+
+        async def turn(session_key, session_id):
+            socket = await open_socket(session_key)
+            try:
+                start = time.perf_counter()
+                first = None
+                await socket.send(json.dumps({'type': 'chat.send', 'ref': '1', 'session_id': session_id,
+                                              'prompt': 'Explain accommodation briefly'}))
+                while True:
+                    message = json.loads(await asyncio.wait_for(socket.recv(), timeout))
+                    if message['type'] == 'chat.chunk' and first is None:
+                        first = time.perf_counter() - start
+                    elif message['type'] in ('chat.done', 'chat.error'):
+                        return first, time.perf_counter() - start, message['type'] == 'chat.done'
+            finally:
+                await socket.close()
+
+        samples = await asyncio.gather(*(turn(*c) for c in cookies))
+        idle_open_after = sum(socket.state is State.OPEN for socket in idle)
+        await asyncio.gather(*(socket.close() for socket in idle))
+
+        ok = [s for s in samples if s[2] and s[0] is not None]
+        first_chunk = sorted(s[0] * 1000 for s in ok)
+        reply = sorted(s[1] * 1000 for s in ok)
+        return {
+            'idle': len(idle),
+            'idle_open': idle_open,
+            'connect_s': round(connect_s, 2),
+            'hold_s': options['hold'],
+            'rss_before_kb': rss_before,
+            'rss_idle_kb': rss_idle,
+            'kb_per_connection': round((rss_idle - rss_before) / max(len(idle), 1), 1),
+            'turns': len(samples),
+            'completed': len(ok),
+            'first_chunk_p50_ms': round(percentile(first_chunk, 50), 1),
+            'first_chunk_p95_ms': round(percentile(first_chunk, 95), 1),
+            'reply_p50_ms': round(percentile(reply, 50), 1),
+            'reply_p95_ms': round(percentile(reply, 95), 1),
+            'idle_open_after': idle_open_after,
+        }
+
+
+def _raise_file_limit(needed):
+    """Each connection is a file descriptor on both ends; the server inherits this limit."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+def _worker_pid(master_pid, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as fh:
+            children = fh.read().split()
+        if children:
+            return int(children[0])
+        time.sleep(0.1)
+    raise CommandError("Gunicorn worker did not start")
+
+
+def _rss_kb(pid):
+    with open(f'/proc/{pid}/status') as fh:
+        for line in fh:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
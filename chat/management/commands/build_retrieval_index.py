@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.utils import percentile
+from chat.models import ChatSession, Message
+from chat.retrieval import UserIndex, delete_index
+from chat.sharding import chat_databases, shard_for_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Build or catch up users' past-chat retrieval indexes (chat.retrieval), then report index "
+        "size and query latency. Indexes are also caught up in the background after chat turns; this command fills "
+        "them in bulk, e.g. after deploying or changing RETRIEVAL_DIM (use --rebuild)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='user_ids', type=int, action='append', help="Only this user (repeatable)")
+        parser.add_argument('--rebuild', action='store_true', help="Drop existing indexes first")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Messages embedded per step")
+        parser.add_argument('--queries', type=int, default=200, help="Sample queries for the latency report")
+        parser.add_argument('--report-only', action='store_true', help="Skip building; only report")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or self._users_with_chats()
+        added = 0
+        start = time.perf_counter()
+        if not options['report_only']:
+            for user_id in user_ids:
+                if options['rebuild']:
+                    delete_index(user_id)
+                index = UserIndex.load(user_id)
+                while True:
+                    count = index.update(limit=options['batch_size'])
+                    if not count:
+                        break
+                    added += count
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"  user {user_id}: {len(index.vectors)} vectors")
+            self.stdout.write(self.style.SUCCESS(
+                f"Indexed {added} messages for {len(user_ids)} users in {time.perf_counter() - start:.1f}s"
+            ))
+        self._report(user_ids, options['queries'])
+
+    @staticmethod
+    def _users_with_chats():
+        user_ids = set()
+        for alias in chat_databases():
+            user_ids.update(
+                ChatSession.all_objects.using(alias).exclude(user_id=None)
+                .order_by().values_list('user_id', flat=True).distinct()
+            )
+        return sorted(user_ids)
+
+    def _report(self, user_ids, queries):
+        indexes = [UserIndex.load(user_id) for user_id in user_ids]
+        vectors = sum(len(index.vectors) for index in indexes)
+        stored = sum(index.nbytes for index in indexes)
+        largest = max(indexes, key=lambda index: len(index.vectors), default=None)
+        self.stdout.write(
+            f"Index: {vectors} vectors, {stored / 1024:.0f} KiB stored "
+            f"({stored / vectors if vectors else 0:.0f} bytes/vector)"
+            + (f"; largest user {largest.user_id} with {len(largest.vectors)} vectors" if largest else "")
+        )
+        if not vectors or not queries:
+            return
+
+        # Query with real user messages, timing the load + search a chat request does
+        rng = random.Random(0)
+        samples = []
+        for _ in range(queries):
+            index = rng.choice([index for index in indexes if len(index.vectors)])
+            message_id = int(rng.choice(index.message_ids))
+            text = Message.objects.using(shard_for_user(index.user_id)).filter(pk=message_id).values_list(
+                'text_content', flat=True).first() or ''
+            start = time.perf_counter()
+            loaded = UserIndex.load(index.user_id)
+            loaded_at = time.perf_counter()
+            loaded.search(text, exclude_ids={message_id})
+            samples.append(((loaded_at - start) * 1000, (time.perf_counter() - loaded_at) * 1000))
+        load_ms = sorted(load for load, _ in samples)
+        search_ms = sorted(search for _, search in samples)
+        self.stdout.write(
+            f"Query latency over {queries} samples: load p50 {percentile(load_ms, 50):.2f}ms "
+            f"p95 {percentile(load_ms, 95):.2f}ms; search p50 {percentile(search_ms, 50):.2f}ms "
+            f"p95 {percentile(search_ms, 95):.2f}ms"
+        )
@@ -0,0 +1,141 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import Count
+
+from chat.fields import compress_text, decompress_text, is_compressed
+from chat.models import ChatSession, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Compress (or --decompress) existing Message.text_content rows in primary-key order, "
+        "one transaction per batch. Safe to interrupt and re-run; use --start-id to skip ahead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per batch/transaction")
+        parser.add_argument('--start-id', type=int, default=0, help="Resume after this message id")
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches")
+        parser.add_argument('--codec', choices=['zlib', 'zstd'], help="Override MESSAGE_COMPRESSION")
+        parser.add_argument('--min-length', type=int, help="Override MESSAGE_COMPRESSION_MIN_LENGTH")
+        parser.add_argument('--decompress', action='store_true', help="Rewrite compressed rows as plain text")
+        parser.add_argument('--dry-run', action='store_true', help="Report savings without writing")
+        parser.add_argument('--report', action='store_true',
+                            help="Measure table size and history-read latency before and after")
+        parser.add_argument('--vacuum', action='store_true', help="VACUUM the table afterwards to reclaim space")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database (or chat shard) to rewrite")
+
+    def handle(self, *args, **options):
+        codec = options['codec'] or settings.MESSAGE_COMPRESSION
+        if codec == 'none' and not options['decompress']:
+            raise CommandError("MESSAGE_COMPRESSION is 'none'; pass --codec or --decompress")
+        min_length = options['min_length']
+        if min_length is None:
+            min_length = settings.MESSAGE_COMPRESSION_MIN_LENGTH
+
+        self.using = options['database']
+        connection = connections[self.using]
+        before = self._measure() if options['report'] else None
+        table = connection.ops.quote_name(Message._meta.db_table)
+        column = connection.ops.quote_name(Message._meta.get_field('text_content').column)
+        last_id = options['start_id']
+        scanned = rewritten = bytes_before = bytes_after = 0
+        start = time.perf_counter()
+
+        while True:
+            with transaction.atomic(using=self.using):
+                with connection.cursor() as cursor:
+                    # Raw SQL: the model field would decode the values we need to inspect
+                    cursor.execute(
+                        f"SELECT id, {column} FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                        [last_id, options['batch_size']],
+                    )
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    updates = []
+                    for pk, stored in rows:
+                        if options['decompress']:
+                            new = decompress_text(stored) if is_compressed(stored) else stored
+                        elif is_compressed(stored):
+                            new = stored
+                        else:
+                            new = compress_text(stored, codec=codec, min_length=min_length)
+                        if new != stored:
+                            updates.append((new, pk))
+                            bytes_before += len(stored.encode('utf-8'))
+                            bytes_after += len(new.encode('utf-8'))
+                    if updates and not options['dry_run']:
+                        cursor.executemany(f"UPDATE {table} SET {column} = %s WHERE id = %s", updates)
+            scanned += len(rows)
+            rewritten += len(updates)
+            last_id = rows[-1][0]
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  up to id {last_id}: scanned {scanned}, rewritten {rewritten}")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.perf_counter() - start
+        verb = 'Would rewrite' if options['dry_run'] else 'Rewrote'
+        saved = bytes_before - bytes_after
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {rewritten} of {scanned} messages in {elapsed:.1f}s (last id {last_id}): "
+            f"{bytes_before / 1024:.0f} KiB -> {bytes_after / 1024:.0f} KiB ({saved / 1024:+.0f} KiB saved)"
+        ))
+
+        if options['vacuum'] and not options['dry_run']:
+            self._vacuum(table)
+        if before is not None:
+            after = self._measure()
+            self.stdout.write("                     before      after")
+            for key, label in (('text_bytes', 'text column (KiB)'), ('table_bytes', 'table on disk (KiB)'),
+                               ('history_ms', 'history read (ms)')):
+                b, a = before[key], after[key]
+                if key.endswith('bytes'):
+                    b, a = (b / 1024 if b is not None else None), (a / 1024 if a is not None else None)
+                self.stdout.write(f"  {label:19s} {_fmt(b):>10s} {_fmt(a):>10s}")
+
+    def _measure(self, sessions=20, rounds=5):
+        """Stored text size, table size and time to load the largest sessions' histories."""
+        table = Message._meta.db_table
+        column = Message._meta.get_field('text_content').column
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COALESCE(SUM(LENGTH({column})), 0) FROM {table}")
+            text_bytes = cursor.fetchone()[0]
+            table_bytes = None
+            try:
+                if connection.vendor == 'postgresql':
+                    cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+                    table_bytes = cursor.fetchone()[0]
+                elif connection.vendor == 'sqlite':
+                    with transaction.atomic(using=self.using):
+                        cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [table])
+                        table_bytes = cursor.fetchone()[0]
+            except DatabaseError:
+                pass  # dbstat is not compiled into every SQLite build
+        largest = list(ChatSession.objects.using(self.using).annotate(n=Count('messages')).order_by('-n')
+                       .values_list('pk', flat=True)[:sessions])
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for session_id in largest:
+                list(Message.objects.using(self.using).filter(session_id=session_id).order_by('timestamp')
+                     .values_list('text_content', flat=True))
+            timings.append((time.perf_counter() - start) * 1000)
+        return {'text_bytes': text_bytes, 'table_bytes': table_bytes, 'history_ms': min(timings)}
+
+    def _vacuum(self, table):
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"VACUUM FULL {connection.ops.quote_name(table)}")
+            elif connection.vendor == 'sqlite':
+                cursor.execute("VACUUM")
+
+
+def _fmt(value):
+    return 'n/a' if value is None else f"{value:.1f}"
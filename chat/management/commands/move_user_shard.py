@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from chat.models import ChatSession, ShardAssignment
+from chat.sharding import move_user, ring, shard_for_user, sharding_enabled
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users' chat data to another shard while they stay online. Pass user ids with --to, "
+        "or --rebalance to move every user whose shard differs from the hash ring (after adding "
+        "a shard, or to spread users still on the default database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help="Users to move")
+        parser.add_argument('--to', dest='target', help="Target shard alias (required with user ids)")
+        parser.add_argument('--rebalance', action='store_true', help="Move users to their hash ring shard")
+        parser.add_argument('--limit', type=int, help="With --rebalance, stop after this many users")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows copied per INSERT/transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the planned moves")
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError("CHAT_SHARDING is off; nothing is routed by the shard directory")
+        if options['rebalance'] == bool(options['user_ids']):
+            raise CommandError("Pass either user ids with --to, or --rebalance")
+
+        if options['rebalance']:
+            plan = self._rebalance_plan(options['limit'])
+        else:
+            target = options['target']
+            valid = [DEFAULT_DB_ALIAS] + settings.CHAT_SHARDS
+            if target not in valid:
+                raise CommandError(f"--to must be one of: {', '.join(valid)}")
+            plan = [(user_id, target) for user_id in options['user_ids']]
+
+        if options['dry_run']:
+            for user_id, target in plan:
+                self.stdout.write(f"user {user_id} -> {target}")
+            self.stdout.write(f"{len(plan)} users would be moved")
+            return
+
+        def progress(user_id, step):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  user {user_id}: {step}")
+
+        moved = rows = 0
+        start = time.perf_counter()
+        for user_id, target in plan:
+            count = move_user(user_id, target, batch_size=options['batch_size'], progress=progress)
+            moved += 1
+            rows += count
+            self.stdout.write(f"user {user_id} -> {target}: {count} rows")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} users ({rows} rows) in {elapsed:.1f}s"))
+
+    @staticmethod
+    def _rebalance_plan(limit):
+        # Users with chat rows on default who haven't been seen since sharding was enabled
+        legacy = (ChatSession.all_objects.using(DEFAULT_DB_ALIAS).exclude(user_id=None)
+                  .order_by().values_list('user_id', flat=True).distinct())
+        for user_id in legacy:
+            shard_for_user(user_id)
+        hash_ring = ring()
+        plan = []
+        for user_id, shard in ShardAssignment.objects.order_by('user_id').values_list('user_id', 'shard').iterator():
+            target = hash_ring.node_for(user_id)
+            if target != shard:
+                plan.append((user_id, target))
+                if limit is not None and len(plan) >= limit:
+                    break
+        return plan
@@ -0,0 +1,111 @@
+import gzip
+import re
+import time
+
+import brotli
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.loader import get_template
+from django.test import RequestFactory
+
+# Same-origin stylesheets and scripts referenced by the page
+ASSET_RE = re.compile(r'<(?:link[^>]+rel="stylesheet"[^>]+href|script[^>]+src)="(/[^"]+)"')
+INLINE_RE = re.compile(r'<(style|script)(?:\s[^>]*)?>(.*?)</\1>', re.DOTALL)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the chat page's HTML and same-origin asset bytes (raw, gzip, brotli) and a "
+        "modelled time-to-interactive for first and repeat visits. Third-party CDN assets are "
+        "not counted. Use --template-file to measure another version of the page, e.g. the "
+        "previous template for a before/after comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', default='chat/index.html', help="Template name to render")
+        parser.add_argument('--template-file', help="Render this file instead of --template")
+        parser.add_argument('--username', help="Render for this user (default: anonymous)")
+        parser.add_argument('--bandwidth', type=float, default=5.0, help="Downlink in Mbit/s")
+        parser.add_argument('--rtt', type=float, default=100.0, help="Round trip time in ms")
+        parser.add_argument('--renders', type=int, default=200, help="Renders timed for the server-side cost")
+
+    def handle(self, *args, **options):
+        if options['template_file']:
+            with open(options['template_file'], encoding='utf-8') as fh:
+                template = engines['django'].from_string(fh.read())
+        else:
+            template = get_template(options['template'])
+        request = RequestFactory().get('/')
+        if options['username']:
+            try:
+                request.user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['username']!r}")
+        else:
+            request.user = AnonymousUser()
+
+        try:
+            html = template.render({}, request)
+        except ValueError as e:
+            # The manifest storage only knows hashed names after collectstatic
+            raise CommandError(f"{e}; run collectstatic first")
+        start = time.perf_counter()
+        for _ in range(options['renders']):
+            template.render({}, request)
+        render_ms = (time.perf_counter() - start) * 1000 / max(options['renders'], 1)
+
+        inline = sum(len(body.encode()) for _, body in INLINE_RE.findall(html))
+        page = self._sizes(html.encode())
+        self.stdout.write(f"{'HTML':42s} {self._format(page)}  ({inline} bytes inline CSS/JS, "
+                          f"render {render_ms:.2f}ms)")
+        assets = []
+        for url in ASSET_RE.findall(html):
+            content = self._asset(url)
+            if content is None:
+                self.stdout.write(self.style.WARNING(f"{url}: not found"))
+                continue
+            sizes = self._sizes(content)
+            assets.append(sizes)
+            self.stdout.write(f"{url[-42:]:42s} {self._format(sizes)}")
+
+        # Transfer model: TCP+TLS setup and the document request, then one more round trip
+        # for the assets, which are fetched in parallel; repeat visits reuse cached assets
+        # (hashed names are served immutable) and only fetch the HTML.
+        # WhiteNoise serves the assets brotli-compressed; the HTML only if a middleware compresses it.
+        html_bytes = page['gzip'] if 'django.middleware.gzip.GZipMiddleware' in settings.MIDDLEWARE else page['raw']
+        asset_bytes = sum(a['br'] for a in assets)
+        rtt, bytes_per_ms = options['rtt'], options['bandwidth'] * 1_000_000 / 8 / 1000
+        html_ms = 3 * rtt + html_bytes / bytes_per_ms
+        asset_ms = (rtt + asset_bytes / bytes_per_ms) if assets else 0.0
+        self.stdout.write(
+            f"Modelled time-to-interactive at {options['bandwidth']:g} Mbit/s, {rtt:g}ms RTT: "
+            f"first visit {render_ms + html_ms + asset_ms:.0f}ms, repeat visit {render_ms + html_ms:.0f}ms; "
+            f"{html_bytes + asset_bytes} bytes first, {html_bytes} bytes repeat"
+        )
+
+    @staticmethod
+    def _asset(url):
+        if not url.startswith(settings.STATIC_URL):
+            return None
+        name = url[len(settings.STATIC_URL):]
+        # Hashed names only exist in STATIC_ROOT after collectstatic; the source file has the same bytes
+        path = finders.find(name) or finders.find(re.sub(r'\.[0-9a-f]{12}(\.\w+)$', r'\1', name))
+        if not path:
+            return None
+        with open(path, 'rb') as fh:
+            return fh.read()
+
+    @staticmethod
+    def _sizes(content):
+        return {
+            'raw': len(content),
+            'gzip': len(gzip.compress(content, compresslevel=9)),
+            'br': len(brotli.compress(content)),
+        }
+
+    @staticmethod
+    def _format(sizes):
+        return f"{sizes['raw']:8d} raw {sizes['gzip']:7d} gzip {sizes['br']:7d} br"
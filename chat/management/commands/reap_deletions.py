@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.deletion import reap
+from chat.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove the rows of soft-deleted accounts and sessions in bounded batches. "
+        "Run it periodically (e.g. from cron); interrupted jobs resume where they stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per DELETE/transaction")
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches")
+        parser.add_argument('--max-jobs', type=int, help="Stop after this many jobs")
+
+    def handle(self, *args, **options):
+        jobs = DeletionJob.objects.filter(finished_at__isnull=True).order_by('requested_at')
+        if options['max_jobs']:
+            jobs = jobs[:options['max_jobs']]
+
+        def progress(job, label, deleted):
+            self.stdout.write(f"  job {job.pk}: {deleted} rows deleted ({label})")
+
+        total = done = 0
+        start = time.perf_counter()
+        for job in jobs:
+            try:
+                total += reap(job, batch_size=options['batch_size'], pause=options['sleep'],
+                              progress=progress if options['verbosity'] > 1 else None)
+                done += 1
+            except Exception as e:
+                DeletionJob.objects.filter(pk=job.pk).update(last_error=str(e))
+                self.stderr.write(f"Job {job.pk} failed: {e}")
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished {done} deletion jobs: {total} rows in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-user totals shown on the profile and usage pages from the chat "
+        "tables. Run it after a bulk import or to repair drift (e.g. from cron at night)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], help="Username to rebuild (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Users computed per round of queries")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username__in=options['user'])
+            missing = set(options['user']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"No such users: {', '.join(sorted(missing))}")
+        user_ids = list(users.values_list('pk', flat=True))
+
+        start = time.perf_counter()
+        written = stats.rebuild(user_ids, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        rate = written / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt stats for {written} users in {elapsed:.1f}s ({rate:.0f} users/s)"
+        ))
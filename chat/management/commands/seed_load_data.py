@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.loadtest import LOAD_TEST_PREFIX, clear_load_data, seed_load_data
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users, sessions, tags, messages and usage logs for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help="Number of users to create")
+        parser.add_argument('--sessions', type=int, default=10, help="Average chat sessions per user")
+        parser.add_argument('--messages', type=int, default=20, help="Average messages per session")
+        parser.add_argument('--tags', type=int, default=4, help="Tags per user")
+        parser.add_argument('--usage-logs', type=int, default=50, help="Average API usage log rows per user")
+        parser.add_argument('--days', type=int, default=90, help="Spread timestamps over this many days")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per bulk_create batch")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed for reproducible data")
+        parser.add_argument('--prefix', default=LOAD_TEST_PREFIX, help="Username prefix for synthetic users")
+        parser.add_argument('--clear', action='store_true', help="Delete existing synthetic users first")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear']:
+            deleted = clear_load_data(prefix)
+            self.stdout.write(f"Removed {deleted} existing '{prefix}*' users")
+
+        def progress(totals):
+            self.stdout.write(
+                f"  users={totals['users']} sessions={totals['sessions']} messages={totals['messages']}"
+            )
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            totals = seed_load_data(
+                users=options['users'],
+                sessions_per_user=options['sessions'],
+                messages_per_session=options['messages'],
+                tags_per_user=options['tags'],
+                usage_logs_per_user=options['usage_logs'],
+                days=options['days'],
+                batch_size=options['batch_size'],
+                seed=options['seed'],
+                prefix=prefix,
+                progress=progress if options['verbosity'] > 1 else None,
+            )
+        elapsed = time.perf_counter() - start
+
+        summary = ', '.join(f"{count} {name}" for name, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {elapsed:.1f}s"))
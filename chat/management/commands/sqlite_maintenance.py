@@ -0,0 +1,56 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Routine maintenance for the SQLite production profile: checkpoint and truncate the WAL, "
+        "run PRAGMA optimize, and optionally ANALYZE, VACUUM or an integrity check. "
+        "Schedule it from cron (e.g. every 15 minutes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help="Rebuild query planner statistics")
+        parser.add_argument('--vacuum', action='store_true', help="Rewrite the file to reclaim free pages")
+        parser.add_argument('--check', action='store_true', help="Run PRAGMA quick_check")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database (or chat shard) to maintain")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"Database '{connection.alias}' is {connection.vendor}, not SQLite")
+        path = str(connection.settings_dict['NAME'])
+        before = self._sizes(path)
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            busy, wal_pages, checkpointed = cursor.fetchone()
+            if options['analyze']:
+                cursor.execute("ANALYZE")
+            cursor.execute("PRAGMA optimize")
+            if options['vacuum']:
+                cursor.execute("VACUUM")
+            if options['check']:
+                cursor.execute("PRAGMA quick_check")
+                problems = [row[0] for row in cursor.fetchall() if row[0] != 'ok']
+                if problems:
+                    raise CommandError("quick_check failed:\n" + '\n'.join(problems[:20]))
+
+        after = self._sizes(path)
+        if busy:
+            self.stderr.write("Checkpoint could not complete: readers or a writer held the WAL; retry later")
+        self.stdout.write(self.style.SUCCESS(
+            f"journal_mode={journal_mode}; checkpointed {checkpointed}/{wal_pages} WAL pages; "
+            f"database {before[0] / 1024:.0f} KiB -> {after[0] / 1024:.0f} KiB, "
+            f"WAL {before[1] / 1024:.0f} KiB -> {after[1] / 1024:.0f} KiB"
+        ))
+
+    @staticmethod
+    def _sizes(path):
+        def size(p):
+            return os.path.getsize(p) if os.path.exists(p) else 0
+        return size(path), size(path + '-wal')
@@ -0,0 +1,154 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: build the app, serve one request, report timings.
+PROBE = r'''
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nicole_project.settings")
+mode, path = sys.argv[1], sys.argv[2]
+if mode == "asgi":
+    import asyncio
+    from django.core.asgi import get_asgi_application
+    app = get_asgi_application()
+    ready = time.perf_counter()
+    sent = []
+    async def run():
+        body_sent = asyncio.Event()
+        async def receive():
+            if body_sent.is_set():
+                await asyncio.Event().wait()
+            body_sent.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        async def send(message):
+            sent.append(message)
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "headers": [(b"host", b"localhost")],
+            "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+        }
+        await app(scope, receive, send)
+    asyncio.run(run())
+    status = sent[0]["status"]
+else:
+    from django.core.wsgi import get_wsgi_application
+    app = get_wsgi_application()
+    ready = time.perf_counter()
+    statuses = []
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "SERVER_NAME": "localhost", "SERVER_PORT": "80",
+        "HTTP_HOST": "localhost", "wsgi.url_scheme": "http", "wsgi.input": sys.stdin.buffer,
+        "wsgi.errors": sys.stderr, "wsgi.multithread": False, "wsgi.multiprocess": True,
+        "wsgi.run_once": False, "wsgi.version": (1, 0),
+    }
+    b"".join(app(environ, lambda s, h, *a: statuses.append(int(s.split()[0]))))
+    status = statuses[0]
+done = time.perf_counter()
+print(json.dumps({
+    "app_ready_ms": (ready - start) * 1000,
+    "first_request_ms": (done - ready) * 1000,
+    "status": status,
+    "modules": sorted(sys.modules),
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile worker cold start: per-module import cost (python -X importtime) and "
+        "time-to-first-request for a fresh interpreter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', choices=['asgi', 'wsgi'], default='asgi', help="Application entry point")
+        parser.add_argument('--path', default='/login/', help="Path of the first request")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs (median is reported)")
+        parser.add_argument('--top', type=int, default=15, help="Number of packages/modules to list")
+        parser.add_argument('--watch', default='reportlab,PIL',
+                            help="Comma-separated packages that should NOT be loaded at startup")
+        parser.add_argument('--budget-ms', type=float, help="Fail if time-to-first-request exceeds this")
+        parser.add_argument('--json', dest='json_path', help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        importtime, _ = self._run(options, importtime=True)
+        runs = [self._run(options)[1] for _ in range(options['repeat'])]
+
+        total = statistics.median(r['process_ms'] for r in runs)
+        app_ready = statistics.median(r['app_ready_ms'] for r in runs)
+        first_request = statistics.median(r['first_request_ms'] for r in runs)
+        packages, modules = self._parse_importtime(importtime)
+        loaded = sorted({m.split('.')[0] for m in runs[0]['modules']})
+        watched = {name: name in loaded for name in options['watch'].split(',') if name}
+
+        self.stdout.write(f"Cold start ({options['app']}, GET {options['path']} -> {runs[0]['status']}), "
+                          f"median of {len(runs)} runs:")
+        self.stdout.write(f"  interpreter start to first response: {total:8.1f} ms")
+        self.stdout.write(f"  django setup + app construction:     {app_ready:8.1f} ms")
+        self.stdout.write(f"  first request (URLconf, views):      {first_request:8.1f} ms")
+
+        self.stdout.write("\nImport cost by top-level package (self time, -X importtime):")
+        for name, us in packages[:options['top']]:
+            self.stdout.write(f"  {us / 1000:8.1f} ms  {name}")
+        self.stdout.write("\nSlowest top-level imports (cumulative):")
+        for name, us in modules[:options['top']]:
+            self.stdout.write(f"  {us / 1000:8.1f} ms  {name}")
+        if watched:
+            self.stdout.write("\nDeferred packages loaded at startup: " + ', '.join(
+                f"{name}={'yes' if hit else 'no'}" for name, hit in watched.items()))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump({
+                    'app': options['app'],
+                    'path': options['path'],
+                    'process_ms': round(total, 1),
+                    'app_ready_ms': round(app_ready, 1),
+                    'first_request_ms': round(first_request, 1),
+                    'packages_self_ms': {name: round(us / 1000, 2) for name, us in packages},
+                    'imports_cumulative_ms': {name: round(us / 1000, 2) for name, us in modules},
+                    'deferred_loaded': watched,
+                }, fh, indent=2)
+        if options['budget_ms'] is not None and total > options['budget_ms']:
+            raise CommandError(f"Time to first request {total:.1f} ms exceeds budget of {options['budget_ms']} ms")
+
+    def _run(self, options, importtime=False):
+        cmd = [sys.executable]
+        if importtime:
+            cmd += ['-X', 'importtime']
+        cmd += ['-c', PROBE, options['app'], options['path']]
+        env = dict(os.environ, PERF_LOG_REQUESTS='False')
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if proc.returncode != 0:
+            raise CommandError(f"Probe failed:\n{proc.stderr[-2000:]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['process_ms'] = elapsed
+        return proc.stderr, result
+
+    @staticmethod
+    def _parse_importtime(stderr):
+        """Return ([(package, self_us)], [(top-level module, cumulative_us)]), slowest first."""
+        packages, modules = {}, []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            try:
+                self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+                self_us, cumulative_us = int(self_us), int(cumulative_us)
+            except ValueError:
+                continue
+            package = name.strip().split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+            if not name[1:].startswith(' '):
+                modules.append((name.strip(), cumulative_us))
+        return (sorted(packages.items(), key=lambda kv: -kv[1]),
+                sorted(modules, key=lambda kv: -kv[1]))
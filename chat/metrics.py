@@ -0,0 +1,308 @@
+"""
+In-process metrics (counters, gauges, fixed-bucket histograms) exposed in
+Prometheus text format.
+
+Recording is a dict update under a lock. A background thread in each
+process writes a snapshot of its cumulative values to
+``METRICS_DIR/<pid>.json`` every ``METRICS_FLUSH_INTERVAL`` seconds (and once
+more at exit), so no file I/O happens on the request path; a scrape
+merges the snapshots of every gunicorn worker. Counters and histograms of
+workers that have exited are folded into ``retired.json`` so totals never go
+backwards; gauges only count live workers.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.start_flusher()
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = value
+        self.registry.start_flusher()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.start_flusher()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Values are ``[count per bucket..., count in +Inf, sum]`` with non-cumulative buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            slots = self.values.get(key)
+            if slots is None:
+                slots = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            slots[index] += 1
+            slots[-1] += value
+        self.registry.start_flusher()
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._flusher_pid = None
+        self._has_flushed = False
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    # ---- shared store ----
+
+    @staticmethod
+    def directory():
+        return getattr(settings, 'METRICS_DIR', '')
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {'|'.join(key): value for key, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+            }
+
+    def start_flusher(self):
+        """Start the flush thread on first use in each process (forked workers need their own)."""
+        pid = os.getpid()
+        if self._flusher_pid == pid or not self.directory():
+            return
+        with self.lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0))
+            self.flush()
+
+    def flush(self):
+        directory = self.directory()
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write_json(os.path.join(directory, f"{os.getpid()}.json"), self.snapshot())
+            self._has_flushed = True
+        except OSError:
+            pass
+
+    def flush_at_exit(self):
+        # Only processes that have been publishing keep their final values.
+        if self._has_flushed:
+            self.flush()
+
+    def collect(self):
+        """Merged values from every process: {name: {label_key: value}}."""
+        directory = self.directory()
+        if not directory:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                retired_path = os.path.join(directory, 'retired.json')
+                retired = _read_json(retired_path) or {}
+                retired_changed = False
+                for filename in os.listdir(directory):
+                    if not filename.endswith('.json') or filename == 'retired.json':
+                        continue
+                    path = os.path.join(directory, filename)
+                    data = _read_json(path)
+                    if data is None:
+                        continue
+                    pid = int(filename[:-5]) if filename[:-5].isdigit() else None
+                    if pid is not None and pid != os.getpid() and not _pid_alive(pid):
+                        self._merge(retired, data, include_gauges=False)
+                        retired_changed = True
+                        os.unlink(path)
+                        continue
+                    self._merge(merged, data, include_gauges=True)
+                if retired_changed:
+                    _write_json(retired_path, retired)
+                self._merge(merged, retired, include_gauges=False)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return merged
+
+    def _merge(self, target, data, include_gauges):
+        for name, values in data.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.kind == 'gauge' and not include_gauges):
+                continue
+            bucket = target.setdefault(name, {})
+            for key, value in values.items():
+                if isinstance(value, list):
+                    current = bucket.get(key)
+                    bucket[key] = [a + b for a, b in zip(current, value)] if current else list(value)
+                else:
+                    bucket[key] = bucket.get(key, 0) + value
+
+    def exposition(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(collected.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, key.split('|'))) if metric.labelnames else []
+                if metric.kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        (k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    """Atomically replace ``path``; the temporary name is unique, so concurrent writers never share it."""
+    fh = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), suffix='.tmp', delete=False)
+    try:
+        with fh:
+            json.dump(data, fh)
+        os.replace(fh.name, path)
+    except BaseException:
+        try:
+            os.unlink(fh.name)
+        except OSError:
+            pass
+        raise
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+registry = Registry()
+atexit.register(registry.flush_at_exit)
+
+REQUEST_LATENCY = registry.histogram(
+    'nicole_http_request_duration_seconds', 'Request latency by URL name.', ['view', 'method'])
+RESPONSES = registry.counter(
+    'nicole_http_responses_total', 'Responses by URL name and status code.', ['view', 'status'])
+IN_FLIGHT = registry.gauge(
+    'nicole_http_requests_in_flight', 'Requests currently being processed.')
+GEMINI_LATENCY = registry.histogram(
+    'nicole_gemini_request_duration_seconds', 'Gemini API call latency.', ['model'], buckets=LLM_BUCKETS)
+GEMINI_RESPONSES = registry.counter(
+    'nicole_gemini_responses_total', 'Gemini API calls by outcome (HTTP status, timeout or error).',
+    ['model', 'status'])
+GEMINI_TOKENS = registry.counter(
+    'nicole_gemini_tokens_total',
+    'Tokens reported by Gemini usage metadata (in, out, and cached: prompt tokens served from a context cache).',
+    ['model', 'direction'])
+RATE_LIMIT_REJECTIONS = registry.counter(
+    'nicole_rate_limit_rejections_total', 'Chat requests rejected by the rate limiter.', ['reason'])
+CACHE_REQUESTS = registry.counter(
+    'nicole_cache_requests_total', 'Application cache lookups by result (hit or miss).', ['cache', 'result'])
+QUEUE_DEPTH = registry.gauge(
+    'nicole_queue_depth', 'Jobs waiting in in-process work queues.', ['queue'])
+REPLICA_LAG = registry.gauge(
+    'nicole_db_replica_lag_seconds', 'Last measured read-replica lag (-1 when unreachable).')
+RETRIEVAL_LATENCY = registry.histogram(
+    'nicole_retrieval_duration_seconds', 'Past-chat retrieval time by stage (load, search, or update in the background).', ['stage'])
+RETRIEVAL_INDEXED = registry.counter(
+    'nicole_retrieval_indexed_messages_total', 'Messages added to retrieval indexes.')
+PROMPT_CACHE_EVENTS = registry.counter(
+    'nicole_prompt_cache_events_total',
+    'Gemini context cache handles by event (hit, created, refreshed, extended, stale, error).', ['model', 'event'])
+WS_CONNECTIONS = registry.gauge(
+    'nicole_ws_connections', 'Open chat WebSocket connections.')
+WS_FRAMES = registry.counter(
+    'nicole_ws_frames_total', 'Chat WebSocket frames by direction and message type.', ['direction', 'type'])
+WS_CLOSES = registry.counter(
+    'nicole_ws_server_closes_total', 'Chat WebSocket connections closed by the server, by reason.', ['reason'])
+ROUTING_DECISIONS = registry.counter(
+    'nicole_routing_decisions_total', 'Chat turns by routing tier and chosen model.', ['tier', 'model', 'failover'])
@@ -0,0 +1,324 @@
+import asyncio
+import gzip
+import json
+import logging
+import random
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import SimpleLazyObject, empty
+
+from chat import auth_cache, metrics, perf, routers, sharding
+from chat.http import JsonResponse
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+logger = logging.getLogger('chat.perf')
+
+
+class PerformanceMiddleware:
+    """
+    Collect DB, span and queue timings for each request, expose them in a
+    ``Server-Timing`` header and write one structured JSON log line per request.
+    Requests slower than ``PERF_SLOW_REQUEST_MS`` are sampled with their full
+    query list at ``PERF_SLOW_SAMPLE_RATE``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PERF_SERVER_TIMING', True)
+        self.log_requests = getattr(settings, 'PERF_LOG_REQUESTS', True)
+        self.slow_ms = getattr(settings, 'PERF_SLOW_REQUEST_MS', 1000)
+        self.slow_sample_rate = getattr(settings, 'PERF_SLOW_SAMPLE_RATE', 1.0)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = perf.begin(perf.parse_request_start(request.META.get('HTTP_X_REQUEST_START')))
+        try:
+            response = self.get_response(request)
+        finally:
+            perf.end(token)
+        self.finish(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings, token = perf.begin(perf.parse_request_start(request.META.get('HTTP_X_REQUEST_START')))
+        try:
+            response = await self.get_response(request)
+        finally:
+            perf.end(token)
+        self.finish(request, response, timings)
+        return response
+
+    def finish(self, request, response, timings):
+        if self.server_timing:
+            response['Server-Timing'] = timings.server_timing()
+        if not self.log_requests:
+            return
+        total_ms = timings.total_ms
+        slow = total_ms >= self.slow_ms
+        sampled = slow and random.random() < self.slow_sample_rate
+        match = request.resolver_match
+        entry = {
+            'event': 'request',
+            'ts': round(time.time(), 3),
+            'method': request.method,
+            'path': request.path,
+            'view': match.url_name if match else None,
+            'status': response.status_code,
+            'user_id': self.user_id(request),
+            'slow': slow,
+        }
+        entry.update(timings.as_dict(include_queries=sampled))
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(entry, default=str))
+
+    @staticmethod
+    def user_id(request):
+        """The authenticated user's id, without triggering a lookup the view did not need."""
+        # Async views resolve the user with request.auser() and leave request.user unevaluated
+        user = getattr(request, '_acached_user', None) or getattr(request, 'user', None)
+        if user is None or getattr(user, '_wrapped', None) is empty:
+            return None
+        return user.pk
+
+
+class MetricsMiddleware:
+    """Record request latency, status codes and in-flight requests per URL name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+        self.observe(request, response.status_code, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        try:
+            response = await self.get_response(request)
+        except asyncio.CancelledError:
+            # Client disconnected; counted under nginx's "client closed request" status
+            self.observe(request, 499, time.perf_counter() - start)
+            raise
+        finally:
+            metrics.IN_FLIGHT.dec()
+        self.observe(request, response.status_code, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def observe(request, status, seconds):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        metrics.REQUEST_LATENCY.observe(seconds, view=view, method=request.method)
+        metrics.RESPONSES.inc(view=view, status=status)
+
+
+class ReplicaPinMiddleware:
+    """
+    Track writes for ``chat.routers.ReplicaRouter``. A request that writes sets
+    a short-lived cookie that keeps the client's reads on the primary until the
+    replica has caught up with its own changes.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = routers.begin_request(pinned=self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        state, token = routers.begin_request(pinned=self.cookie_name in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.pin(response, state)
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+class ShardMiddleware:
+    """
+    Scope each request's chat queries to the logged-in user's shard
+    (``chat.sharding.ShardRouter``). The user id is read from the session only
+    when a chat query first needs it. Does nothing unless ``CHAT_SHARDING`` is on.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not sharding.sharding_enabled():
+            return self.get_response(request)
+        token = sharding.begin_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            sharding.end_request(token)
+
+    async def __acall__(self, request):
+        if not sharding.sharding_enabled():
+            return await self.get_response(request)
+        token = sharding.begin_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            sharding.end_request(token)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, sharding.ShardMoving):
+            response = JsonResponse({'error': str(exception)}, status=503)
+            response['Retry-After'] = str(int(settings.SHARD_DIRECTORY_LOCAL_TTL) + 1)
+            return response
+        return None
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    ``AuthenticationMiddleware`` with ``request.user`` and ``request.auser()``
+    resolved through ``chat.auth_cache``, so a warm request reads no ``auth_user``
+    row.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: _cached_user(request))
+        request.auser = partial(_acached_user, request)
+
+
+def _cached_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = auth_cache.get_user(request)
+    return request._cached_user
+
+
+async def _acached_user(request):
+    if not hasattr(request, '_acached_user'):
+        request._acached_user = await auth_cache.aget_user(request)
+    return request._acached_user
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON responses (API payloads and JSON exports) of at least
+    ``RESPONSE_COMPRESSION_MIN_BYTES`` with brotli or gzip, whichever the client
+    prefers among those it accepts. Other content types are left alone: pages
+    embed the CSRF token next to user input (BREACH), PDFs are compressed
+    already and static files come pre-compressed from WhiteNoise.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'RESPONSE_COMPRESSION_MIN_BYTES', 1024)
+        self.content_types = tuple(getattr(settings, 'RESPONSE_COMPRESSION_TYPES', ('application/json',)))
+        self.brotli_quality = getattr(settings, 'RESPONSE_BROTLI_QUALITY', 5)
+        self.gzip_level = getattr(settings, 'RESPONSE_GZIP_LEVEL', 6)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (response.streaming or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith(self.content_types)
+                or len(response.content) < self.min_bytes):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        with perf.span('compress'):
+            if encoding == 'br':
+                content = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                content = gzip.compress(response.content, compresslevel=self.gzip_level, mtime=0)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # The compressed body is no longer byte-identical to what a strong ETag promised
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    @staticmethod
+    def negotiate(accept_encoding):
+        """'br', 'gzip' or None from an Accept-Encoding header, honouring q-values."""
+        weights = {}
+        for item in accept_encoding.lower().split(','):
+            coding, _, params = item.strip().partition(';')
+            q = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            weights[coding.strip()] = q
+        if brotli is None:
+            weights.pop('br', None)
+        # Ties go to brotli: smaller output at a similar cost
+        coding, q = max([('br', weights.get('br', 0.0)), ('gzip', weights.get('gzip', 0.0))], key=lambda c: c[1])
+        return coding if q > 0 else None
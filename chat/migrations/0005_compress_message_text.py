@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:39
+
+import chat.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0004_chattag_chatsession_tags"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="message",
+            name="text_content",
+            field=chat.fields.CompressedTextField(
+                help_text="The content of the message (long values are stored compressed)."
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0005_compress_message_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedSession",
+            fields=[
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="archive",
+                        serialize=False,
+                        to="chat.chatsession",
+                    ),
+                ),
+                (
+                    "data",
+                    models.BinaryField(
+                        help_text="zlib-compressed JSON list of the session's messages."
+                    ),
+                ),
+                ("message_count", models.IntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="is_archived",
+            field=models.BooleanField(
+                db_index=True,
+                default=False,
+                help_text="Messages moved to ArchivedSession.",
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:43
+
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0006_session_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletionJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("account", "Account"), ("session", "Session")],
+                        max_length=10,
+                    ),
+                ),
+                ("user_id", models.BigIntegerField(db_index=True)),
+                ("session_pk", models.BigIntegerField(blank=True, null=True)),
+                ("rows_deleted", models.BigIntegerField(default=0)),
+                ("requested_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "finished_at",
+                    models.DateTimeField(blank=True, db_index=True, null=True),
+                ),
+                ("last_error", models.TextField(blank=True, default="")),
+            ],
+            options={
+                "ordering": ["requested_at"],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="chatsession",
+            options={
+                "base_manager_name": "all_objects",
+                "ordering": ["-last_activity"],
+            },
+        ),
+        migrations.AlterModelManagers(
+            name="chatsession",
+            managers=[
+                ("objects", django.db.models.manager.Manager()),
+                ("all_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="deleted_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="Soft-deleted; rows are removed by reap_deletions.",
+                null=True,
+            ),
+        ),
+    ]
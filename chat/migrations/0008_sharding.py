@@ -0,0 +1,76 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class AlterFieldOnShards(migrations.AlterField):
+    """
+    AlterField that only changes the schema of shard databases. Shards hold chat
+    rows without the auth tables, so their user foreign keys can't have a
+    constraint; the default database keeps it.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias in settings.CHAT_SHARDS:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias in settings.CHAT_SHARDS:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0007_soft_delete"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShardAssignment",
+            fields=[
+                ("user_id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "shard",
+                    models.CharField(
+                        help_text="Database alias, e.g. 'shard_0' or 'default'.",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "moving",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Writes are refused while move_user_shard syncs the last changes.",
+                    ),
+                ),
+                ("assigned_at", models.DateTimeField(auto_now_add=True)),
+                ("moved_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        AlterFieldOnShards(
+            model_name="chatsession",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chat_sessions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        AlterFieldOnShards(
+            model_name="chattag",
+            name="user",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chat_tags",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0008_sharding"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RetrievalSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "seq",
+                    models.IntegerField(
+                        help_text="Position of this block in the user's index."
+                    ),
+                ),
+                ("dim", models.IntegerField()),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "last_message_id",
+                    models.BigIntegerField(
+                        default=0, help_text="Highest Message id indexed in this block."
+                    ),
+                ),
+                ("vectors", models.BinaryField()),
+                ("message_ids", models.BinaryField()),
+                ("session_ids", models.BinaryField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="retrieval_segments",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["seq"],
+                "unique_together": {("user", "seq")},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0009_retrieval_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiusagelog",
+            name="fallback",
+            field=models.BooleanField(
+                default=False, help_text="Answered by the tier's fallback model"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiusagelog",
+            name="llm_model",
+            field=models.CharField(
+                blank=True,
+                help_text="Model that answered (chat.model_routing)",
+                max_length=50,
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiusagelog",
+            name="route",
+            field=models.CharField(
+                blank=True,
+                help_text="Routing tier: light, standard or heavy",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiusagelog",
+            name="route_reason",
+            field=models.CharField(
+                blank=True, help_text="Why the tier was chosen", max_length=50
+            ),
+        ),
+    ]
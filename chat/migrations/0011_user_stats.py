@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("chat", "0010_model_routing"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "sessions",
+                    models.IntegerField(
+                        default=0,
+                        help_text="Live (not deleted) chat sessions, archived included",
+                    ),
+                ),
+                (
+                    "messages",
+                    models.IntegerField(
+                        default=0,
+                        help_text="Messages in live sessions, archived included",
+                    ),
+                ),
+                (
+                    "tokens_used",
+                    models.BigIntegerField(
+                        default=0, help_text="Sum of APIUsageLog.tokens_used"
+                    ),
+                ),
+                ("tags", models.IntegerField(default=0)),
+                ("first_activity", models.DateTimeField(blank=True, null=True)),
+                ("last_activity", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "user stats",
+            },
+        ),
+    ]
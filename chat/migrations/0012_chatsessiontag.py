@@ -0,0 +1,88 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Make the ChatSession.tags through table an explicit model on the same table,
+    then replace its single-column indexes with a (chattag_id, chatsession_id) one;
+    the unique (chatsession_id, chattag_id) index serves lookups by session.
+    """
+
+    dependencies = [
+        ("chat", "0011_user_stats"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="ChatSessionTag",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "chatsession",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="chat.chatsession",
+                            ),
+                        ),
+                        (
+                            "chattag",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="chat.chattag",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "db_table": "chat_chatsession_tags",
+                        "unique_together": {("chatsession", "chattag")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="chatsession",
+                    name="tags",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        help_text="Tags for organizing chats",
+                        related_name="sessions",
+                        through="chat.ChatSessionTag",
+                        to="chat.chattag",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="chatsessiontag",
+            name="chatsession",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="chat.chatsession",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="chatsessiontag",
+            name="chattag",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="chat.chattag",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chatsessiontag",
+            index=models.Index(
+                fields=["chattag", "chatsession"], name="chat_sessiontag_tag_idx"
+            ),
+        ),
+    ]
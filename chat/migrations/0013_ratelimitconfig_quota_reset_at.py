@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0012_chatsessiontag"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ratelimitconfig",
+            name="quota_reset_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Usage before this time doesn't count against the limits",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0013_ratelimitconfig_quota_reset_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PromptCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=64)),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="Gemini resource name, e.g. cachedContents/abc123.",
+                        max_length=200,
+                    ),
+                ),
+                (
+                    "prompt_hash",
+                    models.CharField(
+                        help_text="SHA-256 of the cached system instruction.",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "last_message_id",
+                    models.BigIntegerField(
+                        help_text="Newest Message in the cached prefix."
+                    ),
+                ),
+                ("message_count", models.IntegerField(default=0)),
+                ("token_count", models.IntegerField(default=0)),
+                ("expires_at", models.DateTimeField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="prompt_caches",
+                        to="chat.chatsession",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("session", "model")},
+            },
+        ),
+    ]
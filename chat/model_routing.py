@@ -0,0 +1,153 @@
+"""
+Model routing for chat turns.
+
+Each turn is classified from cheap signals only (prompt length, keywords and
+the size of the history being sent) into a tier of ``CHAT_ROUTES``: ``light``
+for one-line questions, ``standard`` for ordinary turns and ``heavy`` for
+plans, case studies and long prompts. Words that also turn up in everyday
+questions ("compare", "outline", "budget") only count towards ``heavy`` in a
+prompt of at least ``ROUTING_HEAVY_HINT_CHARS``. The tier fixes the model and
+the output token budget.
+
+Every Gemini call is recorded in a rolling per-model window. While a model's
+p95 latency or error rate in that window is over ``ROUTING_MAX_P95`` /
+``ROUTING_MAX_ERROR_RATE`` its tier is served by the tier's fallback model;
+old samples age out after ``ROUTING_STATS_MAX_AGE`` so the primary is tried
+again once it recovers. Stats are kept per worker process, which sees enough
+traffic to notice a degraded model within a few requests.
+"""
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from . import metrics
+from .utils import percentile
+
+# Requests for long, structured answers
+HEAVY_RE = re.compile(
+    r"\b(business plan|marketing plan|study plan|step[- ]by[- ]step|in[- ]depth|pros and cons|"
+    r"differential diagnos[ie]s|case stud(?:y|ies)|essay|swot|curriculum)\b",
+    re.IGNORECASE,
+)
+# The same, but common in short everyday questions too: only heavy in a longer prompt
+HEAVY_HINT_RE = re.compile(
+    r"\b(strategy|strategies|detailed|compare|comparison|report|proposal|outline|analy[sz]e|analysis|"
+    r"budget|forecast)\b",
+    re.IGNORECASE,
+)
+# Lookups and small talk that a small model answers as well
+LIGHT_RE = re.compile(
+    r"^\s*(what(?:'s| is| are| does)|define|definition of|meaning of|who (?:is|was)|hi|hello|hey|thanks|"
+    r"thank you|ok|okay)\b|\b(stand for|abbreviation|acronym|normal range|spell)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Route:
+    tier: str
+    reason: str
+    model: str
+    max_output_tokens: int
+    fallback: str = ''
+    failed_over: bool = False
+
+    @property
+    def models(self):
+        """Models to try, in order."""
+        return [self.model] + ([self.fallback] if self.fallback and self.fallback != self.model else [])
+
+    def log_fields(self, model=None):
+        """``APIUsageLog`` fields describing this decision, answered by ``model``."""
+        model = model or self.model
+        return {
+            'llm_model': model,
+            'route': self.tier,
+            'route_reason': self.reason[:50],
+            'fallback': self.failed_over or model != self.model,
+        }
+
+
+# ==================== CLASSIFICATION ====================
+
+def classify(prompt, history_chars=0):
+    """(tier, reason) for a prompt sent with ``history_chars`` characters of history."""
+    match = HEAVY_RE.search(prompt)
+    if match is None and len(prompt) >= settings.ROUTING_HEAVY_HINT_CHARS:
+        match = HEAVY_HINT_RE.search(prompt)
+    if match:
+        return 'heavy', f'keyword:{match.group(0).lower()}'
+    if len(prompt) >= settings.ROUTING_HEAVY_CHARS:
+        return 'heavy', 'long_prompt'
+    if history_chars >= settings.ROUTING_LONG_HISTORY_CHARS:
+        # A long conversation needs the context handling of the standard model
+        return 'standard', 'long_history'
+    if len(prompt) <= settings.ROUTING_LIGHT_CHARS and LIGHT_RE.search(prompt):
+        return 'light', 'short_lookup'
+    return 'standard', 'default'
+
+
+def choose_route(prompt, history_chars=0):
+    """The ``Route`` for a turn, switched to the fallback model if the primary is degraded."""
+    tier, reason = classify(prompt, history_chars)
+    config = settings.CHAT_ROUTES[tier]
+    route = Route(tier, reason, config['model'], config['max_output_tokens'], config.get('fallback', ''))
+    fallback = route.fallback
+    if fallback and fallback != route.model and stats.degraded(route.model) and not stats.degraded(fallback):
+        route.model, route.fallback, route.failed_over = fallback, route.model, True
+    metrics.ROUTING_DECISIONS.inc(tier=tier, model=route.model, failover=str(route.failed_over).lower())
+    return route
+
+
+# ==================== HEALTH ====================
+
+class ModelStats:
+    """Rolling latency and error samples per model, shared by the threads of a process."""
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, latency, ok):
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=settings.ROUTING_STATS_WINDOW)
+            samples.append((time.monotonic(), latency, ok))
+
+    def snapshot(self, model):
+        """{'samples', 'p95', 'error_rate'} over the recent window."""
+        cutoff = time.monotonic() - settings.ROUTING_STATS_MAX_AGE
+        with self._lock:
+            samples = self._samples.get(model, ())
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            recent = list(samples)
+        if not recent:
+            return {'samples': 0, 'p95': 0.0, 'error_rate': 0.0}
+        latencies = sorted(latency for _, latency, _ in recent)
+        errors = sum(1 for _, _, ok in recent if not ok)
+        return {'samples': len(recent), 'p95': percentile(latencies, 95), 'error_rate': errors / len(recent)}
+
+    def degraded(self, model):
+        snapshot = self.snapshot(model)
+        if snapshot['samples'] < settings.ROUTING_MIN_SAMPLES:
+            return False
+        return (snapshot['p95'] > settings.ROUTING_MAX_P95
+                or snapshot['error_rate'] > settings.ROUTING_MAX_ERROR_RATE)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+stats = ModelStats()
+
+
+def should_retry(status_code):
+    """Whether a failed call is worth repeating on the fallback model right away."""
+    return status_code == 429 or status_code >= 500
@@ -2,14 +2,24 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
+from .fields import CompressedTextField
+
+class ShardedManager(models.Manager):
+    """Manager for chat models, which may live on a per-user shard (see chat.sharding)."""
+    def for_user(self, user):
+        from .sharding import shard_for_user
+        return self.using(shard_for_user(getattr(user, 'pk', user)))
 
 class ChatTag(models.Model):
     """Tags/Categories for organizing chats"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_tags')
+    # No FK constraint on shard databases, which have no auth tables (migration 0008 keeps it on default)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_tags', db_constraint=False)
     name = models.CharField(max_length=50, help_text="Tag name (e.g., 'Refraction', 'Business')")
     color = models.CharField(max_length=7, default='#522888', help_text="Hex color for the tag")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = ShardedManager()
+    
     class Meta:
         unique_together = ('user', 'name')
         ordering = ['name']
@@ -17,36 +27,67 @@ class ChatTag(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.name}"
 
+class LiveSessionManager(ShardedManager):
+    """Hides sessions that have been deleted but not yet reaped."""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class ChatSession(models.Model):
     """
     Represents a unique conversation thread (like a single chat in Gemini/ChatGPT).
     Now linked to a Django User and tags.
     """
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_sessions', null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_sessions', null=True, blank=True, db_constraint=False)
     session_id = models.CharField(max_length=100, unique=True, db_index=True, help_text="A unique ID for the conversation thread.")
     title = models.CharField(max_length=255, default="New Chat", help_text="User-given title for the chat session.")
-    tags = models.ManyToManyField(ChatTag, blank=True, related_name='sessions', help_text="Tags for organizing chats")
+    tags = models.ManyToManyField(ChatTag, blank=True, related_name='sessions', through='ChatSessionTag', help_text="Tags for organizing chats")
     created_at = models.DateTimeField(auto_now_add=True)
     last_activity = models.DateTimeField(auto_now=True)
+    is_archived = models.BooleanField(default=False, db_index=True, help_text="Messages moved to ArchivedSession.")
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text="Soft-deleted; rows are removed by reap_deletions.")
+    
+    objects = LiveSessionManager()
+    all_objects = ShardedManager()
     
     class Meta:
         ordering = ['-last_activity']
+        # Cascades and related lookups must still see soft-deleted sessions
+        base_manager_name = 'all_objects'
     
     def __str__(self):
         return f"Session: {self.title} ({self.session_id})"
 
+class ChatSessionTag(models.Model):
+    """
+    A tag on a session. The table ``ChatSession.tags`` has always used, made explicit
+    so the tag-first index can be declared: multi-tag filters and per-tag counts
+    look links up by tag and only need the session id.
+    """
+    # Both columns lead a composite index, so neither needs its own
+    chatsession = models.ForeignKey(ChatSession, on_delete=models.CASCADE, db_index=False)
+    chattag = models.ForeignKey(ChatTag, on_delete=models.CASCADE, db_index=False)
+
+    objects = ShardedManager()
+
+    class Meta:
+        db_table = 'chat_chatsession_tags'
+        unique_together = ('chatsession', 'chattag')
+        indexes = [models.Index(fields=['chattag', 'chatsession'], name='chat_sessiontag_tag_idx')]
+
 class Message(models.Model):
     """
     Represents a single message within a conversation thread.
     Now includes optional sources/citations.
     """
     session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages', help_text="The conversation thread this message belongs to.")
-    text_content = models.TextField(help_text="The content of the message.")
+    text_content = CompressedTextField(help_text="The content of the message (long values are stored compressed).")
     is_user = models.BooleanField(default=False, help_text="True if sent by the user, False if sent by Nicole.")
     message_type = models.CharField(max_length=10, default='text', help_text="e.g., 'text', 'image', 'chart'.")
     sources = models.JSONField(default=list, blank=True, help_text="List of citation sources from grounding.")
     timestamp = models.DateTimeField(auto_now_add=True)
     
+    objects = ShardedManager()
+    
     class Meta:
         ordering = ['timestamp']
     
@@ -54,6 +95,69 @@ class Message(models.Model):
         sender = "User" if self.is_user else "Nicole"
         return f"{sender} in {self.session.title}: {self.text_content[:50]}..."
 
+class ArchivedSession(models.Model):
+    """
+    Cold storage for an inactive session: all of its messages as one compressed
+    JSON blob. Rows are moved back into Message when the session is reopened.
+    """
+    session = models.OneToOneField(ChatSession, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    data = models.BinaryField(help_text="zlib-compressed JSON list of the session's messages.")
+    message_count = models.IntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedManager()
+    
+    def __str__(self):
+        return f"Archive of {self.session_id} ({self.message_count} messages)"
+
+class RetrievalSegment(models.Model):
+    """
+    One block of a user's retrieval index (see chat.retrieval): hashed-embedding
+    vectors of up to RETRIEVAL_SEGMENT_SIZE messages, packed as float16, with the
+    message and session id of each row packed as int64.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='retrieval_segments', db_constraint=False)
+    seq = models.IntegerField(help_text="Position of this block in the user's index.")
+    dim = models.IntegerField()
+    count = models.IntegerField(default=0)
+    last_message_id = models.BigIntegerField(default=0, help_text="Highest Message id indexed in this block.")
+    vectors = models.BinaryField()
+    message_ids = models.BinaryField()
+    session_ids = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        unique_together = ('user', 'seq')
+        ordering = ['seq']
+    
+    def __str__(self):
+        return f"Retrieval block {self.seq} of user {self.user_id} ({self.count} vectors)"
+
+class PromptCache(models.Model):
+    """
+    A Gemini cachedContents handle holding the system instruction and the start
+    of a session's history for one model (see chat.prompt_cache).
+    """
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='prompt_caches')
+    model = models.CharField(max_length=64)
+    name = models.CharField(max_length=200, help_text="Gemini resource name, e.g. cachedContents/abc123.")
+    prompt_hash = models.CharField(max_length=64, help_text="SHA-256 of the cached system instruction.")
+    last_message_id = models.BigIntegerField(help_text="Newest Message in the cached prefix.")
+    message_count = models.IntegerField(default=0)
+    token_count = models.IntegerField(default=0)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        unique_together = ('session', 'model')
+    
+    def __str__(self):
+        return f"{self.name} ({self.model}, {self.message_count} messages)"
+
 class APIUsageLog(models.Model):
     """Track API usage for rate limiting and analytics"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_usage')
@@ -62,6 +166,10 @@ class APIUsageLog(models.Model):
     response_time = models.FloatField(null=True, blank=True, help_text="Response time in seconds")
     status_code = models.IntegerField(default=200, help_text="HTTP status code")
     tokens_used = models.IntegerField(default=0, help_text="Approximate tokens used from API")
+    llm_model = models.CharField(max_length=50, blank=True, help_text="Model that answered (chat.model_routing)")
+    route = models.CharField(max_length=20, blank=True, help_text="Routing tier: light, standard or heavy")
+    route_reason = models.CharField(max_length=50, blank=True, help_text="Why the tier was chosen")
+    fallback = models.BooleanField(default=False, help_text="Answered by the tier's fallback model")
     
     class Meta:
         ordering = ['-timestamp']
@@ -72,6 +180,30 @@ class APIUsageLog(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.endpoint} - {self.timestamp}"
 
+class DeletionJob(models.Model):
+    """
+    A soft-deleted account or session whose rows are still being removed
+    in batches by the reap_deletions command.
+    """
+    KIND_CHOICES = [('account', 'Account'), ('session', 'Session')]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Plain ids: the target rows are deleted before the job finishes
+    user_id = models.BigIntegerField(db_index=True)
+    session_pk = models.BigIntegerField(null=True, blank=True)
+    rows_deleted = models.BigIntegerField(default=0)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+    
+    class Meta:
+        ordering = ['requested_at']
+    
+    def __str__(self):
+        state = "done" if self.finished_at else "pending"
+        target = f"session {self.session_pk}" if self.kind == 'session' else f"user {self.user_id}"
+        return f"Delete {target} ({state}, {self.rows_deleted} rows)"
+
 class RateLimitConfig(models.Model):
     """Configure rate limits per user"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='rate_limit_config')
@@ -83,6 +215,7 @@ class RateLimitConfig(models.Model):
     api_calls_per_minute = models.IntegerField(default=5, help_text="Max API calls per minute")
     # Account created date (for Pro tier calculation)
     is_premium = models.BooleanField(default=False, help_text="Is this a premium user?")
+    quota_reset_at = models.DateTimeField(null=True, blank=True, help_text="Usage before this time doesn't count against the limits")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -90,43 +223,56 @@ class RateLimitConfig(models.Model):
         tier = "Premium" if self.is_premium else "Free"
         return f"{self.user.username} - {tier} Tier"
     
+    # Free-tier limits used until a row is written for the user
+    DEFAULT_LIMITS = {
+        'messages_per_hour': 30,
+        'messages_per_day': 200,
+        'api_calls_per_minute': 5,
+        'is_premium': False,
+        'quota_reset_at': None,
+    }
+
     @classmethod
     def get_or_create_default(cls, user):
         """Get or create default rate limit config for user"""
-        config, created = cls.objects.get_or_create(
-            user=user,
-            defaults={
-                'messages_per_hour': 30,
-                'messages_per_day': 200,
-                'api_calls_per_minute': 5,
-            }
-        )
+        config, created = cls.objects.get_or_create(user=user, defaults=cls.DEFAULT_LIMITS)
         return config
 
-    def get_usage_stats(self):
-        """Get current usage stats"""
+    @classmethod
+    async def aget_or_create_default(cls, user):
+        """Async version of get_or_create_default"""
+        config, created = await cls.objects.aget_or_create(user=user, defaults=cls.DEFAULT_LIMITS)
+        return config
+
+    @classmethod
+    def limits_for(cls, user_id):
+        """Stored limits for a user, or the tier defaults if no row exists (never creates one)"""
+        row = cls.objects.filter(user_id=user_id).values(*cls.DEFAULT_LIMITS).first()
+        return row or dict(cls.DEFAULT_LIMITS)
+
+    @classmethod
+    async def alimits_for(cls, user_id):
+        """Async version of limits_for"""
+        row = await cls.objects.filter(user_id=user_id).values(*cls.DEFAULT_LIMITS).afirst()
+        return row or dict(cls.DEFAULT_LIMITS)
+
+    def _usage_counts(self):
+        """Usage log queryset and counts for the hour, day and minute windows (one query over the day)"""
         now = timezone.now()
         hour_ago = now - timedelta(hours=1)
         day_ago = now - timedelta(days=1)
         minute_ago = now - timedelta(minutes=1)
+        if self.quota_reset_at:
+            # An admin reset the quota: earlier usage is forgiven
+            hour_ago, day_ago, minute_ago = (max(t, self.quota_reset_at) for t in (hour_ago, day_ago, minute_ago))
         
-        messages_this_hour = APIUsageLog.objects.filter(
-            user=self.user,
-            endpoint='chat',
-            timestamp__gte=hour_ago
-        ).count()
-        
-        messages_this_day = APIUsageLog.objects.filter(
-            user=self.user,
-            endpoint='chat',
-            timestamp__gte=day_ago
-        ).count()
-        
-        calls_this_minute = APIUsageLog.objects.filter(
-            user=self.user,
-            timestamp__gte=minute_ago
-        ).count()
-        
+        return APIUsageLog.objects.filter(user_id=self.user_id, timestamp__gte=day_ago), {
+            'messages_this_hour': models.Count('pk', filter=models.Q(endpoint='chat', timestamp__gte=hour_ago)),
+            'messages_this_day': models.Count('pk', filter=models.Q(endpoint='chat')),
+            'calls_this_minute': models.Count('pk', filter=models.Q(timestamp__gte=minute_ago)),
+        }
+
+    def _build_usage_stats(self, messages_this_hour, messages_this_day, calls_this_minute):
         return {
             'messages_this_hour': messages_this_hour,
             'messages_per_hour_limit': self.messages_per_hour,
@@ -140,4 +286,47 @@ class RateLimitConfig(models.Model):
                 calls_this_minute >= self.api_calls_per_minute
             )
         }
-    
\ No newline at end of file
+
+    def get_usage_stats(self):
+        """Get current usage stats"""
+        logs, counts = self._usage_counts()
+        return self._build_usage_stats(**logs.aggregate(**counts))
+
+    async def aget_usage_stats(self):
+        """Async version of get_usage_stats"""
+        logs, counts = self._usage_counts()
+        return self._build_usage_stats(**await logs.aaggregate(**counts))
+
+class ShardAssignment(models.Model):
+    """
+    Shard directory: which database holds a user's chat data (see chat.sharding).
+    Rows are created from the hash ring on first use and changed by move_user_shard.
+    """
+    user_id = models.BigIntegerField(primary_key=True)
+    shard = models.CharField(max_length=50, help_text="Database alias, e.g. 'shard_0' or 'default'.")
+    moving = models.BooleanField(default=False, help_text="Writes are refused while move_user_shard syncs the last changes.")
+    assigned_at = models.DateTimeField(auto_now_add=True)
+    moved_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"User {self.user_id} -> {self.shard}"
+
+class UserStats(models.Model):
+    """
+    Running totals for a user's profile and usage pages (see chat.stats).
+    Adjusted in place by the write paths; rebuild_user_stats recomputes them.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    sessions = models.IntegerField(default=0, help_text="Live (not deleted) chat sessions, archived included")
+    messages = models.IntegerField(default=0, help_text="Messages in live sessions, archived included")
+    tokens_used = models.BigIntegerField(default=0, help_text="Sum of APIUsageLog.tokens_used")
+    tags = models.IntegerField(default=0)
+    first_activity = models.DateTimeField(null=True, blank=True)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'user stats'
+    
+    def __str__(self):
+        return f"Stats for user {self.user_id}: {self.sessions} sessions, {self.messages} messages"
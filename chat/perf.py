@@ -0,0 +1,142 @@
+"""
+Per-request performance instrumentation.
+
+A ``RequestTimings`` object lives in a context variable for the duration of a
+request. Views mark expensive sections with ``span('llm')``; every SQL query
+run on any connection is timed by a wrapper installed when the connection is
+created, so DB time is collected for sync and async views alike.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.db.backends.signals import connection_created
+
+MAX_RECORDED_QUERIES = 200
+
+_current = contextvars.ContextVar('chat_request_timings', default=None)
+
+
+class RequestTimings:
+    """Accumulated span durations and DB statistics for one request."""
+
+    __slots__ = ('start', 'spans', 'db_time', 'db_count', 'queries', 'queue_ms')
+
+    def __init__(self, queue_ms=None):
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.db_time = 0.0
+        self.db_count = 0
+        self.queries = []
+        self.queue_ms = queue_ms
+
+    def add(self, name, seconds):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+    def add_query(self, sql, seconds):
+        self.db_time += seconds
+        self.db_count += 1
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append((sql, seconds))
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        """Render the collected timings as a Server-Timing header value."""
+        parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.db_count} queries"']
+        for name, (seconds, _) in self.spans.items():
+            parts.append(f'{name};dur={seconds * 1000:.1f}')
+        if self.queue_ms is not None:
+            parts.append(f'queue;dur={self.queue_ms:.1f}')
+        parts.append(f'total;dur={self.total_ms:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self, include_queries=False):
+        data = {
+            'total_ms': round(self.total_ms, 2),
+            'db_ms': round(self.db_time * 1000, 2),
+            'db_queries': self.db_count,
+            'spans': {name: round(seconds * 1000, 2) for name, (seconds, _) in self.spans.items()},
+        }
+        if self.queue_ms is not None:
+            data['queue_ms'] = round(self.queue_ms, 2)
+        if include_queries:
+            data['queries'] = [{'sql': sql, 'ms': round(seconds * 1000, 2)} for sql, seconds in self.queries]
+        return data
+
+
+def begin(queue_ms=None):
+    """Start collecting timings for the current request; returns (timings, token)."""
+    timings = RequestTimings(queue_ms)
+    return timings, _current.set(timings)
+
+
+def end(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Time a block of code and attribute it to ``name`` in the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def record(name, seconds):
+    """Attribute an externally measured duration to ``name``."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver: time every query on the new connection."""
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(install_query_timer, dispatch_uid='chat.perf.install_query_timer')
+
+
+def parse_request_start(value, now=None):
+    """
+    Milliseconds a request waited in front of the app, from an ``X-Request-Start``
+    header set by the load balancer (``t=<epoch>`` in s, ms or us).
+    """
+    if not value:
+        return None
+    try:
+        started = float(value.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    now = time.time() if now is None else now
+    return max(0.0, (now - started) * 1000)
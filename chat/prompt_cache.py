@@ -0,0 +1,187 @@
+"""
+Gemini context caching for long chats.
+
+The system instruction and the start of a session's history are uploaded once
+as a ``cachedContents`` resource; later turns send the handle and only the
+messages after the cached prefix, so the same prefix is not re-sent and
+re-processed on every turn. One ``PromptCache`` row per session and model
+records the handle, the newest cached message and when the handle expires.
+
+A handle is reused while its newest message is still in the history window
+and at most ``PROMPT_CACHE_MAX_TAIL`` messages follow it, and is extended when
+less than half of ``PROMPT_CACHE_TTL`` is left. Once the tail is longer, the
+system instruction has changed or the handle is about to expire, a new handle
+is created for the current history and the old one deleted. Histories
+estimated under the model's minimum (``min_tokens``) are sent in full without
+touching the database.
+
+Caching never fails a turn: if creating a handle fails the model is not tried
+again for ``PROMPT_CACHE_RETRY_AFTER`` seconds (per worker process), and a
+turn whose handle Gemini no longer knows is sent again in full.
+"""
+import hashlib
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from . import gemini, metrics
+from .models import PromptCache
+
+# generateContent statuses for a handle that has expired or been deleted
+STALE_STATUSES = (400, 403, 404)
+
+# model -> time.monotonic() until which no handles are created for it
+_unavailable = {}
+
+
+def estimate_tokens(text):
+    # About four characters per token for English text
+    return len(text) // 4
+
+
+def min_tokens(model):
+    """Smallest prefix Gemini will cache for ``model``."""
+    matches = [prefix for prefix in settings.PROMPT_CACHE_MODEL_MIN_TOKENS if model.startswith(prefix)]
+    if not matches:
+        return settings.PROMPT_CACHE_MIN_TOKENS
+    return settings.PROMPT_CACHE_MODEL_MIN_TOKENS[max(matches, key=len)]
+
+
+def format_contents(messages):
+    return [
+        {'role': 'user' if msg.is_user else 'model', 'parts': [{'text': msg.text_content}]}
+        for msg in messages
+    ]
+
+
+@dataclass
+class Handle:
+    pk: int
+    name: str
+    model: str
+    covered: int
+    context: str = ''
+
+    def apply(self, payload):
+        """
+        ``payload`` (built for a full request) with the first ``covered`` messages and the
+        system instruction replaced by the handle. The cached instruction can't change per
+        turn, so per-turn ``context`` (retrieval snippets) goes in front of the newest message.
+        """
+        contents = payload['contents'][self.covered:]
+        if self.context:
+            last = contents[-1]
+            contents = contents[:-1] + [{**last, 'parts': [{'text': self.context}, *last['parts']]}]
+        request = {key: value for key, value in payload.items() if key not in ('contents', 'systemInstruction')}
+        return {**request, 'contents': contents, 'cachedContent': self.name}
+
+
+async def aprepare(session, model, system_prompt, history, context=''):
+    """
+    A ``Handle`` for answering the last message of ``history`` with ``model``, reusing,
+    extending or creating the session's cache as needed; None to send the turn in full.
+    """
+    prefix = history[:-1]
+    if not prefix or estimate_tokens(system_prompt + ''.join(msg.text_content for msg in prefix)) \
+            < min_tokens(model):
+        return None
+
+    prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()
+    now = timezone.now()
+    row = await PromptCache.objects.filter(session=session, model=model).afirst()
+    # The handle must outlive the request that uses it
+    if row and row.prompt_hash == prompt_hash and row.expires_at > now + timedelta(seconds=settings.GEMINI_TIMEOUT):
+        ids = [msg.pk for msg in history]
+        covered = ids.index(row.last_message_id) + 1 if row.last_message_id in ids else 0
+        if 0 < covered < len(history) and len(history) - covered <= settings.PROMPT_CACHE_MAX_TAIL:
+            if row.expires_at - now > timedelta(seconds=settings.PROMPT_CACHE_TTL / 2) or await _extend(row):
+                metrics.PROMPT_CACHE_EVENTS.inc(model=model, event='hit')
+                return Handle(row.pk, row.name, model, covered, context)
+
+    if _unavailable.get(model, 0) > time.monotonic():
+        return None
+    return await _create(session, model, system_prompt, prompt_hash, prefix, row, context)
+
+
+async def _extend(row):
+    """Push the handle's expiry out by a full TTL; False if Gemini no longer has it."""
+    try:
+        response = await gemini.update_cached_content(row.name, settings.PROMPT_CACHE_TTL)
+    except httpx.HTTPError:
+        # Still valid for a while; try again next turn
+        return True
+    if response.status_code != 200:
+        return False
+    row.expires_at = timezone.now() + timedelta(seconds=settings.PROMPT_CACHE_TTL)
+    await row.asave(update_fields=['expires_at'])
+    metrics.PROMPT_CACHE_EVENTS.inc(model=row.model, event='extended')
+    return True
+
+
+async def _create(session, model, system_prompt, prompt_hash, prefix, row, context):
+    try:
+        response = await gemini.create_cached_content({
+            'model': f'models/{model}',
+            'systemInstruction': {'parts': [{'text': system_prompt}]},
+            'contents': format_contents(prefix),
+            'ttl': f'{settings.PROMPT_CACHE_TTL}s',
+        })
+    except httpx.HTTPError:
+        response = None
+    if response is None or response.status_code != 200:
+        _unavailable[model] = time.monotonic() + settings.PROMPT_CACHE_RETRY_AFTER
+        metrics.PROMPT_CACHE_EVENTS.inc(model=model, event='error')
+        return None
+
+    data = response.json()
+    fields = {
+        'name': data['name'],
+        'prompt_hash': prompt_hash,
+        'last_message_id': prefix[-1].pk,
+        'message_count': len(prefix),
+        'token_count': data.get('usageMetadata', {}).get('totalTokenCount', 0),
+        'expires_at': timezone.now() + timedelta(seconds=settings.PROMPT_CACHE_TTL),
+    }
+    if row is None:
+        try:
+            row = await PromptCache.objects.acreate(session=session, model=model, **fields)
+            metrics.PROMPT_CACHE_EVENTS.inc(model=model, event='created')
+            return Handle(row.pk, row.name, model, len(prefix), context)
+        except IntegrityError:
+            # A concurrent turn created one first; replace it
+            row = await PromptCache.objects.aget(session=session, model=model)
+    old_name = row.name
+    for field, value in fields.items():
+        setattr(row, field, value)
+    await row.asave()
+    await adelete_remote(old_name)
+    metrics.PROMPT_CACHE_EVENTS.inc(model=model, event='refreshed')
+    return Handle(row.pk, row.name, model, len(prefix), context)
+
+
+async def adelete_remote(name):
+    """Delete a handle on Gemini; failures are ignored since it expires anyway."""
+    try:
+        await gemini.delete_cached_content(name)
+    except httpx.HTTPError:
+        pass
+
+
+async def generate_content(model, payload, handle=None, on_chunk=None):
+    """
+    ``gemini.generate_content`` through ``handle`` when it was made for ``model``. A
+    stale handle is forgotten and the full ``payload`` sent instead.
+    """
+    if handle is None or handle.model != model:
+        return await gemini.generate_content(model, payload, on_chunk)
+    response = await gemini.generate_content(model, handle.apply(payload), on_chunk)
+    if response.status_code not in STALE_STATUSES:
+        return response
+    metrics.PROMPT_CACHE_EVENTS.inc(model=model, event='stale')
+    await PromptCache.objects.filter(pk=handle.pk, name=handle.name).adelete()
+    return await gemini.generate_content(model, payload, on_chunk)
@@ -1,55 +1,176 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
 from .models import APIUsageLog, RateLimitConfig
+from .metrics import CACHE_REQUESTS, RATE_LIMIT_REJECTIONS
+from .sqlite import ainsert, insert
+from . import stats as user_stats
+from .utils import shared_cache
 import time
 
+# Per-process layer in front of the shared cache: user_id -> (expires_at, limits)
+_local_configs = {}
+_LOCAL_MAX_ENTRIES = 10000
+
+
+def _config_cache_key(user_id):
+    return f'ratelimit:config:{user_id}'
+
+
+def _config_cache_ttl():
+    # A per-process cache never sees invalidations from the worker that handled the
+    # admin edit, so it may not outlive the local tier
+    if shared_cache():
+        return settings.RATE_LIMIT_CACHE_TTL
+    return min(settings.RATE_LIMIT_CACHE_TTL, settings.RATE_LIMIT_LOCAL_TTL)
+
 class RateLimiter:
     """Handle rate limiting logic"""
-    
+
     @staticmethod
     def check_rate_limit(user):
         """
         Check if user has exceeded rate limits
         Returns: (is_limited: bool, message: str, stats: dict)
         """
-        config = RateLimitConfig.get_or_create_default(user)
+        config = RateLimiter.get_config(user)
         stats = config.get_usage_stats()
-        
+        return RateLimiter._limit_result(config, stats)
+
+    @staticmethod
+    async def acheck_rate_limit(user):
+        """Async version of check_rate_limit"""
+        config = await RateLimiter.aget_config(user)
+        stats = await config.aget_usage_stats()
+        return RateLimiter._limit_result(config, stats)
+
+    @staticmethod
+    def get_config(user):
+        """
+        Resolve the user's limits through the per-process and shared caches.
+        Returns an unsaved RateLimitConfig; rows are only created by writes.
+        """
+        limits = RateLimiter._local_config(user.pk)
+        if limits is None:
+            key = _config_cache_key(user.pk)
+            limits = cache.get(key)
+            if limits is None:
+                CACHE_REQUESTS.inc(cache='ratelimit_shared', result='miss')
+                limits = RateLimitConfig.limits_for(user.pk)
+                cache.set(key, limits, _config_cache_ttl())
+            else:
+                CACHE_REQUESTS.inc(cache='ratelimit_shared', result='hit')
+            RateLimiter._store_local_config(user.pk, limits)
+        return RateLimitConfig(user_id=user.pk, **limits)
+
+    @staticmethod
+    async def aget_config(user):
+        """Async version of get_config"""
+        limits = RateLimiter._local_config(user.pk)
+        if limits is None:
+            key = _config_cache_key(user.pk)
+            limits = await cache.aget(key)
+            if limits is None:
+                CACHE_REQUESTS.inc(cache='ratelimit_shared', result='miss')
+                limits = await RateLimitConfig.alimits_for(user.pk)
+                await cache.aset(key, limits, _config_cache_ttl())
+            else:
+                CACHE_REQUESTS.inc(cache='ratelimit_shared', result='hit')
+            RateLimiter._store_local_config(user.pk, limits)
+        return RateLimitConfig(user_id=user.pk, **limits)
+
+    @staticmethod
+    def invalidate_config(user_id):
+        """Drop cached limits for a user (called when their RateLimitConfig changes)"""
+        _local_configs.pop(user_id, None)
+        cache.delete(_config_cache_key(user_id))
+
+    @staticmethod
+    def invalidate_configs(user_ids):
+        """``invalidate_config`` for many users with one cache round trip (admin bulk actions)"""
+        for user_id in user_ids:
+            _local_configs.pop(user_id, None)
+        cache.delete_many([_config_cache_key(user_id) for user_id in user_ids])
+
+    @staticmethod
+    def _local_config(user_id):
+        entry = _local_configs.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            CACHE_REQUESTS.inc(cache='ratelimit_local', result='hit')
+            return entry[1]
+        CACHE_REQUESTS.inc(cache='ratelimit_local', result='miss')
+        return None
+
+    @staticmethod
+    def _store_local_config(user_id, limits):
+        if len(_local_configs) >= _LOCAL_MAX_ENTRIES:
+            _local_configs.clear()
+        _local_configs[user_id] = (time.monotonic() + settings.RATE_LIMIT_LOCAL_TTL, limits)
+
+    @staticmethod
+    def _limit_result(config, stats):
         if stats['is_rate_limited']:
             if stats['messages_this_hour'] >= config.messages_per_hour:
+                RATE_LIMIT_REJECTIONS.inc(reason='hour')
                 reset_time = timezone.now() + timedelta(hours=1)
                 return True, f"⏳ Hourly limit reached ({config.messages_per_hour} messages). Reset at {reset_time.strftime('%H:%M')}", stats
-            
+
             if stats['messages_this_day'] >= config.messages_per_day:
+                RATE_LIMIT_REJECTIONS.inc(reason='day')
                 reset_time = timezone.now() + timedelta(days=1)
                 return True, f"⏳ Daily limit reached ({config.messages_per_day} messages). Reset at {reset_time.strftime('%H:%M')}", stats
-            
+
             if stats['calls_this_minute'] >= config.api_calls_per_minute:
+                RATE_LIMIT_REJECTIONS.inc(reason='minute')
                 return True, f"⚡ Too many requests. Please wait before sending another message.", stats
-        
+
         return False, None, stats
-    
+
     @staticmethod
-    def log_api_usage(user, endpoint, response_time=None, status_code=200, tokens_used=0):
-        """Log API usage for tracking"""
-        APIUsageLog.objects.create(
+    def log_api_usage(user, endpoint, response_time=None, status_code=200, tokens_used=0, **routing):
+        """Log API usage for tracking; ``routing`` holds the model routing fields"""
+        insert(
+            APIUsageLog,
             user=user,
             endpoint=endpoint,
             response_time=response_time,
             status_code=status_code,
-            tokens_used=tokens_used
+            tokens_used=tokens_used,
+            **routing
         )
-    
+
+    @staticmethod
+    async def alog_api_usage(user, endpoint, response_time=None, status_code=200, tokens_used=0, **routing):
+        """Async version of log_api_usage"""
+        await ainsert(
+            APIUsageLog,
+            user=user,
+            endpoint=endpoint,
+            response_time=response_time,
+            status_code=status_code,
+            tokens_used=tokens_used,
+            **routing
+        )
+
     @staticmethod
     def get_user_stats(user):
         """Get detailed usage stats for user"""
-        config = RateLimitConfig.get_or_create_default(user)
-        stats = config.get_usage_stats()
-        
+        config = RateLimiter.get_config(user)
+        return RateLimiter._format_user_stats(config, config.get_usage_stats(), user_stats.get(user.pk))
+
+    @staticmethod
+    async def aget_user_stats(user):
+        """Async version of get_user_stats"""
+        config = await RateLimiter.aget_config(user)
+        return RateLimiter._format_user_stats(config, await config.aget_usage_stats(), await user_stats.aget(user.pk))
+
+    @staticmethod
+    def _format_user_stats(config, stats, totals):
         # Calculate percentages
         hour_percentage = (stats['messages_this_hour'] / stats['messages_per_hour_limit']) * 100
         day_percentage = (stats['messages_this_day'] / stats['messages_per_day_limit']) * 100
-        
+
         return {
             'tier': 'Premium' if config.is_premium else 'Free',
             'messages_hour': {
@@ -62,5 +183,13 @@ class RateLimiter:
                 'limit': stats['messages_per_day_limit'],
                 'percentage': min(day_percentage, 100)
             },
-            'is_rate_limited': stats['is_rate_limited']
-        }
\ No newline at end of file
+            'is_rate_limited': stats['is_rate_limited'],
+            'totals': {
+                'sessions': totals.sessions,
+                'messages': totals.messages,
+                'tokens_used': totals.tokens_used,
+                'tags': totals.tags,
+                'first_activity': totals.first_activity,
+                'last_activity': totals.last_activity,
+            }
+        }
@@ -0,0 +1,365 @@
+"""
+Retrieval over a user's past chats.
+
+Every message is embedded with feature hashing: word unigrams and bigrams are
+hashed (signed) into ``RETRIEVAL_DIM`` buckets with sublinear term weights and
+the vector is L2-normalised, so it needs no model, vocabulary or network.
+Vectors are stored per user in ``RetrievalSegment`` blocks, packed as float16,
+next to the messages on the user's shard. A query is one matrix-vector product
+over the user's vectors and an ``argpartition`` for the top-k.
+
+Each process keeps recently used indexes as float32 matrices (up to
+``RETRIEVAL_INDEX_CACHE_MB``), so a lookup costs one query to compare the
+stored watermark with the cached one; a changed index is reloaded. Lookups
+never embed: once a chat turn has committed, a background thread embeds the
+messages newer than the highest indexed id (``schedule_update``), and the
+``build_retrieval_index`` command builds or rebuilds indexes offline. Hits from
+deleted sessions are dropped when the messages are loaded.
+"""
+import logging
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, Max
+
+from . import metrics
+from .models import Message, RetrievalSegment
+from .sharding import shard_for_user
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in into is it its just me my
+no not of on or our so than that the their them then there these they this to too was we were what
+when where which who why will with would you your
+""".split())
+
+
+@dataclass
+class Snippet:
+    message_id: int
+    session_title: str
+    is_user: bool
+    text: str
+    score: float
+
+
+# ==================== EMBEDDING ====================
+
+def _features(text):
+    words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def embed(texts, dim=None):
+    """float32 matrix of L2-normalised hashed embeddings, one row per text."""
+    dim = dim or settings.RETRIEVAL_DIM
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        features = _features(text)
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in features), dtype=np.uint32,
+                             count=len(features))
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+        np.add.at(matrix[row], hashes % dim, signs)
+    # Sublinear term frequency, keeping the hash sign
+    matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+# ==================== INDEX ====================
+
+class UserIndex:
+    """A user's index loaded from its segments: float32 vectors with message and session ids."""
+
+    def __init__(self, user_id, using, segments):
+        self.user_id = user_id
+        self.using = using
+        self.segments = segments
+        self.dim = settings.RETRIEVAL_DIM
+        self._update_lock = threading.Lock()
+        usable = [s for s in segments if s.dim == self.dim]
+        if usable:
+            self.vectors = np.concatenate([
+                np.frombuffer(bytes(s.vectors), dtype=np.float16).reshape(-1, self.dim) for s in usable
+            ]).astype(np.float32)
+            self.message_ids = np.concatenate([np.frombuffer(bytes(s.message_ids), dtype=np.int64) for s in usable])
+            self.session_ids = np.concatenate([np.frombuffer(bytes(s.session_ids), dtype=np.int64) for s in usable])
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self.message_ids = self.session_ids = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def load(cls, user_id, using=None):
+        using = using or shard_for_user(user_id)
+        segments = list(RetrievalSegment.objects.using(using).filter(user_id=user_id).order_by('seq'))
+        return cls(user_id, using, segments)
+
+    @property
+    def watermark(self):
+        return max((s.last_message_id for s in self.segments), default=0)
+
+    @property
+    def nbytes(self):
+        return sum(len(s.vectors) + len(s.message_ids) + len(s.session_ids) for s in self.segments)
+
+    def update(self, limit=None):
+        """Embed messages newer than the watermark; returns how many were added (0 if another worker was first)."""
+        with self._update_lock:
+            return self._update(limit)
+
+    def _update(self, limit):
+        if any(s.dim != self.dim for s in self.segments):
+            raise ValueError(f"Index of user {self.user_id} was built with another RETRIEVAL_DIM; rebuild it")
+        limit = limit or settings.RETRIEVAL_UPDATE_LIMIT
+        rows = list(
+            Message.objects.using(self.using)
+            .filter(session__user_id=self.user_id, session__deleted_at__isnull=True, pk__gt=self.watermark)
+            .order_by('pk').values_list('pk', 'session_id', 'text_content')[:limit]
+        )
+        if not rows:
+            return 0
+        vectors = embed([text for _, _, text in rows], self.dim)
+        message_ids = np.array([pk for pk, _, _ in rows], dtype=np.int64)
+        session_ids = np.array([sid for _, sid, _ in rows], dtype=np.int64)
+        if not self._append(vectors, message_ids, session_ids):
+            # Our copy of the last segment was filled but not saved: load afresh next time
+            forget_index(self.user_id, self.using)
+            return 0
+        # Ids before vectors: a concurrent search() reads vectors first, so every row it sees has ids
+        self.message_ids = np.concatenate([self.message_ids, message_ids])
+        self.session_ids = np.concatenate([self.session_ids, session_ids])
+        self.vectors = np.concatenate([self.vectors, vectors])
+        metrics.RETRIEVAL_INDEXED.inc(len(rows))
+        return len(rows)
+
+    def _append(self, vectors, message_ids, session_ids):
+        """Write new rows into the last segment and new ones; False if another worker got there first."""
+        size = settings.RETRIEVAL_SEGMENT_SIZE
+        last = self.segments[-1] if self.segments else None
+        changed, created = [], []
+        start = 0
+        if last is not None and last.count < size:
+            take = min(size - last.count, len(vectors))
+            changed.append((last, last.last_message_id))
+            self._fill(last, vectors[:take], message_ids[:take], session_ids[:take])
+            start = take
+        seq = last.seq + 1 if last is not None else 0
+        while start < len(vectors):
+            segment = RetrievalSegment(user_id=self.user_id, seq=seq, dim=self.dim, vectors=b'',
+                                       message_ids=b'', session_ids=b'')
+            end = start + size
+            self._fill(segment, vectors[start:end], message_ids[start:end], session_ids[start:end])
+            created.append(segment)
+            start, seq = end, seq + 1
+        # One statement needs no transaction of its own; only a fill-and-extend does
+        atomic = transaction.atomic(using=self.using) if changed and created else nullcontext()
+        try:
+            with atomic:
+                for segment, previous in changed:
+                    # Only if nobody else appended to it since we loaded it
+                    updated = RetrievalSegment.objects.using(self.using).filter(
+                        pk=segment.pk, last_message_id=previous,
+                    ).update(count=segment.count, last_message_id=segment.last_message_id,
+                             vectors=segment.vectors, message_ids=segment.message_ids,
+                             session_ids=segment.session_ids)
+                    if not updated:
+                        raise IntegrityError("segment changed concurrently")
+                RetrievalSegment.objects.using(self.using).bulk_create(created)
+        except IntegrityError:
+            return False
+        self.segments.extend(created)
+        return True
+
+    @staticmethod
+    def _fill(segment, vectors, message_ids, session_ids):
+        segment.vectors = bytes(segment.vectors) + vectors.astype(np.float16).tobytes()
+        segment.message_ids = bytes(segment.message_ids) + message_ids.tobytes()
+        segment.session_ids = bytes(segment.session_ids) + session_ids.tobytes()
+        segment.count += len(vectors)
+        segment.last_message_id = int(message_ids[-1])
+
+    def search(self, text, k=None, exclude_ids=(), min_score=None):
+        """[(message_id, score)] of the ``k`` best matches, best first."""
+        k = k or settings.RETRIEVAL_TOP_K
+        min_score = settings.RETRIEVAL_MIN_SCORE if min_score is None else min_score
+        vectors = self.vectors
+        message_ids = self.message_ids[:len(vectors)]
+        if not len(vectors):
+            return []
+        scores = vectors @ embed([text], self.dim)[0]
+        if exclude_ids:
+            scores[np.isin(message_ids, np.fromiter(exclude_ids, dtype=np.int64))] = -1.0
+        # Over-fetch: some hits may belong to deleted sessions or repeat the same text
+        top = min(len(scores), k * 3)
+        candidates = np.argpartition(-scores, top - 1)[:top]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(message_ids[i]), float(scores[i])) for i in candidates if scores[i] >= min_score]
+
+
+def delete_index(user_id, using=None):
+    using = using or shard_for_user(user_id)
+    RetrievalSegment.objects.using(using).filter(user_id=user_id).delete()
+    forget_index(user_id, using)
+
+
+# ==================== PER-PROCESS CACHE ====================
+
+# (alias, user_id) -> UserIndex, least recently used first
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _stored_state(user_id, using):
+    """(watermark, segment count) of the stored index; any append or rebuild changes it."""
+    state = RetrievalSegment.objects.using(using).filter(user_id=user_id).aggregate(
+        watermark=Max('last_message_id'), segments=Count('pk'),
+    )
+    return state['watermark'] or 0, state['segments']
+
+
+def get_index(user_id, using=None):
+    """The user's index from this process's cache, reloaded if it changed in the database."""
+    using = using or shard_for_user(user_id)
+    key = (using, user_id)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+    if index is not None and (index.watermark, len(index.segments)) == _stored_state(user_id, using):
+        metrics.CACHE_REQUESTS.inc(cache='retrieval_index', result='hit')
+        return index
+    metrics.CACHE_REQUESTS.inc(cache='retrieval_index', result='miss')
+    index = UserIndex.load(user_id, using)
+    budget = settings.RETRIEVAL_INDEX_CACHE_MB * 1024 * 1024
+    with _indexes_lock:
+        _indexes[key] = index
+        total = sum(cached.vectors.nbytes for cached in _indexes.values())
+        while total > budget and _indexes:
+            _, evicted = _indexes.popitem(last=False)
+            total -= evicted.vectors.nbytes
+    return index
+
+
+def forget_index(user_id, using=None):
+    using = using or shard_for_user(user_id)
+    with _indexes_lock:
+        _indexes.pop((using, user_id), None)
+
+
+# ==================== BACKGROUND UPDATES ====================
+
+def update_index(user_id, limit=None):
+    """Embed the user's messages newer than the index watermark; returns how many were added."""
+    start = time.perf_counter()
+    added = get_index(user_id).update(limit)
+    metrics.RETRIEVAL_LATENCY.observe(time.perf_counter() - start, stage='update')
+    return added
+
+
+class Indexer:
+    """One thread per process that brings users' indexes up to date, each pending user once."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, user_id):
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='retrieval-indexer', daemon=True)
+                self._thread.start()
+        self._queue.put(user_id)
+        metrics.QUEUE_DEPTH.set(self._queue.qsize(), queue='retrieval_index')
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(user_id)
+            metrics.QUEUE_DEPTH.set(self._queue.qsize(), queue='retrieval_index')
+            close_old_connections()
+            try:
+                # Large backlogs go in RETRIEVAL_UPDATE_LIMIT steps
+                while update_index(user_id) >= settings.RETRIEVAL_UPDATE_LIMIT:
+                    pass
+            except Exception:
+                logger.exception("Retrieval index update for user %s failed", user_id)
+
+
+indexer = Indexer()
+
+
+def schedule_update(user_id):
+    """Index the user's new messages in the background once the current transaction commits."""
+    transaction.on_commit(lambda: indexer.submit(user_id), using=shard_for_user(user_id))
+
+
+aschedule_update = sync_to_async(schedule_update)
+
+
+# ==================== CONTEXT ====================
+
+def related_snippets(user_id, text, exclude_ids=(), k=None):
+    """Up to ``k`` snippets of earlier, already indexed messages similar to ``text``."""
+    k = k or settings.RETRIEVAL_TOP_K
+    start = time.perf_counter()
+    index = get_index(user_id)
+    loaded = time.perf_counter()
+    hits = index.search(text, k=k, exclude_ids=exclude_ids)
+    rows = {
+        row['pk']: row for row in Message.objects.using(index.using).filter(
+            pk__in=[pk for pk, _ in hits], session__deleted_at__isnull=True,
+        ).values('pk', 'text_content', 'is_user', 'session__title')
+    }
+    snippets, seen = [], set()
+    limit = settings.RETRIEVAL_SNIPPET_CHARS
+    for pk, score in hits:
+        row = rows.get(pk)
+        if row is None or row['text_content'] in seen:
+            continue
+        seen.add(row['text_content'])
+        snippet_text = row['text_content'] if len(row['text_content']) <= limit else row['text_content'][:limit] + '…'
+        snippets.append(Snippet(pk, row['session__title'], row['is_user'], snippet_text, score))
+        if len(snippets) >= k:
+            break
+    metrics.RETRIEVAL_LATENCY.observe(loaded - start, stage='load')
+    metrics.RETRIEVAL_LATENCY.observe(time.perf_counter() - loaded, stage='search')
+    return snippets
+
+
+arelated_snippets = sync_to_async(related_snippets)
+
+
+def format_snippets(snippets):
+    """System-prompt section listing retrieved snippets, or '' if there are none."""
+    if not snippets:
+        return ''
+    lines = [
+        "Excerpts from the student's earlier conversations that may be relevant "
+        "(refer to them only if they help answer the current question):"
+    ]
+    for snippet in snippets:
+        speaker = 'Student' if snippet.is_user else 'Nicole'
+        lines.append(f'- [{snippet.session_title}] {speaker}: {snippet.text}')
+    return '\n'.join(lines)
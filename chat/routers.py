@@ -0,0 +1,161 @@
+"""
+Read-replica routing.
+
+When ``DATABASE_REPLICA_URL`` is set, views decorated with ``use_replica`` read
+from the ``replica`` alias; everything else, and every write, uses ``default``.
+Reads fall back to the primary when:
+
+* the request has already written (read-your-writes within the request; writes
+  routed by ``ShardRouter`` count too),
+* the client wrote within the last ``REPLICA_PIN_SECONDS`` (``ReplicaPinMiddleware``
+  sets a short-lived cookie, so this works across workers), or
+* the replica lags by more than ``REPLICA_MAX_LAG_SECONDS`` or is unreachable.
+
+For local testing point ``DATABASE_REPLICA_URL`` at a second connection to the
+same SQLite file, or at a PostgreSQL streaming replica.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+PRIMARY = 'default'
+
+# Writes to these apps don't pin a client to the primary (every login/session touch would)
+UNPINNED_APPS = {'sessions'}
+
+
+class RouteState:
+    """Per-request routing decisions, shared by every context copy of the request."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.read_db = None
+
+
+_state = ContextVar('db_route_state', default=None)
+
+
+def begin_request(pinned=False):
+    """Start routing state for a request; returns (state, token) for ``end_request``."""
+    state = RouteState(pinned)
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def record_write(model):
+    """Note a write for read-your-writes; called by every router that answers ``db_for_write``."""
+    state = _state.get()
+    if state is not None and model._meta.app_label not in UNPINNED_APPS:
+        state.wrote = True
+
+
+# ==================== REPLICA HEALTH ====================
+
+_health = {'checked': float('-inf'), 'ok': False}
+
+
+def _replica_configured():
+    return REPLICA in connections.databases
+
+
+def check_replica():
+    """Measure replica lag now and cache whether reads may use it."""
+    lag = 0.0
+    try:
+        conn = connections[REPLICA]
+        if conn.vendor == 'postgresql':
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT CASE WHEN pg_is_in_recovery() "
+                    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+                    "ELSE 0 END"
+                )
+                lag = float(cursor.fetchone()[0])
+        else:
+            conn.ensure_connection()
+        ok = lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if not ok:
+            logger.warning("Replica lag %.1fs exceeds %.1fs; reading from primary", lag,
+                           settings.REPLICA_MAX_LAG_SECONDS)
+    except DatabaseError as e:
+        logger.warning("Replica unavailable, reading from primary: %s", e)
+        ok, lag = False, -1.0
+    metrics.REPLICA_LAG.set(lag)
+    _health.update(checked=time.monotonic(), ok=ok)
+    return ok
+
+
+def _health_is_fresh():
+    return time.monotonic() - _health['checked'] < settings.REPLICA_CHECK_INTERVAL
+
+
+def replica_alias():
+    """The alias reads may use right now: the replica if configured and healthy, else None."""
+    if not _replica_configured():
+        return None
+    ok = _health['ok'] if _health_is_fresh() else check_replica()
+    return REPLICA if ok else None
+
+
+async def areplica_alias():
+    """Async version of replica_alias"""
+    if not _replica_configured():
+        return None
+    ok = _health['ok'] if _health_is_fresh() else await sync_to_async(check_replica)()
+    return REPLICA if ok else None
+
+
+def use_replica(view):
+    """Let a read-only view read from the replica (subject to pinning and lag)."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            state = _state.get()
+            if state is not None and not state.pinned:
+                state.read_db = await areplica_alias()
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            state = _state.get()
+            if state is not None and not state.pinned:
+                state.read_db = replica_alias()
+            return view(request, *args, **kwargs)
+    return wrapped
+
+
+# ==================== ROUTER ====================
+
+class ReplicaRouter:
+    """Send reads of ``use_replica`` views to the replica; all writes go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.read_db is None or state.pinned or state.wrote:
+            return PRIMARY
+        return state.read_db
+
+    def db_for_write(self, model, **hints):
+        record_write(model)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA, None} or None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives schema changes through replication
+        return db != REPLICA
@@ -0,0 +1,91 @@
+"""
+Filtering and per-tag counts for the sessions sidebar.
+
+Tag filters are single subqueries on the ``ChatSessionTag`` table whatever the
+number of tags: ``any`` is ``pk IN (links with one of the tags)`` and ``all``
+groups those links by session and keeps the sessions linked to every tag.
+Both read the (chattag, chatsession) index only. Facet counts for all of a
+user's tags come from one aggregate over the same table.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ChatSession, ChatSessionTag, ChatTag
+
+MATCH_MODES = ('all', 'any')
+# Fields of a session in sidebar lists
+SESSION_FIELDS = ('session_id', 'title', 'created_at', 'last_activity', 'is_archived')
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_tag_ids(value):
+    try:
+        return list(dict.fromkeys(int(v) for v in value.split(',') if v.strip()))
+    except ValueError:
+        raise QueryError('tags must be comma-separated tag ids')
+
+
+def parse_when(value, end=False):
+    """An aware datetime from an ISO date or datetime; a date ``end`` covers the whole day."""
+    if not value:
+        return None
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise QueryError(f'Invalid date: {value}')
+        when = datetime.combine(day + timedelta(days=end), time.min)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def filter_by_tags(sessions, tag_ids, match='all'):
+    if not tag_ids:
+        return sessions
+    links = ChatSessionTag.objects.filter(chattag_id__in=tag_ids).values('chatsession_id')
+    if match == 'all':
+        links = links.annotate(n=Count('chattag_id')).filter(n=len(tag_ids)).values('chatsession_id')
+    return sessions.filter(pk__in=links)
+
+
+def filter_sessions(sessions, q='', start=None, end=None):
+    """``sessions`` narrowed by title text and a ``last_activity`` range (end exclusive)."""
+    if q:
+        sessions = sessions.filter(title__icontains=q)
+    if start:
+        sessions = sessions.filter(last_activity__gte=start)
+    if end:
+        sessions = sessions.filter(last_activity__lt=end)
+    return sessions
+
+
+def session_list(user):
+    """The sidebar list: ``user``'s sessions as dicts of ``SESSION_FIELDS``, most recent first."""
+    return ChatSession.objects.filter(user=user).order_by('-last_activity').values(*SESSION_FIELDS)
+
+
+def tag_facets(user, sessions):
+    """Every tag of ``user`` with the number of ``sessions`` carrying it, in one query."""
+    return ChatTag.objects.filter(user=user).annotate(
+        count=Count('sessions', filter=Q(sessions__in=sessions.order_by().values('pk'))),
+    ).values('id', 'name', 'color', 'count')
+
+
+def query_sessions(user, tag_ids=(), match='all', q='', start=None, end=None):
+    """
+    (matching sessions, facet base) for ``user``. Facets count within the results for
+    ``all``, so each count is what adding that tag would leave; for ``any`` they count
+    within the text/date matches, so they don't shrink as tags are added.
+    """
+    if match not in MATCH_MODES:
+        raise QueryError(f"match must be one of {', '.join(MATCH_MODES)}")
+    base = filter_sessions(ChatSession.objects.filter(user=user), q, start, end)
+    results = filter_by_tags(base, tag_ids, match)
+    return results, results if match == 'all' else base
@@ -0,0 +1,440 @@
+"""
+Per-user horizontal sharding of chat data.
+
+Each user's tags, sessions, messages and archives live together on one
+database, so every chat query stays on a single shard and joins still work.
+The shard is chosen once by consistent hashing over ``CHAT_SHARDS`` and
+recorded in ``ShardAssignment`` (the directory, on the default database), so
+adding a shard moves no one until ``move_user_shard --rebalance`` is run.
+Users who already had chat rows on the default database when sharding was
+turned on stay there until moved.
+
+``ShardRouter`` sends chat model queries to the right database: to the
+database of a hinted instance (related managers, ``Message(session=...)``),
+to the owner's shard for a hinted ``User``, and otherwise to the current
+scope, which ``ShardMiddleware`` sets to the logged-in user for each request.
+Code outside requests uses ``Model.objects.for_user(user)``, ``.using(alias)``
+or the ``for_user``/``using_shard`` context managers.
+
+Row ids are kept unique across shards (``reserve_id_range``), so a user's rows
+keep their primary keys when they are moved.
+"""
+import bisect
+import hashlib
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from . import routers
+from .utils import disable_auto_now, shared_cache
+from .metrics import CACHE_REQUESTS
+from .models import ArchivedSession, ChatSession, ChatTag, Message, PromptCache, RetrievalSegment, ShardAssignment
+
+logger = logging.getLogger(__name__)
+
+SHARDED_MODELS = (ChatTag, ChatSession, ChatSession.tags.through, Message, ArchivedSession, RetrievalSegment,
+                  PromptCache)
+_SHARDED_LABELS = {model._meta.label_lower for model in SHARDED_MODELS}
+
+# Each shard allocates ids from its own block, so rows can be copied between shards as they are
+SHARD_ID_BLOCK = 10 ** 12
+
+
+class ShardMoving(Exception):
+    """Raised for writes to a user's chat data while move_user_shard is switching shards."""
+
+
+def sharding_enabled():
+    return getattr(settings, 'CHAT_SHARDING', False)
+
+
+def is_sharded(model):
+    return model._meta.label_lower in _SHARDED_LABELS
+
+
+def chat_databases():
+    """Every database that can hold chat rows."""
+    if not sharding_enabled():
+        return [DEFAULT_DB_ALIAS]
+    return [DEFAULT_DB_ALIAS] + [alias for alias in settings.CHAT_SHARDS if alias != DEFAULT_DB_ALIAS]
+
+
+# ==================== HASH RING ====================
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing with virtual nodes: adding a node takes over ~1/N of the keys."""
+
+    def __init__(self, nodes, replicas=128):
+        self.nodes = tuple(nodes)
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        if not self._points:
+            return DEFAULT_DB_ALIAS
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[index]
+
+
+@lru_cache(maxsize=8)
+def _ring(nodes):
+    return HashRing(nodes)
+
+
+def ring():
+    return _ring(tuple(settings.CHAT_SHARDS))
+
+
+# ==================== DIRECTORY ====================
+
+# Per-process layer in front of the shared cache: user_id -> (expires_at, (alias, moving))
+_local_shards = {}
+_LOCAL_MAX_ENTRIES = 10000
+
+
+def _directory_cache_key(user_id):
+    return f'shard:user:{user_id}'
+
+
+def _directory_cache_ttl():
+    # A per-process cache never sees move_user_shard's invalidation (the system check
+    # refuses that setup); never let it outlive the local tier
+    if shared_cache():
+        return settings.SHARD_DIRECTORY_CACHE_TTL
+    return min(settings.SHARD_DIRECTORY_CACHE_TTL, settings.SHARD_DIRECTORY_LOCAL_TTL)
+
+
+def directory_entry(user_id):
+    """(alias, moving) for a user, assigning a shard on first use."""
+    entry = _local_shards.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        CACHE_REQUESTS.inc(cache='shard_local', result='hit')
+        return entry[1]
+    CACHE_REQUESTS.inc(cache='shard_local', result='miss')
+    key = _directory_cache_key(user_id)
+    value = cache.get(key)
+    if value is None:
+        CACHE_REQUESTS.inc(cache='shard_shared', result='miss')
+        value = (ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id)
+                 .values_list('shard', 'moving').first())
+        if value is None:
+            value = (assign_shard(user_id), False)
+        cache.set(key, value, _directory_cache_ttl())
+    else:
+        CACHE_REQUESTS.inc(cache='shard_shared', result='hit')
+    if len(_local_shards) >= _LOCAL_MAX_ENTRIES:
+        _local_shards.clear()
+    _local_shards[user_id] = (time.monotonic() + settings.SHARD_DIRECTORY_LOCAL_TTL, value)
+    return value
+
+
+def shard_for_user(user_id):
+    """The database alias holding ``user_id``'s chat data."""
+    if not sharding_enabled() or user_id is None:
+        return DEFAULT_DB_ALIAS
+    return directory_entry(user_id)[0]
+
+
+def assign_shard(user_id):
+    """Record a shard for a user who has none yet; existing chat data on default stays there."""
+    has_legacy_rows = ChatSession.all_objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).exists()
+    alias = DEFAULT_DB_ALIAS if has_legacy_rows else ring().node_for(user_id)
+    assignment, _ = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+        user_id=user_id, defaults={'shard': alias},
+    )
+    return assignment.shard
+
+
+def invalidate_directory(user_id):
+    _local_shards.pop(user_id, None)
+    cache.delete(_directory_cache_key(user_id))
+
+
+# ==================== SCOPE ====================
+
+class ShardScope:
+    """Where unhinted chat queries go: a fixed alias, or the shard of a (lazily resolved) user."""
+
+    def __init__(self, alias=None, user_id=None, resolve_user_id=None):
+        self._alias = alias
+        self._user_id = user_id
+        self._resolve_user_id = resolve_user_id
+
+    @property
+    def user_id(self):
+        if self._resolve_user_id is not None:
+            self._user_id = self._resolve_user_id()
+            self._resolve_user_id = None
+        return self._user_id
+
+    @property
+    def alias(self):
+        if self._alias is None and self.user_id is not None:
+            self._alias = shard_for_user(self.user_id)
+        return self._alias
+
+    def check_writable(self):
+        if self.user_id is not None and directory_entry(self.user_id)[1]:
+            raise ShardMoving("Your chats are being moved to a new server; please retry in a few seconds.")
+
+
+_scope = ContextVar('shard_scope', default=None)
+
+
+def begin_request(request):
+    """Scope chat queries of a request to the logged-in user's shard; returns a token for ``end_request``."""
+    def resolve_user_id():
+        value = request.session.get(SESSION_KEY)
+        return None if value is None else User._meta.pk.to_python(value)
+    return _scope.set(ShardScope(resolve_user_id=resolve_user_id))
+
+
+def end_request(token):
+    _scope.reset(token)
+
+
+@contextmanager
+def for_user(user_id):
+    """Run unhinted chat queries against ``user_id``'s shard."""
+    token = _scope.set(ShardScope(user_id=user_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def using_shard(alias):
+    """Run unhinted chat queries against ``alias``."""
+    token = _scope.set(ShardScope(alias=alias))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def atomic(using):
+    """A transaction on default plus, when the chat rows live elsewhere, one on their shard."""
+    if using == DEFAULT_DB_ALIAS:
+        return transaction.atomic()
+    stack = ExitStack()
+    stack.enter_context(transaction.atomic())
+    stack.enter_context(transaction.atomic(using=using))
+    return stack
+
+
+# ==================== ROUTER ====================
+
+def _instance_db(instance):
+    """The shard implied by a hinted instance, or None if it doesn't say."""
+    if is_sharded(type(instance)) and instance._state.db:
+        return instance._state.db
+    if isinstance(instance, User):
+        return shard_for_user(instance.pk)
+    if isinstance(instance, (ChatSession, ChatTag)) and instance.user_id is not None:
+        return shard_for_user(instance.user_id)
+    if isinstance(instance, (Message, ArchivedSession, PromptCache)) and type(instance).session.is_cached(instance):
+        return _instance_db(instance.session)
+    return None
+
+
+class ShardRouter:
+    """Route chat models to their owner's shard; everything else falls through to later routers."""
+
+    def _db(self, model, hints):
+        instance = hints.get('instance')
+        alias = _instance_db(instance) if instance is not None else None
+        if alias is None:
+            scope = _scope.get()
+            alias = scope.alias if scope is not None else None
+        return alias or DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if model is ShardAssignment:
+            return DEFAULT_DB_ALIAS
+        if not sharding_enabled() or not is_sharded(model):
+            return None
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        # The routers after this one don't see the writes it answers
+        routers.record_write(model)
+        if model is ShardAssignment:
+            return DEFAULT_DB_ALIAS
+        if not sharding_enabled() or not is_sharded(model):
+            return None
+        scope = _scope.get()
+        if scope is not None:
+            scope.check_writable()
+        return self._db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # _meta rather than type(): request.user is a SimpleLazyObject
+        models = {obj1._meta.model, obj2._meta.model}
+        # Chat rows point at users on the default database across shards (db_constraint=False)
+        if User in models and any(is_sharded(model) for model in models):
+            return True
+        if all(is_sharded(model) for model in models):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in settings.CHAT_SHARDS or db == DEFAULT_DB_ALIAS:
+            return None
+        return app_label == 'chat' and f'chat.{model_name}' in _SHARDED_LABELS
+
+
+# ==================== ID RANGES ====================
+
+def reserve_id_range(alias):
+    """Start the sharded tables' id sequences on ``alias`` at its own block."""
+    base = (settings.CHAT_SHARDS.index(alias) + 1) * SHARD_ID_BLOCK
+    conn = connections[alias]
+    with conn.cursor() as cursor:
+        for model in SHARDED_MODELS:
+            if not model._meta.pk.get_internal_type().endswith('AutoField'):
+                continue
+            table = model._meta.db_table
+            if conn.vendor == 'sqlite':
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, base])
+                elif row[0] < base:
+                    cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [base, table])
+            elif conn.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {conn.ops.quote_name(table)})))",
+                    [table, base],
+                )
+            else:
+                logger.warning("Can't reserve an id range on %s (%s); ids may collide when moving users",
+                               alias, conn.vendor)
+                return
+
+
+# ==================== MOVING USERS ====================
+
+def _user_rows(alias, user_id):
+    """(model, queryset, updatable fields) for a user's rows on ``alias``, parents first."""
+    through = ChatSession.tags.through
+    return [
+        (ChatTag, ChatTag.objects.using(alias).filter(user_id=user_id), ['name', 'color']),
+        (ChatSession, ChatSession.all_objects.using(alias).filter(user_id=user_id),
+         ['session_id', 'title', 'last_activity', 'is_archived', 'deleted_at']),
+        (through, through.objects.using(alias).filter(chatsession__user_id=user_id), []),
+        (Message, Message.objects.using(alias).filter(session__user_id=user_id), []),
+        (ArchivedSession, ArchivedSession.objects.using(alias).filter(session__user_id=user_id), []),
+        (PromptCache, PromptCache.objects.using(alias).filter(session__user_id=user_id), []),
+    ]
+
+
+def _auto_fields(model):
+    return [f.name for f in model._meta.concrete_fields
+            if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+
+
+def copy_user_rows(user_id, source, target, batch_size=1000, sync=False):
+    """
+    Copy a user's rows that are missing on ``target``, keeping their ids. With ``sync``
+    also refresh changed parent rows and drop target rows deleted on the source.
+    Returns the number of rows written.
+    """
+    written = 0
+    stale = []
+    targets = {model: qs for model, qs, _ in _user_rows(target, user_id)}
+    for model, queryset, update_fields in _user_rows(source, user_id):
+        source_ids = set(queryset.values_list('pk', flat=True))
+        target_ids = set(targets[model].values_list('pk', flat=True))
+        stale.append((model, sorted(target_ids - source_ids)))
+        missing = sorted(source_ids - target_ids)
+        with disable_auto_now(model, *_auto_fields(model)):
+            for start in range(0, len(missing), batch_size):
+                rows = list(model._base_manager.using(source).filter(pk__in=missing[start:start + batch_size]))
+                with transaction.atomic(using=target):
+                    model._base_manager.using(target).bulk_create(rows)
+                written += len(rows)
+            if sync and update_fields:
+                rows = list(model._base_manager.using(source).filter(pk__in=source_ids & target_ids))
+                model._base_manager.using(target).bulk_update(rows, update_fields, batch_size=batch_size)
+                written += len(rows)
+    if sync:
+        # Children first, so no FK points at a deleted parent between statements
+        for model, ids in reversed(stale):
+            for start in range(0, len(ids), batch_size):
+                model._base_manager.using(target).filter(pk__in=ids[start:start + batch_size])._raw_delete(target)
+    return written
+
+
+def delete_user_rows(user_id, alias, batch_size=2000):
+    """Remove a user's chat rows from ``alias``, children first, in short transactions."""
+    deleted = 0
+    for model, queryset, _ in reversed(_user_rows(alias, user_id)):
+        while True:
+            ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(using=alias):
+                deleted += model._base_manager.using(alias).filter(pk__in=ids)._raw_delete(alias)
+    return deleted
+
+
+def _set_assignment(user_id, **fields):
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(**fields)
+    invalidate_directory(user_id)
+
+
+def move_user(user_id, target, batch_size=1000, progress=None):
+    """
+    Move a user's chat data to ``target`` while they keep using the app:
+
+    1. copy everything to the target (reads and writes continue on the source);
+    2. mark the user as moving and wait for every worker's directory cache to see it,
+       after which writes are refused with ``ShardMoving``;
+    3. copy what changed meanwhile, then point the directory at the target;
+    4. wait for workers to see the new shard, then delete the source rows.
+
+    Returns the number of rows moved.
+    """
+    source = shard_for_user(user_id)
+    if source == target:
+        return 0
+    settle = settings.SHARD_DIRECTORY_LOCAL_TTL
+
+    def step(name):
+        if progress:
+            progress(user_id, name)
+
+    step('copy')
+    copy_user_rows(user_id, source, target, batch_size)
+    _set_assignment(user_id, moving=True)
+    try:
+        step('freeze')
+        time.sleep(settle)
+        step('sync')
+        copy_user_rows(user_id, source, target, batch_size, sync=True)
+        # The retrieval index is derived data keyed by id order; it is rebuilt on the target
+        RetrievalSegment.objects.using(target).filter(user_id=user_id).delete()
+        _set_assignment(user_id, shard=target, moving=False, moved_at=timezone.now())
+    except Exception:
+        _set_assignment(user_id, moving=False)
+        raise
+    step('cleanup')
+    time.sleep(settle)
+    RetrievalSegment.objects.using(source).filter(user_id=user_id).delete()
+    return delete_user_rows(user_id, source)
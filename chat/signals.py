@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import RateLimitConfig
+from .rate_limit import RateLimiter
+from . import auth_cache, sharding
+
+
+@receiver([post_save, post_delete], sender=RateLimitConfig)
+def invalidate_rate_limit_config(sender, instance, **kwargs):
+    """Drop cached limits when an admin edits a user's config or tier."""
+    user_id = instance.user_id
+    RateLimiter.invalidate_config(user_id)
+    # Again after commit, so a concurrent read can't re-cache the old row
+    transaction.on_commit(lambda: RateLimiter.invalidate_config(user_id))
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached user on profile and password changes, logins, deactivation and deletion."""
+    user_id = instance.pk
+    auth_cache.invalidate(user_id)
+    transaction.on_commit(lambda: auth_cache.invalidate(user_id))
+
+
+@receiver(post_migrate)
+def reserve_shard_id_range(sender, using, **kwargs):
+    """Give each shard its own id block once the chat tables exist on it."""
+    if sender.name == 'chat' and using in settings.CHAT_SHARDS:
+        sharding.reserve_id_range(using)
@@ -0,0 +1,169 @@
+"""
+Single-writer queue for the SQLite production profile.
+
+SQLite allows one writer at a time. With several gunicorn workers, each doing
+small INSERTs in its own transaction, writers spin on the busy timeout and some
+give up with "database is locked". Instead, ``Message`` and ``APIUsageLog``
+inserts are handed to one writer thread per process, which groups whatever is
+pending into a single transaction (group commit) and holds an ``flock`` on a
+lock file beside the database while it commits, so processes take turns
+instead of racing. Each database (shards included) gets its own queue.
+
+Callers still wait for their rows to be committed (and get primary keys back),
+so read-after-write inside a request keeps working. ``bulk_create`` sends no
+model signals, so the caller sends ``pre_save`` and ``post_save`` itself around
+the queued insert, as ``save()`` would. Inserts made inside an open transaction
+bypass the queue, since they belong to that transaction.
+"""
+import asyncio
+import fcntl
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models.signals import post_save, pre_save
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    """Batches model inserts from every thread of the process into shared transactions."""
+
+    def __init__(self, alias='default', max_batch=200, wait=0.002):
+        self.alias = alias
+        self.max_batch = max_batch
+        self.wait = wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, instance):
+        """Queue ``instance`` for insertion; the returned Future resolves to it once committed."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((instance, future))
+        metrics.QUEUE_DEPTH.set(self._queue.qsize(), queue='sqlite_writes')
+        return future
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.wait))
+            except queue.Empty:
+                pass
+            metrics.QUEUE_DEPTH.set(self._queue.qsize(), queue='sqlite_writes')
+            close_old_connections()
+            try:
+                self._commit(batch)
+            except Exception:
+                logger.exception("SQLite write batch of %d failed; retrying rows one by one", len(batch))
+                for item in batch:
+                    self._commit([item])
+
+    def _commit(self, batch):
+        pending = [(instance, future) for instance, future in batch if not future.done()]
+        by_model = {}
+        for instance, future in pending:
+            by_model.setdefault(type(instance), []).append(instance)
+        try:
+            with _file_lock(connections[self.alias]):
+                with transaction.atomic(using=self.alias):
+                    for model, instances in by_model.items():
+                        model.objects.using(self.alias).bulk_create(instances)
+        except Exception as e:
+            if len(pending) == 1:
+                pending[0][1].set_exception(e)
+                return
+            raise
+        for instance, future in pending:
+            future.set_result(instance)
+
+
+class _file_lock:
+    """Exclusive flock on ``<database>.writer.lock`` for the duration of a commit."""
+
+    def __init__(self, conn):
+        name = str(conn.settings_dict['NAME'])
+        self.path = None if conn.is_in_memory_db() else name + '.writer.lock'
+        self.fh = None
+
+    def __enter__(self):
+        if self.path:
+            self.fh = open(self.path, 'a')
+            fcntl.flock(self.fh, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        if self.fh:
+            fcntl.flock(self.fh, fcntl.LOCK_UN)
+            self.fh.close()
+
+
+_write_queues = {}
+
+
+def _queue_configured(alias):
+    return getattr(settings, 'SQLITE_WRITE_QUEUE', False) and connections[alias].vendor == 'sqlite'
+
+
+def _target(instance):
+    """The database ``instance`` will be written to, and whether a transaction is open there."""
+    alias = router.db_for_write(type(instance), instance=instance)
+    return alias, connections[alias].in_atomic_block
+
+
+# The connection (and its transaction state) lives on the thread sync_to_async runs ORM calls in
+_atarget = sync_to_async(_target)
+
+
+def get_write_queue(alias='default'):
+    if alias not in _write_queues:
+        _write_queues[alias] = WriteQueue(
+            alias, max_batch=settings.SQLITE_WRITE_BATCH, wait=settings.SQLITE_WRITE_WAIT_MS / 1000.0,
+        )
+    return _write_queues[alias]
+
+
+def insert(model, **fields):
+    """``model.objects.create(**fields)``, through the writer queue when the SQLite profile is on."""
+    instance = model(**fields)
+    alias, in_transaction = _target(instance)
+    if not _queue_configured(alias) or in_transaction:
+        instance.save(force_insert=True, using=alias)
+        return instance
+    if pre_save.has_listeners(model):
+        pre_save.send(sender=model, instance=instance, raw=False, using=alias, update_fields=None)
+    get_write_queue(alias).submit(instance).result()
+    if post_save.has_listeners(model):
+        post_save.send(sender=model, instance=instance, created=True, raw=False, using=alias, update_fields=None)
+    return instance
+
+
+async def ainsert(model, **fields):
+    """Async version of insert"""
+    instance = model(**fields)
+    alias, in_transaction = await _atarget(instance)
+    if not _queue_configured(alias) or in_transaction:
+        await instance.asave(force_insert=True, using=alias)
+        return instance
+    if pre_save.has_listeners(model):
+        await pre_save.asend(sender=model, instance=instance, raw=False, using=alias, update_fields=None)
+    await asyncio.wrap_future(get_write_queue(alias).submit(instance))
+    if post_save.has_listeners(model):
+        await post_save.asend(sender=model, instance=instance, created=True, raw=False, using=alias,
+                              update_fields=None)
+    return instance
@@ -0,0 +1,683 @@
+        // Get CSRF token
+        function getCookie(name) {
+            let cookieValue = null;
+            if (document.cookie && document.cookie !== '') {
+                const cookies = document.cookie.split(';');
+                for (let i = 0; i < cookies.length; i++) {
+                    const cookie = cookies[i].trim();
+                    if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                        cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                        break;
+                    }
+                }
+            }
+            return cookieValue;
+        }
+
+        const csrftoken = getCookie('csrftoken');
+
+        // Global state
+        let currentSessionId = null;
+        let isWaitingForResponse = false;
+        let pendingRequest = null;  // AbortController of the chat request in flight
+        let userDisplayName = document.body.dataset.username;
+        let hasMessages = false;
+
+        // One WebSocket per tab (chat.ws) carries sends, streamed replies and sidebar updates;
+        // everything falls back to fetch() while it is not connected.
+        const socket = {
+            ws: null,
+            ready: false,
+            connectedBefore: false,
+            turns: {},  // ref -> {onChunk, resolve, reject} of chat turns in flight
+            nextRef: 0,
+            lastSeen: 0,
+            pingTimer: null,
+            retryDelay: 1000
+        };
+
+        // Initialize
+    document.addEventListener('DOMContentLoaded', () => {
+        currentSessionId = 'session_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
+        loadSessions();
+        connectSocket();
+    });
+
+    function connectSocket() {
+        if (!window.WebSocket) return;
+        const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/ws/chat/`);
+        socket.ws = ws;
+        ws.onmessage = (event) => {
+            socket.lastSeen = Date.now();
+            handleSocketMessage(JSON.parse(event.data));
+        };
+        ws.onclose = () => {
+            if (socket.ws !== ws) return;
+            socket.ready = false;
+            clearInterval(socket.pingTimer);
+            Object.values(socket.turns).forEach(turn => turn.reject(new Error('Connection lost')));
+            socket.turns = {};
+            // Back off while the server is away or busy (close code 1013)
+            setTimeout(connectSocket, socket.retryDelay);
+            socket.retryDelay = Math.min(socket.retryDelay * 2, 30000);
+        };
+    }
+
+    function handleSocketMessage(msg) {
+        const turn = socket.turns[msg.ref];
+        switch (msg.type) {
+            case 'hello':
+                socket.ready = true;
+                socket.retryDelay = 1000;
+                clearInterval(socket.pingTimer);
+                socket.pingTimer = setInterval(() => {
+                    // Nothing back since the last ping: the connection is dead, start over
+                    if (Date.now() - socket.lastSeen > msg.ping_interval * 2000) {
+                        socket.ws.close();
+                        return;
+                    }
+                    socket.ws.send(JSON.stringify({ type: 'ping' }));
+                }, msg.ping_interval * 1000);
+                if (socket.connectedBefore) {
+                    // Catch up on changes made while disconnected
+                    loadSessions();
+                    loadTags();
+                }
+                socket.connectedBefore = true;
+                break;
+            case 'chat.chunk':
+                if (turn) turn.onChunk(msg.text);
+                break;
+            case 'chat.done':
+                if (turn) turn.resolve(msg);
+                delete socket.turns[msg.ref];
+                break;
+            case 'chat.error':
+                if (turn) turn.reject(new Error(msg.error || 'Request failed'));
+                delete socket.turns[msg.ref];
+                break;
+            case 'sessions':
+                renderSessions(msg.sessions);
+                break;
+            case 'tags':
+                allTags = msg.tags;
+                updateTagsUI();
+                break;
+            case 'session.updated':
+            case 'sessions.changed':
+                loadSessions();
+                break;
+            case 'tags.changed':
+                loadTags();
+                break;
+        }
+    }
+
+    function socketTurn(body, signal, onChunk) {
+        const ref = String(++socket.nextRef);
+        const ws = socket.ws;
+        return new Promise((resolve, reject) => {
+            if (ws.readyState !== WebSocket.OPEN) {
+                reject(new Error('Connection lost'));
+                return;
+            }
+            const onAbort = () => {
+                if (ws.readyState === WebSocket.OPEN) {
+                    ws.send(JSON.stringify({ type: 'chat.cancel', ref }));
+                }
+                delete socket.turns[ref];
+                reject(new Error('Aborted'));
+            };
+            // However the turn ends (done, error, connection lost), stop listening for aborts
+            const settle = (finish) => (value) => {
+                signal.removeEventListener('abort', onAbort);
+                finish(value);
+            };
+            socket.turns[ref] = { onChunk, resolve: settle(resolve), reject: settle(reject) };
+            signal.addEventListener('abort', onAbort, { once: true });
+            ws.send(JSON.stringify({ type: 'chat.send', ref, ...body }));
+        });
+    }
+
+    function markdownToHtml(text) {
+        let html = text
+            .replace(/&/g, "&amp;")
+            .replace(/</g, "&lt;")
+            .replace(/>/g, "&gt;");
+
+        html = html
+            .replace(/```(\w+)?\n([\s\S]*?)```/g, (match, lang, code) => {
+                return `<pre><code class="language-${lang || 'text'}">${code.trim()}</code></pre>`;
+            })
+            .replace(/`([^`]+)`/g, '<code>$1</code>')
+            .replace(/^###\s*(.+)$/gm, '<h3>$1</h3>')
+            .replace(/^##\s*(.+)$/gm, '<h2>$1</h2>')
+            .replace(/^#\s*(.+)$/gm, '<h1>$1</h1>')
+            .replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>')
+            .replace(/^\s*[-*]\s+(.+)$/gm, '<li>$1</li>');
+
+        if (html.includes('<li>')) {
+            html = html.replace(/(<li>.*?<\/li>)/s, '<ul>$1</ul>');
+        }
+
+        return html;
+    }
+
+    function appendMessage(role, text, imageData = null, sources = []) {
+        // Hide welcome state on first message
+        if (!hasMessages) {
+            const welcomeState = document.querySelector('.welcome-state');
+            if (welcomeState) welcomeState.style.display = 'none';
+            hasMessages = true;
+        }
+
+        const chatArea = document.getElementById('chatArea');
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message-bubble ' + (role === 'user' ? 'user-message' : 'model-message');
+        messageDiv.innerHTML = messageHtml(text, sources);
+        chatArea.appendChild(messageDiv);
+        chatArea.scrollTop = chatArea.scrollHeight;
+        return messageDiv;
+    }
+
+    function messageHtml(text, sources = []) {
+        let html = markdownToHtml(text);
+        let content = `<div class="message-content">${html}`;
+
+        if (sources && sources.length > 0) {
+            content += '<div class="citation"><strong>Sources:</strong><ul style="margin: 6px 0 0 16px;">';
+            sources.forEach((source, i) => {
+                content += `<li><a href="${source.uri}" target="_blank">${source.title || source.uri}</a></li>`;
+            });
+            content += '</ul></div>';
+        }
+
+        content += '</div>';
+        return content;
+    }
+
+    function appendTypingIndicator() {
+        const chatArea = document.getElementById('chatArea');
+        const indicatorDiv = document.createElement('div');
+        indicatorDiv.id = 'typingIndicator';
+        indicatorDiv.className = 'message-bubble model-message';
+        indicatorDiv.innerHTML = '<div class="typing-indicator"><div class="typing-dot"></div><div class="typing-dot"></div><div class="typing-dot"></div></div>';
+        chatArea.appendChild(indicatorDiv);
+        chatArea.scrollTop = chatArea.scrollHeight;
+    }
+
+    function removeTypingIndicator() {
+        const indicator = document.getElementById('typingIndicator');
+        if (indicator) indicator.remove();
+    }
+
+    function sendSuggestion(text) {
+        document.getElementById('prompt').value = text;
+        handleRequest(false);
+    }
+
+    async function handleRequest(isImageRequest) {
+        const prompt = document.getElementById('prompt').value.trim();
+        const fileInput = document.getElementById('fileUpload');
+
+        if (!prompt && !fileInput.files.length && !isImageRequest) return;
+        if (isWaitingForResponse) return;
+
+        isWaitingForResponse = true;
+        const controller = new AbortController();
+        pendingRequest = controller;
+        const sendBtn = document.getElementById('sendBtn');
+        // While waiting, the send button stops generation (the server cancels the model call)
+        sendBtn.innerHTML = '<i class="fas fa-stop"></i> Stop';
+        sendBtn.classList.add('stop-btn');
+        sendBtn.onclick = () => stopGeneration();
+
+        appendMessage('user', prompt);
+        document.getElementById('prompt').value = '';
+        fileInput.value = '';
+        appendTypingIndicator();
+
+        try {
+            let fileData = null;
+            if (fileInput.files.length > 0) {
+                fileData = await readFile(fileInput.files[0]);
+            }
+
+            const body = {
+                prompt: prompt,
+                session_id: currentSessionId,
+                is_image_request: isImageRequest,
+                image_data: fileData
+            };
+            let result;
+            let bubble = null;
+
+            if (socket.ready && !fileData) {
+                // Streamed over the socket: the reply grows in place as chunks arrive
+                let streamed = '';
+                result = await socketTurn(body, controller.signal, (text) => {
+                    if (!bubble) {
+                        removeTypingIndicator();
+                        bubble = appendMessage('model', '');
+                    }
+                    streamed += text;
+                    bubble.innerHTML = messageHtml(streamed);
+                    const chatArea = document.getElementById('chatArea');
+                    chatArea.scrollTop = chatArea.scrollHeight;
+                });
+            } else {
+                const response = await fetch('/api/chat/', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': csrftoken
+                    },
+                    body: JSON.stringify(body),
+                    signal: controller.signal
+                });
+
+                result = await response.json();
+
+                if (!response.ok) {
+                    throw new Error(result.error || 'Request failed');
+                }
+            }
+
+            removeTypingIndicator();
+            if (bubble) {
+                bubble.innerHTML = messageHtml(result.text, result.sources || []);
+            } else {
+                appendMessage('model', result.text, null, result.sources || []);
+            }
+            currentSessionId = result.session_id;
+            // With a socket the server pushes session.updated instead
+            if (!socket.ready) loadSessions();
+
+        } catch (error) {
+            removeTypingIndicator();
+            if (controller.signal.aborted) {
+                // Switching chats clears the chat area; only an explicit stop leaves a note
+                if (controller.signal.reason === 'stopped') {
+                    appendMessage('model', '⏹️ Generation stopped.');
+                }
+            } else {
+                appendMessage('model', `⚠️ Error: ${error.message}`);
+            }
+        } finally {
+            if (pendingRequest === controller) {
+                pendingRequest = null;
+            }
+            isWaitingForResponse = false;
+            sendBtn.innerHTML = '<i class="fas fa-paper-plane"></i> Send';
+            sendBtn.classList.remove('stop-btn');
+            sendBtn.onclick = () => handleRequest(false);
+        }
+    }
+
+    function stopGeneration(reason = 'stopped') {
+        if (pendingRequest) {
+            pendingRequest.abort(reason);
+        }
+    }
+
+    function readFile(file) {
+        return new Promise((resolve, reject) => {
+            const reader = new FileReader();
+            reader.onload = () => resolve(reader.result);
+            reader.onerror = reject;
+            reader.readAsDataURL(file);
+        });
+    }
+
+    async function loadSessions() {
+        if (socket.ready) {
+            socket.ws.send(JSON.stringify({ type: 'sessions.list' }));
+            return;
+        }
+        try {
+            const response = await fetch('/api/sessions/', {
+                headers: { 'X-CSRFToken': csrftoken }
+            });
+            const result = await response.json();
+            renderSessions(result.sessions || []);
+        } catch (error) {
+            console.error('Error loading sessions:', error);
+        }
+    }
+
+    function renderSessions(sessions) {
+        const recentChats = document.getElementById('recentChats');
+
+        recentChats.innerHTML = '';
+
+        sessions.slice(0, 5).forEach(session => {
+            const item = document.createElement('div');
+            item.className = 'nav-item';
+            item.innerHTML = `<i class="fas fa-message"></i> ${session.title.substring(0, 20)}...`;
+            item.style.cursor = 'pointer';
+            item.onclick = () => loadSessionHistory(session.session_id);
+            recentChats.appendChild(item);
+        });
+    }
+
+    async function loadSessionHistory(sessionId) {
+        stopGeneration('switched');
+        try {
+            const response = await fetch(`/api/history/${sessionId}/`, {
+                headers: { 'X-CSRFToken': csrftoken }
+            });
+            const result = await response.json();
+            currentSessionId = sessionId;
+            document.getElementById('chatArea').innerHTML = '';
+            hasMessages = true;
+
+            result.history.forEach(msg => {
+                appendMessage(msg.isUser ? 'user' : 'model', msg.text, null, msg.sources || []);
+            });
+        } catch (error) {
+            console.error('Error loading history:', error);
+        }
+    }
+
+    function startNewChat() {
+        stopGeneration('switched');
+        currentSessionId = 'session_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
+        document.getElementById('chatArea').innerHTML = `
+            <div class="welcome-state">
+                <h1 class="welcome-title">Welcome to <span class="brand-gradient">Nicole</span></h1>
+                <p class="welcome-subtitle">Your intelligent optometry assistant. Ask me anything!</p>
+
+                <div class="suggestion-cards" id="suggestionCards">
+                    <div class="suggestion-card" onclick="sendSuggestion('Explain the basics of refraction and how it affects vision.')">
+                        <div class="card-icon">
+                            <i class="fas fa-eye"></i>
+                        </div>
+                        <div>
+                            <div class="card-title">Vision Basics</div>
+                            <div class="card-desc">Learn about refraction and eye health</div>
+                        </div>
+                    </div>
+
+                    <div class="suggestion-card" onclick="sendSuggestion('What are the latest innovations in optometry technology?')">
+                        <div class="card-icon">
+                            <i class="fas fa-microscope"></i>
+                        </div>
+                        <div>
+                            <div class="card-title">Tech & Innovation</div>
+                            <div class="card-desc">Discover cutting-edge optometry tech</div>
+                        </div>
+                    </div>
+
+                    <div class="suggestion-card" onclick="sendSuggestion('How can I start a successful optometry business?')">
+                        <div class="card-icon">
+                            <i class="fas fa-briefcase"></i>
+                        </div>
+                        <div>
+                            <div class="card-title">Business Ideas</div>
+                            <div class="card-desc">Explore optometry business opportunities</div>
+                        </div>
+                    </div>
+
+                    <div class="suggestion-card" onclick="sendSuggestion('What are common eye diseases and their treatments?')">
+                        <div class="card-icon">
+                            <i class="fas fa-stethoscope"></i>
+                        </div>
+                        <div>
+                            <div class="card-title">Eye Diseases</div>
+                            <div class="card-desc">Learn about common eye conditions</div>
+                        </div>
+                    </div>
+
+                    <div class="suggestion-card" onclick="sendSuggestion('How do I properly fit contact lenses?')">
+                        <div class="card-icon">
+                            <i class="fas fa-circle"></i>
+                        </div>
+                        <div>
+                            <div class="card-title">Contact Lenses</div>
+                            <div class="card-desc">Master contact lens fitting techniques</div>
+                        </div>
+                    </div>
+
+                    <div class="suggestion-card" onclick="sendSuggestion('What are the ethical considerations in optometry practice?')">
+                        <div class="card-icon">
+                            <i class="fas fa-scale-balanced"></i>
+                        </div>
+                        <div>
+                            <div class="card-title">Professional Ethics</div>
+                            <div class="card-desc">Understand ethical practice standards</div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        `;
+        hasMessages = false;
+        loadSessions();
+    }
+
+    function openModal(modalId) {
+        document.getElementById(modalId).classList.add('active');
+    }
+
+    function closeModal(modalId) {
+        document.getElementById(modalId).classList.remove('active');
+    }
+
+    function deleteChat() {
+        if (confirm('Delete this chat? This cannot be undone.')) {
+            fetch(`/api/session/${currentSessionId}/delete/`, {
+                method: 'DELETE',
+                headers: { 'X-CSRFToken': csrftoken }
+            }).then(() => {
+                startNewChat();
+                loadSessions();
+                closeModal('optionsModal');
+            });
+        }
+    }
+
+    function openSearchModal() {
+        openModal('searchModal');
+        document.getElementById('searchInput').focus();
+    }
+
+    document.getElementById('searchInput')?.addEventListener('input', async (e) => {
+        const query = e.target.value.trim();
+        if (query.length < 2) {
+            document.getElementById('searchResults').innerHTML = '';
+            return;
+        }
+
+        try {
+            const response = await fetch(`/api/search/?q=${encodeURIComponent(query)}`, {
+                headers: { 'X-CSRFToken': csrftoken }
+            });
+            const result = await response.json();
+
+            const resultsDiv = document.getElementById('searchResults');
+            resultsDiv.innerHTML = '';
+
+            result.results.forEach(res => {
+                const item = document.createElement('div');
+                item.style.cssText = 'padding: 12px; border: 1px solid #E5E7EB; border-radius: 8px; margin-bottom: 8px; cursor: pointer; transition: all 0.3s ease;';
+                item.className = 'hover:bg-gray-100';
+                item.innerHTML = `
+                    <div style="font-weight: 600; margin-bottom: 4px; color: #522888;">${res.session_title}</div>
+                    <div style="font-size: 12px; color: #6B7280;">${res.message_snippet}...</div>
+                    <div style="font-size: 11px; color: #9CA3AF; margin-top: 4px;">${res.is_user ? 'You' : 'Nicole'} • ${new Date(res.timestamp).toLocaleDateString()}</div>
+                `;
+                item.onclick = () => {
+                    loadSessionHistory(res.session_id);
+                    closeModal('searchModal');
+                };
+                resultsDiv.appendChild(item);
+            });
+
+            if (result.results.length === 0) {
+                resultsDiv.innerHTML = '<p style="text-center; color: #9CA3AF;">No results found</p>';
+            }
+        } catch (error) {
+            console.error('Search error:', error);
+        }
+    });
+
+    // Close modals on outside click
+    document.querySelectorAll('.modal').forEach(modal => {
+        modal.addEventListener('click', (e) => {
+            if (e.target === modal) closeModal(modal.id);
+        });
+    });
+
+    // Mobile Sidebar Toggle
+    function toggleMobileSidebar() {
+        const sidebar = document.querySelector('.sidebar');
+        if (!sidebar) return;
+
+        // Toggle sidebar
+        sidebar.classList.toggle('active');
+
+        // Create or toggle overlay
+        let overlay = document.querySelector('.sidebar-overlay');
+
+        if (!overlay) {
+            overlay = document.createElement('div');
+            overlay.className = 'sidebar-overlay';
+            overlay.onclick = toggleMobileSidebar;
+            document.body.appendChild(overlay);
+        }
+
+        overlay.classList.toggle('active');
+    }
+
+// Close sidebar when clicking on nav items
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('.nav-item').forEach(item => {
+        item.addEventListener('click', () => {
+            if (window.innerWidth <= 768) {
+                const sidebar = document.querySelector('.sidebar');
+                const overlay = document.querySelector('.sidebar-overlay');
+                if (sidebar && sidebar.classList.contains('active')) {
+                    toggleMobileSidebar();
+                }
+            }
+        });
+    });
+
+    // Close sidebar when clicking outside on mobile
+    document.addEventListener('click', (e) => {
+        const sidebar = document.querySelector('.sidebar');
+        const menuBtn = document.querySelector('.mobile-menu-btn');
+
+        if (window.innerWidth <= 768 && sidebar && sidebar.classList.contains('active')) {
+            if (!sidebar.contains(e.target) && !menuBtn.contains(e.target)) {
+                toggleMobileSidebar();
+            }
+        }
+    });
+
+    // Load tags on page load
+    loadTags();
+});
+
+// Tags Management
+let allTags = [];
+
+async function loadTags() {
+    if (socket.ready) {
+        socket.ws.send(JSON.stringify({ type: 'tags.list' }));
+        return;
+    }
+    try {
+        const response = await fetch('/api/tags/', {
+            headers: { 'X-CSRFToken': csrftoken }
+        });
+        const result = await response.json();
+        allTags = result.tags || [];
+        updateTagsUI();
+    } catch (error) {
+        console.error('Error loading tags:', error);
+    }
+}
+
+function updateTagsUI() {
+    const tagsContainer = document.getElementById('tagsContainer');
+    if (!tagsContainer) return;
+
+    tagsContainer.innerHTML = '';
+
+    allTags.forEach(tag => {
+        const tagEl = document.createElement('div');
+        tagEl.className = 'tag-item';
+        tagEl.style.backgroundColor = tag.color + '20';
+        tagEl.style.borderColor = tag.color;
+        tagEl.innerHTML = `
+            <span style="color: ${tag.color}; font-weight: 600;">${tag.name} (${tag.count})</span>
+            <button onclick="addTagToSession(${tag.id})" style="background: transparent; border: none; color: ${tag.color}; cursor: pointer; font-size: 12px;">+</button>
+        `;
+        tagsContainer.appendChild(tagEl);
+    });
+
+    // Add button to create new tag
+    const addBtn = document.createElement('button');
+    addBtn.className = 'add-tag-btn';
+    addBtn.textContent = '+ New Tag';
+    addBtn.onclick = openCreateTagModal;
+    tagsContainer.appendChild(addBtn);
+}
+
+async function createTag() {
+    const tagName = document.getElementById('newTagName').value.trim();
+    const tagColor = document.getElementById('newTagColor').value;
+
+    if (!tagName) {
+        alert('Please enter a tag name');
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/tags/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrftoken
+            },
+            body: JSON.stringify({
+                name: tagName,
+                color: tagColor
+            })
+        });
+
+        const result = await response.json();
+        if (response.ok) {
+            loadTags();
+            document.getElementById('newTagName').value = '';
+            closeModal('createTagModal');
+        }
+    } catch (error) {
+        console.error('Error creating tag:', error);
+    }
+}
+
+async function addTagToSession(tagId) {
+    try {
+        const response = await fetch(`/api/session/${currentSessionId}/tag/`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrftoken
+            },
+            body: JSON.stringify({ tag_id: tagId })
+        });
+
+        if (response.ok) {
+            alert('Tag added to chat!');
+            loadSessions();
+            loadTags();
+        }
+    } catch (error) {
+        console.error('Error adding tag:', error);
+    }
+}
+
+function openCreateTagModal() {
+    openModal('createTagModal');
+}
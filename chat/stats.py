@@ -0,0 +1,106 @@
+"""
+Per-user totals for the profile and usage pages.
+
+``UserStats`` keeps one row per user. The write paths adjust it with a single
+``UPDATE ... SET messages = messages + 1`` (``record``), so the pages read one
+row by primary key instead of counting the user's whole history. A missing row
+is computed from the source tables on first use. Counters and source rows are
+written in separate statements (and on separate databases when sharding is
+on), so the ``rebuild_user_stats`` command recomputes rows in bulk to repair
+any drift.
+"""
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import APIUsageLog, ArchivedSession, ChatSession, ChatTag, Message, UserStats
+from .sharding import shard_for_user
+
+COUNTERS = ('sessions', 'messages', 'tokens_used', 'tags')
+
+
+def record(user_id, sessions=0, messages=0, tokens_used=0, tags=0, activity=None):
+    """Add to a user's counters; ``activity`` (a datetime) also moves first/last activity."""
+    changes = {
+        name: F(name) + delta
+        for name, delta in zip(COUNTERS, (sessions, messages, tokens_used, tags)) if delta
+    }
+    if activity is not None:
+        changes['first_activity'] = Coalesce(F('first_activity'), Value(activity))
+        changes['last_activity'] = Greatest(Coalesce(F('last_activity'), Value(activity)), Value(activity))
+    if not changes:
+        return
+    changes['updated_at'] = timezone.now()
+    if not UserStats.objects.filter(user_id=user_id).update(**changes):
+        # First write since deploy: the source tables already include this change
+        build(user_id)
+
+
+arecord = sync_to_async(record)
+
+
+def get(user_id):
+    """The user's ``UserStats``, computed and stored if it does not exist yet."""
+    return UserStats.objects.filter(user_id=user_id).first() or build(user_id)
+
+
+aget = sync_to_async(get)
+
+
+def build(user_id):
+    values = compute([user_id])[user_id]
+    try:
+        return UserStats.objects.create(user_id=user_id, **values)
+    except IntegrityError:
+        # Another request built it first
+        return UserStats.objects.get(user_id=user_id)
+
+
+def compute(user_ids):
+    """{user_id: field values} counted from the source tables, a few grouped queries per database."""
+    results = {
+        user_id: {'sessions': 0, 'messages': 0, 'tokens_used': 0, 'tags': 0,
+                  'first_activity': None, 'last_activity': None}
+        for user_id in user_ids
+    }
+    by_shard = defaultdict(list)
+    for user_id in user_ids:
+        by_shard[shard_for_user(user_id)].append(user_id)
+
+    for using, ids in by_shard.items():
+        sessions = (ChatSession.objects.using(using).filter(user_id__in=ids).order_by().values('user_id')
+                    .annotate(n=Count('pk'), first=Min('created_at'), last=Max('last_activity')))
+        for row in sessions:
+            results[row['user_id']].update(sessions=row['n'], first_activity=row['first'], last_activity=row['last'])
+        live = {'session__user_id__in': ids, 'session__deleted_at__isnull': True}
+        for model, total in ((Message, Count('pk')), (ArchivedSession, Sum('message_count'))):
+            rows = model.objects.using(using).filter(**live).order_by().values('session__user_id').annotate(n=total)
+            for row in rows:
+                results[row['session__user_id']]['messages'] += row['n'] or 0
+        for row in ChatTag.objects.using(using).filter(user_id__in=ids).order_by().values('user_id').annotate(
+                n=Count('pk')):
+            results[row['user_id']]['tags'] = row['n']
+
+    for row in APIUsageLog.objects.filter(user_id__in=user_ids).order_by().values('user_id').annotate(
+            n=Sum('tokens_used')):
+        results[row['user_id']]['tokens_used'] = row['n'] or 0
+    return results
+
+
+def rebuild(user_ids, batch_size=500):
+    """Recompute and upsert the rows of ``user_ids``; returns how many were written."""
+    written = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = compute(user_ids[start:start + batch_size])
+        now = timezone.now()
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=user_id, updated_at=now, **values) for user_id, values in batch.items()],
+            update_conflicts=True, unique_fields=['user'],
+            update_fields=[*COUNTERS, 'first_activity', 'last_activity', 'updated_at'],
+        )
+        written += len(batch)
+    return written
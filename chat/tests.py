@@ -1,3 +1,1664 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from io import StringIO
+from concurrent.futures import Future
+from datetime import timedelta
+from decimal import Decimal
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.db.utils import ConnectionRouter
+from django.db.models.signals import post_save
+from django.middleware.csrf import _get_new_csrf_string
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+
+from nicole_project import settings as project_settings
+
+from .admin import estimated_row_count
+from .checks import check_sharding_cache
+from .archive import archive_session, rehydrate_session
+from .deletion import reap, soft_delete_session
+from .fields import MARKER, decompress_text, is_compressed
+from .loadtest import LOAD_TEST_PREFIX, FakeGeminiServer
+from .models import (
+    ChatSession, Message, ChatTag, APIUsageLog, RateLimitConfig, ArchivedSession, DeletionJob, RetrievalSegment,
+    PromptCache, ShardAssignment, UserStats,
+)
+from .rate_limit import RateLimiter, _local_configs
+from . import auth_cache, http, metrics, model_routing, perf, prompt_cache, retrieval, routers, sharding, ws
+from . import stats as user_stats
+from .routers import ReplicaRouter
+from .sqlite import WriteQueue, ainsert, insert
+from .utils import disable_auto_now
+from .views import chat as chat_views
+
+PASSWORD = 'harness-password-123'
+
+# Two data sizes: sessions per user, messages per session and usage logs all scale with it.
+SMALL, LARGE = 2, 12
+
+# Hashed static names need collectstatic's manifest; tests link the unhashed source files
+SOURCE_STATIC = {
+    **settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@dataclass
+class ViewCase:
+    """How to exercise one named URL and the query budget it must stay under."""
+    budget: int
+    method: str = 'get'
+    kwargs: Callable[[dict], dict] = lambda fx: {}
+    data: Optional[Callable[[dict], dict]] = None
+    status: int = 200
+    anonymous: bool = False
+    json_body: bool = False
+    latency_ms: float = 2000
+    extra: dict = field(default_factory=dict)
+
+
+VIEW_CASES = {
+    'signup': ViewCase(budget=0, anonymous=True),
+    'login': ViewCase(budget=0, anonymous=True),
+    'logout': ViewCase(budget=4, status=302),
+    'profile': ViewCase(budget=3),
+    'change_password': ViewCase(budget=0),
+    'delete_account': ViewCase(
+        budget=9, method='post', data=lambda fx: {'password': PASSWORD},
+    ),
+    'nicole_chat': ViewCase(budget=2),
+    'usage': ViewCase(budget=0),
+    'api_chat': ViewCase(
+        budget=15, method='post', json_body=True,
+        data=lambda fx: {'prompt': 'What is accommodation?', 'session_id': fx['session_id']},
+    ),
+    'get_chat_history': ViewCase(budget=4, kwargs=lambda fx: {'session_id': fx['session_id']}),
+    'get_user_sessions': ViewCase(budget=3),
+    'delete_session': ViewCase(budget=9, method='delete', kwargs=lambda fx: {'session_id': fx['session_id']}),
+    'search_chats': ViewCase(budget=3, extra={'q': 'lens'}),
+    'usage_stats': ViewCase(budget=5),
+    'export_pdf': ViewCase(budget=4, kwargs=lambda fx: {'session_id': fx['session_id']}),
+    'export_json': ViewCase(budget=4, kwargs=lambda fx: {'session_id': fx['session_id']}),
+    'manage_tags': ViewCase(budget=3),
+    'delete_tag': ViewCase(budget=6, method='delete', kwargs=lambda fx: {'tag_id': fx['tag_id']}),
+    'add_tag': ViewCase(
+        budget=5, method='post', json_body=True,
+        kwargs=lambda fx: {'session_id': fx['session_id']}, data=lambda fx: {'tag_id': fx['tag_id']},
+    ),
+    'remove_tag': ViewCase(
+        budget=5, method='post', json_body=True,
+        kwargs=lambda fx: {'session_id': fx['session_id']}, data=lambda fx: {'tag_id': fx['tag_id']},
+    ),
+    'get_sessions_by_tag': ViewCase(budget=4, kwargs=lambda fx: {'tag_id': fx['tag_id']}),
+    'filter_sessions': ViewCase(
+        budget=5, data=lambda fx: {'tags': ','.join(map(str, fx['tag_ids'])), 'match': 'all', 'q': 'lens'},
+    ),
+    'bulk_delete_sessions': ViewCase(
+        budget=9, method='post', json_body=True, data=lambda fx: {'session_ids': fx['session_ids']},
+    ),
+    'bulk_tag_sessions': ViewCase(
+        budget=5, method='post', json_body=True,
+        data=lambda fx: {'session_ids': fx['session_ids'], 'tag_ids': fx['tag_ids']},
+    ),
+    'bulk_untag_sessions': ViewCase(
+        budget=6, method='post', json_body=True,
+        data=lambda fx: {'session_ids': fx['session_ids'], 'tag_ids': fx['tag_ids']},
+    ),
+    'bulk_export_sessions': ViewCase(
+        budget=4, method='post', json_body=True, data=lambda fx: {'session_ids': fx['session_ids']},
+    ),
+    'metrics': ViewCase(budget=0, anonymous=True),
+}
+
+
+def seed_user_data(size):
+    """Create a user with ``size`` tagged sessions of ``size`` messages each, plus another user's noise."""
+    user = User.objects.create_user('harness', 'harness@example.com', PASSWORD)
+    other = User.objects.create_user('neighbour', 'neighbour@example.com', PASSWORD)
+    fixture = {'user': user}
+    last_week = timezone.now() - timedelta(days=7)
+    for owner in (other, user):
+        ChatTag.objects.bulk_create([ChatTag(user=owner, name=f"Tag {i}") for i in range(size)])
+        ChatSession.objects.bulk_create([
+            ChatSession(user=owner, session_id=str(uuid.uuid4()), title=f"Lens chat {i}") for i in range(size)
+        ])
+        sessions = list(ChatSession.objects.filter(user=owner))
+        tags = list(ChatTag.objects.filter(user=owner))
+        ChatSession.tags.through.objects.bulk_create([
+            ChatSession.tags.through(chatsession_id=s.pk, chattag_id=t.pk) for s in sessions for t in tags
+        ])
+        Message.objects.bulk_create([
+            Message(session=s, text_content=f"Contact lens question {n}", is_user=n % 2 == 0)
+            for s in sessions for n in range(size)
+        ])
+        with disable_auto_now(APIUsageLog, 'timestamp'):
+            APIUsageLog.objects.bulk_create([
+                APIUsageLog(user=owner, endpoint='chat', response_time=1.0, timestamp=last_week) for _ in range(size)
+            ])
+        fixture.update(session_id=sessions[0].session_id, tag_id=tags[0].pk,
+                       session_ids=[s.session_id for s in sessions], tag_ids=[t.pk for t in tags])
+    user_stats.rebuild([user.pk, other.pk])
+    return fixture
+
+
+def named_url_patterns(patterns=None):
+    """Names of every URL pattern outside the admin site."""
+    names = []
+    for pattern in patterns if patterns is not None else get_resolver().url_patterns:
+        if isinstance(pattern, URLPattern):
+            if pattern.name:
+                names.append(pattern.name)
+        elif getattr(pattern, 'app_name', None) != 'admin':
+            names.extend(named_url_patterns(pattern.url_patterns))
+    return names
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PERF_LOG_REQUESTS=False,
+                   METRICS_DIR='', STORAGES=SOURCE_STATIC)
+class ViewQueryBudgetTests(TestCase):
+    """
+    Exercise every named URL with a small and a large data set and assert that
+    the number of queries does not grow with data size and stays within budget.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gemini = FakeGeminiServer(latency=0).start()
+        cls.settings_override = override_settings(GEMINI_API_BASE=cls.gemini.base_url, GEMINI_API_KEY='test-key')
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.gemini.stop()
+        super().tearDownClass()
+
+    def measure(self, name, size):
+        """Seed data of ``size``, request the URL ``name`` and return (status, queries, elapsed_ms)."""
+        case = VIEW_CASES[name]
+        # Rolled-back user ids are reused, so every measurement starts from cold caches
+        cache.clear()
+        _local_configs.clear()
+        retrieval._indexes.clear()
+        with transaction.atomic():
+            fixture = seed_user_data(size)
+            client = Client()
+            if not case.anonymous:
+                client.force_login(fixture['user'])
+            url = reverse(name, kwargs=case.kwargs(fixture))
+            data = case.data(fixture) if case.data else dict(case.extra)
+            request_kwargs = {}
+            if case.json_body:
+                data = json.dumps(data)
+                request_kwargs['content_type'] = 'application/json'
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = getattr(client, case.method)(url, data, **request_kwargs)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+            transaction.set_rollback(True)
+        return response.status_code, ctx.captured_queries, elapsed_ms
+
+    @staticmethod
+    def format_queries(queries):
+        return '\n'.join(f"  {i}. {q['sql']}" for i, q in enumerate(queries, 1))
+
+    def test_every_url_has_a_budget(self):
+        missing = sorted(set(named_url_patterns()) - set(VIEW_CASES))
+        self.assertFalse(missing, f"Add VIEW_CASES entries for: {', '.join(missing)}")
+
+    def test_query_counts_are_constant_and_within_budget(self):
+        for name in named_url_patterns():
+            case = VIEW_CASES.get(name)
+            if case is None:
+                continue
+            with self.subTest(view=name):
+                small_status, small, _ = self.measure(name, SMALL)
+                status, large, elapsed_ms = self.measure(name, LARGE)
+                self.assertEqual(small_status, case.status, f"{name} returned {small_status}")
+                self.assertEqual(status, case.status, f"{name} returned {status}")
+                self.assertEqual(
+                    len(small), len(large),
+                    f"{name}: {len(small)} queries with {SMALL} rows vs {len(large)} with {LARGE}\n"
+                    f"Small:\n{self.format_queries(small)}\nLarge:\n{self.format_queries(large)}",
+                )
+                self.assertLessEqual(
+                    len(large), case.budget,
+                    f"{name}: {len(large)} queries exceeds budget of {case.budget}\n{self.format_queries(large)}",
+                )
+                self.assertLess(elapsed_ms, case.latency_ms, f"{name} took {elapsed_ms:.0f}ms")
+
+
+class RateLimitConfigCacheTests(TestCase):
+    """Per-user limits are served from cache and invalidated on writes."""
+
+    def setUp(self):
+        cache.clear()
+        _local_configs.clear()
+        self.user = User.objects.create_user('limits', 'limits@example.com', PASSWORD)
+
+    def config_queries(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            result = func()
+        return result, [q['sql'] for q in ctx.captured_queries if 'chat_ratelimitconfig' in q['sql']]
+
+    def test_defaults_without_creating_a_row(self):
+        config, queries = self.config_queries(lambda: RateLimiter.get_config(self.user))
+        self.assertEqual(config.messages_per_hour, RateLimitConfig.DEFAULT_LIMITS['messages_per_hour'])
+        self.assertEqual(len(queries), 1)
+        self.assertFalse(RateLimitConfig.objects.filter(user=self.user).exists())
+
+    def test_steady_state_does_not_query_limits(self):
+        RateLimiter.check_rate_limit(self.user)
+        _, queries = self.config_queries(lambda: RateLimiter.check_rate_limit(self.user))
+        self.assertEqual(queries, [])
+        # A fresh worker still finds the limits in the shared cache
+        _local_configs.clear()
+        _, queries = self.config_queries(lambda: RateLimiter.get_user_stats(self.user))
+        self.assertEqual(queries, [])
+
+    def test_admin_edits_invalidate_cache(self):
+        self.assertFalse(RateLimiter.get_config(self.user).is_premium)
+        config = RateLimitConfig.get_or_create_default(self.user)
+        config.is_premium = True
+        config.messages_per_hour = 1
+        config.save()
+        cached = RateLimiter.get_config(self.user)
+        self.assertTrue(cached.is_premium)
+        self.assertEqual(cached.messages_per_hour, 1)
+        config.delete()
+        self.assertEqual(RateLimiter.get_config(self.user).messages_per_hour,
+                         RateLimitConfig.DEFAULT_LIMITS['messages_per_hour'])
+
+    @override_settings(RATE_LIMIT_CACHE_TTL=86400, RATE_LIMIT_LOCAL_TTL=30)
+    def test_long_ttl_needs_a_shared_cache(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            RateLimiter.get_config(self.user)
+        self.assertEqual(cache_set.call_args.args[2], 30)
+        _local_configs.clear()
+        cache.clear()
+        with mock.patch('chat.rate_limit.shared_cache', return_value=True), \
+                mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            RateLimiter.get_config(self.user)
+        self.assertEqual(cache_set.call_args.args[2], 86400)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PERF_LOG_REQUESTS=False,
+                   METRICS_DIR='', STORAGES=SOURCE_STATIC)
+class AdminTests(TestCase):
+    """Admin change lists don't grow with the table, and bulk actions are set-based."""
+
+    def setUp(self):
+        cache.clear()
+        _local_configs.clear()
+        self.fixture = seed_user_data(SMALL)
+        self.user = self.fixture['user']
+        admin_user = User.objects.create_superuser('operator', 'operator@example.com', PASSWORD)
+        self.client.force_login(admin_user)
+
+    def changelist(self, model, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f'admin:chat_{model}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_change_lists_use_cursor_pages_and_bounded_counts(self):
+        self.changelist('apiusagelog')  # warms the cached user
+        _, small = self.changelist('apiusagelog')
+        APIUsageLog.objects.bulk_create([APIUsageLog(user=self.user, endpoint='chat') for _ in range(150)])
+        response, large = self.changelist('apiusagelog')
+        self.assertEqual(small, large)
+        self.assertContains(response, f'{SMALL * 2 + 150} api usage logs')
+        older = response.context['cl'].older_url()
+        self.assertIsNotNone(older)
+        response = self.client.get(reverse('admin:chat_apiusagelog_changelist') + older)
+        self.assertEqual(len(response.context['cl'].result_list), SMALL * 2 + 150 - 100)
+        self.assertIsNone(response.context['cl'].older_url())
+
+        with override_settings(ADMIN_EXACT_COUNT_LIMIT=10):
+            self.assertContains(self.changelist('apiusagelog')[0], '10+ api usage logs')
+        year = timezone.now().year
+        response, _ = self.changelist('apiusagelog', timestamp__year=year)
+        self.assertContains(response, f'timestamp__month=12&amp;timestamp__year={year}')
+        for model in ('message', 'chatsession', 'ratelimitconfig'):
+            self.changelist(model)
+        session = ChatSession.objects.get(session_id=self.fixture['session_id'])
+        self.assertEqual(self.client.get(reverse('admin:chat_chatsession_change', args=[session.pk])).status_code, 200)
+
+    def test_estimated_count_comes_from_planner_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_row_count(APIUsageLog, 'default'), APIUsageLog.objects.count())
+
+    def test_bulk_actions(self):
+        url = reverse('admin:auth_user_changelist')
+        RateLimiter.check_rate_limit(self.user)  # caches the defaults
+        self.client.post(url, {'action': 'make_premium', '_selected_action': [self.user.pk]})
+        self.assertTrue(RateLimiter.get_config(self.user).is_premium)
+
+        APIUsageLog.objects.bulk_create([APIUsageLog(user=self.user, endpoint='chat') for _ in range(3)])
+        self.assertEqual(RateLimiter.get_user_stats(self.user)['messages_hour']['current'], 3)
+        self.client.post(reverse('admin:chat_ratelimitconfig_changelist'), {
+            'action': 'reset_quota', '_selected_action': [self.user.rate_limit_config.pk],
+        })
+        self.assertEqual(RateLimiter.get_user_stats(self.user)['messages_hour']['current'], 0)
+
+        self.client.post(reverse('admin:chat_apiusagelog_changelist') + '?q=harness', {
+            'action': 'purge_logs', 'select_across': 1, 'index': 0,
+            '_selected_action': [APIUsageLog.objects.first().pk],
+        })
+        self.assertFalse(APIUsageLog.objects.filter(user=self.user).exists())
+        self.assertTrue(APIUsageLog.objects.filter(user__username='neighbour').exists())
+
+
+@override_settings(MESSAGE_COMPRESSION='zlib', MESSAGE_COMPRESSION_MIN_LENGTH=64, PERF_LOG_REQUESTS=False,
+                   METRICS_DIR='')
+class MessageCompressionTests(TestCase):
+    """Long message text is stored compressed and still readable and searchable."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('compress', 'compress@example.com', PASSWORD)
+        self.session = ChatSession.objects.create(user=self.user, session_id=str(uuid.uuid4()))
+        self.long_text = "Scleral lenses vault the cornea. " * 20
+
+    def stored(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT text_content FROM chat_message WHERE id = %s", [message.pk])
+            return cursor.fetchone()[0]
+
+    def test_long_text_is_compressed_and_short_text_is_not(self):
+        long_message = Message.objects.create(session=self.session, text_content=self.long_text)
+        short_message = Message.objects.create(session=self.session, text_content="Hi")
+        self.assertTrue(is_compressed(self.stored(long_message)))
+        self.assertLess(len(self.stored(long_message)), len(self.long_text))
+        self.assertEqual(self.stored(short_message), "Hi")
+        self.assertEqual(Message.objects.get(pk=long_message.pk).text_content, self.long_text)
+        # Plain text that looks like the marker is escaped by compressing it
+        tricky = Message.objects.create(session=self.session, text_content=MARKER + "z")
+        self.assertEqual(Message.objects.get(pk=tricky.pk).text_content, MARKER + "z")
+
+    def test_search_matches_compressed_messages(self):
+        Message.objects.create(session=self.session, text_content=self.long_text)
+        Message.objects.create(session=self.session, text_content="Soft lens question")
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('search_chats'), {'q': 'VAULT'})
+        self.assertEqual(len(response.json()['results']), 1)
+        response = self.client.get(reverse('search_chats'), {'q': 'lens'})
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def search_decodes(self, query):
+        with mock.patch('chat.fields.decompress_text', wraps=decompress_text) as decode:
+            response = self.client.get(reverse('search_chats'), {'q': query})
+        return response.json()['results'], sum(is_compressed(c.args[0]) for c in decode.call_args_list)
+
+    def test_search_reads_compressed_candidates_in_bounded_chunks(self):
+        Message.objects.bulk_create(Message(session=self.session, text_content=self.long_text) for _ in range(150))
+        self.client.force_login(self.user)
+        results, decoded = self.search_decodes('vault')
+        self.assertEqual(len(results), 20)
+        self.assertLessEqual(decoded, chat_views.SEARCH_CHUNK)
+        with override_settings(SEARCH_SCAN_LIMIT=60):
+            results, decoded = self.search_decodes('no such words')
+        self.assertEqual((results, decoded), ([], 60))
+
+
+@override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='')
+class SessionArchiveTests(TestCase):
+    """Idle sessions are archived as one blob and rehydrated when reopened."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('archive', 'archive@example.com', PASSWORD)
+        self.session = ChatSession.objects.create(user=self.user, session_id=str(uuid.uuid4()), title="Old chat")
+        for n in range(3):
+            Message.objects.create(session=self.session, text_content=f"Message {n}", is_user=n % 2 == 0)
+        self.original = list(self.session.messages.values_list('text_content', 'timestamp'))
+        self.client.force_login(self.user)
+
+    def archive(self):
+        cutoff = timezone.now() + timedelta(seconds=1)
+        self.assertEqual(archive_session(self.session.pk, cutoff)[0], 3)
+
+    def test_archived_session_is_listed_and_rehydrated_on_open(self):
+        self.archive()
+        self.assertFalse(Message.objects.filter(session=self.session).exists())
+        sessions = self.client.get(reverse('get_user_sessions')).json()['sessions']
+        self.assertEqual([(s['session_id'], s['is_archived']) for s in sessions], [(self.session.session_id, True)])
+
+        history = self.client.get(reverse('get_chat_history', args=[self.session.session_id])).json()['history']
+        self.assertEqual([m['text'] for m in history], ["Message 0", "Message 1", "Message 2"])
+        self.assertEqual(list(self.session.messages.values_list('text_content', 'timestamp')), self.original)
+        self.assertFalse(ArchivedSession.objects.exists())
+
+    def test_export_reads_archive_without_rehydrating(self):
+        self.archive()
+        data = json.loads(self.client.get(reverse('export_json', args=[self.session.session_id])).content)
+        self.assertEqual(len(data['messages']), 3)
+        self.assertTrue(ArchivedSession.objects.filter(session=self.session).exists())
+
+    def test_recently_active_session_is_skipped(self):
+        self.assertIsNone(archive_session(self.session.pk, timezone.now() - timedelta(days=1)))
+
+    def test_rehydrated_messages_keep_their_ids(self):
+        retrieval._indexes.clear()
+        ids = list(self.session.messages.values_list('pk', flat=True))
+        index = retrieval.UserIndex.load(self.user.pk)
+        self.assertEqual(index.update(), 3)
+        self.archive()
+        rehydrate_session(self.session)
+        self.assertEqual(list(self.session.messages.values_list('pk', flat=True)), ids)
+        # The index still points at the same rows and has nothing new to embed
+        self.assertEqual(retrieval.UserIndex.load(self.user.pk).update(), 0)
+        snippets = retrieval.related_snippets(self.user.pk, 'Message 1')
+        self.assertIn(ids[1], [snippet.message_id for snippet in snippets])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PERF_LOG_REQUESTS=False,
+                   METRICS_DIR='')
+class DeletionTests(TestCase):
+    """Deletes hide rows at once; the reaper removes them in batches."""
+
+    def setUp(self):
+        self.fixture = seed_user_data(SMALL)
+        self.user = self.fixture['user']
+        self.client.force_login(self.user)
+
+    def test_deleted_session_is_hidden_then_reaped(self):
+        session_id = self.fixture['session_id']
+        response = self.client.delete(reverse('delete_session', args=[session_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ChatSession.objects.filter(session_id=session_id).exists())
+        self.assertEqual(len(self.client.get(reverse('get_user_sessions')).json()['sessions']), SMALL - 1)
+        results = self.client.get(reverse('search_chats'), {'q': 'lens'}).json()['results']
+        self.assertNotIn(session_id, {r['session_id'] for r in results})
+
+        job = DeletionJob.objects.get()
+        deleted = reap(job, batch_size=1)
+        self.assertEqual(deleted, SMALL + SMALL + 1)  # messages, tag links, session
+        self.assertEqual(ChatSession.all_objects.filter(user=self.user).count(), SMALL - 1)
+        self.assertIsNotNone(DeletionJob.objects.get().finished_at)
+
+    def test_deleted_account_is_deactivated_then_reaped(self):
+        response = self.client.post(reverse('delete_account'), {'password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.is_active)
+        self.assertNotEqual(user.username, 'harness')
+        self.assertFalse(ChatSession.objects.filter(user=user).exists())
+        # The username can be reused immediately
+        User.objects.create_user('harness', 'harness@example.com', PASSWORD)
+
+        reap(DeletionJob.objects.get(), batch_size=3)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(ChatSession.all_objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(APIUsageLog.objects.filter(user_id=self.user.pk).exists())
+        self.assertTrue(ChatSession.objects.filter(user__username='neighbour').exists())
+
+
+class ReplicaRouterTests(TestCase):
+    """Reads go to the replica only inside use_replica views, never after a write."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def route(self, pinned=False, read_db=routers.REPLICA):
+        state, token = routers.begin_request(pinned=pinned)
+        state.read_db = read_db
+        self.addCleanup(routers.end_request, token)
+        return state
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Message), 'default')
+
+    def test_replica_until_the_request_writes(self):
+        self.route()
+        self.assertEqual(self.router.db_for_read(Message), 'replica')
+        self.assertEqual(self.router.db_for_write(Message), 'default')
+        self.assertEqual(self.router.db_for_read(Message), 'default')
+
+    def test_session_writes_do_not_pin(self):
+        self.route()
+        self.router.db_for_write(Session)
+        self.assertEqual(self.router.db_for_read(Message), 'replica')
+
+    @override_settings(CHAT_SHARDING=True)
+    def test_writes_answered_by_the_shard_router_pin_too(self):
+        chain = ConnectionRouter(['chat.sharding.ShardRouter', 'chat.routers.ReplicaRouter'])
+        state = self.route()
+        with sharding.using_shard('shard_0'):
+            self.assertEqual(chain.db_for_write(Session), 'default')
+            self.assertFalse(state.wrote)
+            self.assertEqual(chain.db_for_write(Message), 'shard_0')
+        self.assertTrue(state.wrote)
+        self.assertEqual(chain.db_for_read(User), 'default')
+
+    def test_pinned_or_unhealthy_replica_reads_primary(self):
+        self.route(pinned=True)
+        self.assertEqual(self.router.db_for_read(Message), 'default')
+        self.route(read_db=None)
+        self.assertEqual(self.router.db_for_read(Message), 'default')
+
+    def test_migrations_skip_the_replica(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'chat'))
+        self.assertTrue(self.router.allow_migrate('default', 'chat'))
+
+    @override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='')
+    def test_writes_pin_the_client_to_the_primary(self):
+        fixture = seed_user_data(SMALL)
+        self.client.force_login(fixture['user'])
+        response = self.client.get(reverse('get_user_sessions'))
+        self.assertNotIn('db_pin', response.cookies)
+        response = self.client.delete(reverse('delete_session', args=[fixture['session_id']]))
+        self.assertEqual(response.cookies['db_pin']['max-age'], settings.REPLICA_PIN_SECONDS)
+
+
+class WriteQueueTests(TestCase):
+    """Group commit writes mixed models in one transaction and hands back saved rows."""
+
+    def test_batch_commits_every_model(self):
+        fixture = seed_user_data(SMALL)
+        session = ChatSession.objects.get(session_id=fixture['session_id'])
+        items = [
+            (Message(session=session, text_content='queued', is_user=True), Future()),
+            (APIUsageLog(user=fixture['user'], endpoint='chat', response_time=0.1), Future()),
+        ]
+        WriteQueue()._commit(items)
+        for instance, future in items:
+            self.assertIsNotNone(future.result(timeout=0).pk)
+        self.assertTrue(Message.objects.filter(session=session, text_content='queued').exists())
+
+    def test_single_failing_row_fails_only_its_caller(self):
+        future = Future()
+        WriteQueue()._commit([(Message(session_id=None, text_content='orphan'), future)])
+        self.assertIsNotNone(future.exception(timeout=0))
+
+    def test_insert_inside_transaction_bypasses_queue(self):
+        fixture = seed_user_data(SMALL)
+        with override_settings(SQLITE_WRITE_QUEUE=True), transaction.atomic():
+            message = insert(Message, session_id=ChatSession.objects.get(session_id=fixture['session_id']).pk,
+                             text_content='direct')
+        self.assertIsNotNone(message.pk)
+
+
+@override_settings(SQLITE_WRITE_QUEUE=True)
+class QueuedInsertSignalTests(TransactionTestCase):
+    """Rows written through the writer queue send the same save signals as Model.save()."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('queued', 'queued@example.com', PASSWORD)
+        self.session = ChatSession.objects.create(user=self.user, session_id='queued', title='Queued')
+        self.saved = []
+
+        def receiver(sender, instance, created, using, **kwargs):
+            self.saved.append((sender, instance.pk, created, using))
+
+        post_save.connect(receiver, sender=Message, weak=False, dispatch_uid='queued-test')
+        self.addCleanup(post_save.disconnect, sender=Message, dispatch_uid='queued-test')
+
+    def test_insert_and_ainsert_send_post_save(self):
+        with mock.patch.object(WriteQueue, 'submit', autospec=True, side_effect=WriteQueue.submit) as submit:
+            message = insert(Message, session=self.session, text_content='sync', is_user=True)
+            reply = async_to_sync(ainsert)(Message, session=self.session, text_content='async')
+        self.assertEqual(submit.call_count, 2)
+        self.assertEqual(self.saved, [(Message, message.pk, True, 'default'), (Message, reply.pk, True, 'default')])
+        self.assertEqual(Message.objects.filter(session=self.session).count(), 2)
+
+
+@override_settings(CHAT_SHARDING=True, SHARD_DIRECTORY_LOCAL_TTL=0, PERF_LOG_REQUESTS=False, METRICS_DIR='')
+class ShardingTests(TestCase):
+    """Each user's chat data lives on one shard, found through the directory, and can be moved."""
+
+    databases = {'default', 'shard_0', 'shard_1'}
+
+    def setUp(self):
+        cache.clear()
+        sharding._local_shards.clear()
+
+    def seed_on_shard(self):
+        user = User.objects.create_user('sharded', 'sharded@example.com', PASSWORD)
+        with sharding.for_user(user.pk):
+            session = ChatSession.objects.create(user=user, session_id='sharded-1', title='Lens chat')
+            tag = ChatTag.objects.create(user=user, name='Refraction')
+            session.tags.add(tag)
+            for n in range(3):
+                Message.objects.create(session=session, text_content=f"Contact lens question {n}")
+        return user, sharding.shard_for_user(user.pk)
+
+    def test_sharding_requires_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_sharding_cache(None)], ['chat.E001'])
+        with mock.patch('chat.checks.shared_cache', return_value=True):
+            self.assertEqual(check_sharding_cache(None), [])
+
+    def test_user_foreign_keys_are_only_unconstrained_on_shards(self):
+        def user_foreign_keys(alias):
+            with connections[alias].cursor() as cursor:
+                constraints = connections[alias].introspection.get_constraints(cursor, 'chat_chatsession')
+            return [c for c in constraints.values() if c['foreign_key'] and c['foreign_key'][0] == 'auth_user']
+        self.assertEqual(len(user_foreign_keys('default')), 1)
+        self.assertEqual(user_foreign_keys('shard_0'), [])
+
+    def test_ring_only_moves_keys_to_a_new_shard(self):
+        before = sharding.HashRing(['shard_0', 'shard_1'])
+        after = sharding.HashRing(['shard_0', 'shard_1', 'shard_2'])
+        moved = [key for key in range(3000) if before.node_for(key) != after.node_for(key)]
+        self.assertLess(len(moved), 1500)
+        self.assertTrue(all(after.node_for(key) == 'shard_2' for key in moved))
+
+    def test_new_users_data_lives_on_their_shard(self):
+        user, alias = self.seed_on_shard()
+        self.assertIn(alias, settings.CHAT_SHARDS)
+        self.assertFalse(ChatSession.all_objects.using('default').filter(user=user).exists())
+        session = ChatSession.all_objects.using(alias).get(user=user)
+        self.assertGreaterEqual(session.pk, sharding.SHARD_ID_BLOCK)
+        self.assertEqual(Message.objects.using(alias).filter(session=session).count(), 3)
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('get_user_sessions'))
+        self.assertEqual([s['session_id'] for s in response.json()['sessions']], ['sharded-1'])
+        response = self.client.get(reverse('get_chat_history', args=['sharded-1']))
+        self.assertEqual(len(response.json()['history']), 3)
+
+    def test_users_with_existing_rows_stay_on_default(self):
+        with override_settings(CHAT_SHARDING=False):
+            fixture = seed_user_data(SMALL)
+        self.assertEqual(sharding.shard_for_user(fixture['user'].pk), 'default')
+
+    def test_move_keeps_ids_and_follows_the_user(self):
+        user, source = self.seed_on_shard()
+        target = next(alias for alias in settings.CHAT_SHARDS if alias != source)
+        message_ids = set(Message.objects.using(source).values_list('pk', flat=True))
+
+        call_command('move_user_shard', user.pk, '--to', target, stdout=StringIO())
+
+        self.assertEqual(ShardAssignment.objects.get(user_id=user.pk).shard, target)
+        self.assertEqual(set(Message.objects.using(target).values_list('pk', flat=True)), message_ids)
+        self.assertFalse(ChatSession.all_objects.using(source).filter(user=user).exists())
+        self.assertFalse(ChatTag.objects.using(source).filter(user=user).exists())
+        self.client.force_login(user)
+        response = self.client.get(reverse('get_sessions_by_tag', args=[ChatTag.objects.using(target).get().pk]))
+        self.assertEqual([s['session_id'] for s in response.json()['sessions']], ['sharded-1'])
+
+    def test_writes_are_refused_while_moving(self):
+        user, alias = self.seed_on_shard()
+        ShardAssignment.objects.filter(user_id=user.pk).update(moving=True)
+        sharding.invalidate_directory(user.pk)
+        self.client.force_login(user)
+        response = self.client.delete(reverse('delete_session', args=['sharded-1']))
+        self.assertEqual(response.status_code, 503)
+        self.assertIsNone(ChatSession.all_objects.using(alias).get(user=user).deleted_at)
+
+    def test_shards_only_get_chat_tables(self):
+        router = sharding.ShardRouter()
+        self.assertTrue(router.allow_migrate('shard_0', 'chat', 'message'))
+        self.assertFalse(router.allow_migrate('shard_0', 'chat', 'apiusagelog'))
+        self.assertFalse(router.allow_migrate('shard_0', 'auth', 'user'))
+        self.assertIsNone(router.allow_migrate('default', 'chat', 'message'))
+
+
+@override_settings(RETRIEVAL_SEGMENT_SIZE=4, RETRIEVAL_MIN_SCORE=0.1)
+class RetrievalTests(TestCase):
+    """The per-user index grows with new messages and finds related snippets from other chats."""
+
+    def setUp(self):
+        retrieval._indexes.clear()
+        self.user = User.objects.create_user('student', 'student@example.com', PASSWORD)
+        self.refraction = ChatSession.objects.create(user=self.user, session_id='refraction', title='Refraction')
+        self.business = ChatSession.objects.create(user=self.user, session_id='business', title='Business')
+        for text in ('How do I perform retinoscopy on a myopic child?',
+                     'Retinoscopy reflex moves against the streak in myopia.',
+                     'Cycloplegic refraction helps with young children.'):
+            Message.objects.create(session=self.refraction, text_content=text)
+        for text in ('Pricing frames for a new optical store', 'Marketing a dry eye clinic on social media'):
+            Message.objects.create(session=self.business, text_content=text)
+
+    def test_similar_texts_score_higher(self):
+        vectors = retrieval.embed(['retinoscopy in myopic children', 'retinoscopy for a myopic child',
+                                   'pricing frames in a store'])
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+
+    def test_index_updates_incrementally(self):
+        index = retrieval.UserIndex.load(self.user.pk)
+        self.assertEqual(index.update(), 5)
+        self.assertEqual(RetrievalSegment.objects.filter(user=self.user).count(), 2)
+        Message.objects.create(session=self.business, text_content='Opening hours for the optical store')
+        index = retrieval.UserIndex.load(self.user.pk)
+        self.assertEqual(len(index.vectors), 5)
+        self.assertEqual(index.update(), 1)
+        self.assertEqual(len(retrieval.UserIndex.load(self.user.pk).vectors), 6)
+
+    def test_snippets_skip_excluded_and_deleted(self):
+        retrieval.update_index(self.user.pk)
+        excluded = Message.objects.get(text_content__startswith='How do I perform')
+        snippets = retrieval.related_snippets(self.user.pk, 'retinoscopy streak in myopia',
+                                              exclude_ids={excluded.pk})
+        self.assertEqual(snippets[0].text, 'Retinoscopy reflex moves against the streak in myopia.')
+        self.assertNotIn(excluded.pk, [s.message_id for s in snippets])
+        self.assertIn('[Refraction]', retrieval.format_snippets(snippets))
+
+        soft_delete_session(self.refraction)
+        self.assertEqual(retrieval.related_snippets(self.user.pk, 'retinoscopy streak in myopia'), [])
+
+    def test_lookups_reuse_the_loaded_index_until_it_changes(self):
+        self.assertEqual(retrieval.update_index(self.user.pk), 5)
+        with CaptureQueriesContext(connection) as ctx:
+            snippets = retrieval.related_snippets(self.user.pk, 'pricing frames')
+        self.assertEqual(snippets[0].text, 'Pricing frames for a new optical store')
+        # Watermark check and the matched messages; the vectors come from memory
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+        Message.objects.create(session=self.business, text_content='Scleral lens fitting basics')
+        # Lookups never embed new messages themselves
+        snippets = retrieval.related_snippets(self.user.pk, 'scleral lens fitting')
+        self.assertNotIn('Scleral lens fitting basics', [snippet.text for snippet in snippets])
+        # Another process indexes it: the changed watermark makes this one reload
+        self.assertEqual(retrieval.UserIndex.load(self.user.pk).update(), 1)
+        snippets = retrieval.related_snippets(self.user.pk, 'scleral lens fitting')
+        self.assertEqual(snippets[0].text, 'Scleral lens fitting basics')
+
+    def test_update_is_scheduled_after_commit(self):
+        with mock.patch.object(retrieval.indexer, 'submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            retrieval.schedule_update(self.user.pk)
+            submit.assert_not_called()
+        submit.assert_called_once_with(self.user.pk)
+
+
+@override_settings(ROUTING_MIN_SAMPLES=5, ROUTING_MAX_ERROR_RATE=0.2, ROUTING_MAX_P95=10, METRICS_DIR='',
+                   PERF_LOG_REQUESTS=False, RETRIEVAL_ENABLED=False)
+class ModelRoutingTests(TestCase):
+    """Turns are routed by cost, degraded models fail over, and decisions are logged."""
+
+    def setUp(self):
+        model_routing.stats.clear()
+        self.addCleanup(model_routing.stats.clear)
+
+    def test_classification(self):
+        self.assertEqual(model_routing.classify('What is hyperopia?'), ('light', 'short_lookup'))
+        self.assertEqual(model_routing.classify('Write a business plan for a mobile eye clinic')[0], 'heavy')
+        self.assertEqual(model_routing.classify('Tell me more ' * 100), ('heavy', 'long_prompt'))
+        self.assertEqual(model_routing.classify('What is hyperopia?', history_chars=10000),
+                         ('standard', 'long_history'))
+        self.assertEqual(model_routing.classify('How should I practise retinoscopy at home?'),
+                         ('standard', 'default'))
+
+    def test_short_everyday_prompts_stay_on_the_default_tier(self):
+        for prompt in ('Can you outline the steps of a cover test?',
+                       'How do I compare two contact lens base curves?',
+                       'Is this report of my visual field normal?',
+                       'How much budget should I keep for a trial lens set?'):
+            self.assertEqual(model_routing.classify(prompt), ('standard', 'default'), prompt)
+        detailed = ('Compare the running costs of a solo practice and a franchise optical store over five '
+                    'years, including staff, equipment leases, rent and the expected patient volume in a '
+                    'mid-sized town, and tell me which one suits a new graduate.')
+        self.assertEqual(model_routing.classify(detailed), ('heavy', 'keyword:compare'))
+
+    def test_degraded_primary_fails_over_until_it_recovers(self):
+        primary = settings.CHAT_ROUTES['standard']['model']
+        for ok in (True, True, True, False, False):
+            model_routing.stats.record(primary, 1.0, ok)
+        route = model_routing.choose_route('How should I practise retinoscopy at home?')
+        self.assertEqual(route.model, settings.CHAT_ROUTES['standard']['fallback'])
+        self.assertEqual(route.models, [route.model, primary])
+        self.assertTrue(route.log_fields()['fallback'])
+
+        with override_settings(ROUTING_STATS_MAX_AGE=0):
+            self.assertEqual(model_routing.choose_route('How should I practise retinoscopy?').model, primary)
+
+    def test_failing_model_is_retried_on_fallback_and_logged(self):
+        heavy = settings.CHAT_ROUTES['heavy']
+        user = User.objects.create_user('router', 'router@example.com', PASSWORD)
+        client = Client()
+        client.force_login(user)
+        with FakeGeminiServer(latency=0, failing_models={heavy['model']}) as server, \
+                override_settings(GEMINI_API_BASE=server.base_url, GEMINI_API_KEY='test-key'):
+            response = client.post(reverse('api_chat'), json.dumps({'prompt': 'Draft a business plan for a clinic'}),
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['path'].split('/')[-1].split(':')[0] for r in server.requests],
+                         [heavy['model'], heavy['fallback']])
+        self.assertEqual(server.requests[0]['body']['generationConfig']['maxOutputTokens'],
+                         heavy['max_output_tokens'])
+        log = APIUsageLog.objects.get(user=user)
+        self.assertEqual((log.llm_model, log.route, log.route_reason, log.fallback),
+                         (heavy['fallback'], 'heavy', 'keyword:business plan', True))
+        self.assertEqual(model_routing.stats.snapshot(heavy['model'])['error_rate'], 1.0)
+
+
+@override_settings(STORAGES=SOURCE_STATIC, PERF_LOG_REQUESTS=False, METRICS_DIR='')
+class ChatPageAssetTests(TestCase):
+    """The chat page links its CSS and JavaScript as static files instead of inlining them."""
+
+    def test_page_links_static_assets(self):
+        user = User.objects.create_user('assets', 'assets@example.com', PASSWORD)
+        client = Client()
+        client.force_login(user)
+        html = client.get(reverse('nicole_chat')).content.decode()
+        self.assertNotIn('<style>', html)
+        self.assertNotIn('<script>', html)
+        self.assertIn('data-username="assets"', html)
+        for name in ('chat/css/chat.css', 'chat/js/chat.js'):
+            self.assertIn(settings.STATIC_URL + name, html)
+            self.assertTrue(finders.find(name), name)
+
+
+@override_settings(RESPONSE_COMPRESSION_MIN_BYTES=1024, PERF_LOG_REQUESTS=False, METRICS_DIR='')
+class JsonResponseTests(TestCase):
+    """API JSON is serialised like Django's encoder would and compressed when the client accepts it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('json', 'json@example.com', PASSWORD)
+        self.session = ChatSession.objects.create(user=self.user, session_id='json-session', title='JSON')
+        Message.objects.bulk_create([
+            Message(session=self.session, text_content=f'Accommodation and convergence, part {i}. ' * 5)
+            for i in range(40)
+        ])
+        self.client.force_login(self.user)
+
+    def test_matches_django_encoder(self):
+        data = {'when': timezone.now(), 'id': uuid.uuid4(), 'price': Decimal('12.50'), 1: ['ünïcode', None]}
+        expected = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+        self.assertEqual(json.loads(http.dumps(data)), expected)
+        self.assertEqual(json.loads(http.dumps(data, indent=True)), expected)
+
+    def test_negotiates_compression(self):
+        url = reverse('get_chat_history', args=['json-session'])
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        for accept, encoding, decompress in (('gzip, deflate, br', 'br', brotli.decompress),
+                                             ('br;q=0.5, gzip', 'gzip', gzip.decompress)):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertLess(len(response.content), len(plain.content))
+            self.assertEqual(json.loads(decompress(response.content)), plain.json())
+
+        self.assertNotIn('Content-Encoding', self.client.get(url, HTTP_ACCEPT_ENCODING='identity'))
+        small = self.client.get(reverse('usage_stats'), HTTP_ACCEPT_ENCODING='br')
+        self.assertNotIn('Content-Encoding', small)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PERF_LOG_REQUESTS=False,
+                   METRICS_DIR='')
+class BulkSessionTests(TestCase):
+    """Bulk endpoints act on the caller's sessions only and report on every id sent."""
+
+    def setUp(self):
+        self.fixture = seed_user_data(SMALL)
+        self.user = self.fixture['user']
+        self.client.force_login(self.user)
+        self.foreign = ChatSession.objects.filter(user__username='neighbour').first().session_id
+
+    def post(self, name, **data):
+        return self.client.post(reverse(name), json.dumps(data), content_type='application/json')
+
+    def test_bulk_delete(self):
+        ids = self.fixture['session_ids'] + [self.foreign, 'missing']
+        response = self.post('bulk_delete_sessions', session_ids=ids)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['deleted'], SMALL)
+        self.assertEqual([r['status'] for r in body['results']], ['deleted'] * SMALL + ['not_found'] * 2)
+        self.assertFalse(ChatSession.objects.filter(user=self.user).exists())
+        self.assertTrue(ChatSession.objects.filter(session_id=self.foreign).exists())
+        self.assertEqual(DeletionJob.objects.filter(kind='session').count(), SMALL)
+        self.assertEqual((UserStats.objects.get(user=self.user).sessions,
+                          UserStats.objects.get(user=self.user).messages), (0, 0))
+
+    def test_bulk_tag_and_untag(self):
+        tag = ChatTag.objects.create(user=self.user, name='Bulk')
+        foreign_tag = ChatTag.objects.filter(user__username='neighbour').first()
+        ids = self.fixture['session_ids'] + [self.foreign]
+        body = self.post('bulk_tag_sessions', session_ids=ids, tag_ids=[tag.pk, foreign_tag.pk]).json()
+        self.assertEqual(body['added'], SMALL)
+        self.assertEqual(body['tags_not_found'], [foreign_tag.pk])
+        self.assertEqual(body['results'][-1]['status'], 'not_found')
+        self.assertEqual(tag.sessions.count(), SMALL)
+        # Existing links are left alone and not counted again
+        self.assertEqual(self.post('bulk_tag_sessions', session_ids=ids, tag_ids=[tag.pk]).json()['added'], 0)
+
+        body = self.post('bulk_untag_sessions', session_ids=ids[:1], tag_ids=[tag.pk]).json()
+        self.assertEqual((body['removed'], body['results'][0]['removed']), (1, 1))
+        self.assertEqual(tag.sessions.count(), SMALL - 1)
+
+    def test_bulk_export(self):
+        ids = [self.fixture['session_ids'][0], self.foreign]
+        archive_session(ChatSession.objects.get(session_id=ids[0]).pk, timezone.now() + timedelta(days=1))
+        response = self.post('bulk_export_sessions', session_ids=ids)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="nicole-chats.json"')
+        body = json.loads(response.content)
+        self.assertEqual([s['session_id'] for s in body['sessions']], ids[:1])
+        self.assertEqual(len(body['sessions'][0]['messages']), SMALL)
+        self.assertEqual(body['not_found'], [self.foreign])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post('bulk_delete_sessions', session_ids=[]).status_code, 400)
+        self.assertEqual(self.post('bulk_tag_sessions', session_ids=['x'], tag_ids=['a']).status_code, 400)
+        with override_settings(BULK_MAX_SESSIONS=1):
+            response = self.post('bulk_delete_sessions', session_ids=self.fixture['session_ids'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ChatSession.objects.filter(user=self.user).count(), SMALL)
+
+
+@override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='')
+class SessionFilterTests(TestCase):
+    """Multi-tag AND/OR filters, text and date filters, and per-tag counts."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('sorter', 'sorter@example.com', PASSWORD)
+        self.client.force_login(self.user)
+        self.refraction, self.business, self.unused = (
+            ChatTag.objects.create(user=self.user, name=name) for name in ('Refraction', 'Business', 'Unused')
+        )
+        self.both = ChatSession.objects.create(user=self.user, session_id='both', title='Clinic refraction plan')
+        self.one = ChatSession.objects.create(user=self.user, session_id='one', title='Retinoscopy notes')
+        self.none = ChatSession.objects.create(user=self.user, session_id='none', title='Untagged')
+        self.both.tags.add(self.refraction, self.business)
+        self.one.tags.add(self.refraction)
+
+    def query(self, **params):
+        response = self.client.get(reverse('filter_sessions'), params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [s['session_id'] for s in body['sessions']], {f['name']: f['count'] for f in body['facets']}
+
+    def test_tag_filters_and_facets(self):
+        tags = f'{self.refraction.pk},{self.business.pk}'
+        ids, facets = self.query(tags=tags, match='all')
+        self.assertEqual(ids, ['both'])
+        self.assertEqual(facets, {'Business': 1, 'Refraction': 1, 'Unused': 0})
+
+        ids, facets = self.query(tags=tags, match='any')
+        self.assertEqual(sorted(ids), ['both', 'one'])
+        self.assertEqual(facets, {'Business': 1, 'Refraction': 2, 'Unused': 0})
+
+        self.assertEqual(self.query(tags=str(self.refraction.pk), q='retinoscopy')[0], ['one'])
+        self.assertEqual(len(self.query()[0]), 3)
+
+    def test_date_range_and_deleted_sessions(self):
+        ChatSession.objects.filter(pk=self.one.pk).update(last_activity=timezone.now() - timedelta(days=10))
+        today = timezone.now().date()
+        self.assertEqual(sorted(self.query(**{'from': str(today - timedelta(days=1))})[0]), ['both', 'none'])
+        self.assertEqual(self.query(to=str(today - timedelta(days=5)))[0], ['one'])
+
+        soft_delete_session(self.both)
+        tags = {t['name']: t['count'] for t in self.client.get(reverse('manage_tags')).json()['tags']}
+        self.assertEqual(tags, {'Business': 0, 'Refraction': 1, 'Unused': 0})
+
+    def test_invalid_parameters(self):
+        for params in ({'tags': 'x'}, {'match': 'some'}, {'from': 'yesterday'}, {'limit': 'many'}):
+            self.assertEqual(self.client.get(reverse('filter_sessions'), params).status_code, 400, params)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PERF_LOG_REQUESTS=False,
+                   METRICS_DIR='', RETRIEVAL_ENABLED=False)
+class UserStatsTests(TestCase):
+    """The stored per-user totals follow every write path and match a full recount."""
+
+    def setUp(self):
+        self.fixture = seed_user_data(SMALL)
+        self.user = self.fixture['user']
+        self.client.force_login(self.user)
+
+    def assertMatchesRecount(self):
+        stored = UserStats.objects.get(user=self.user)
+        expected = user_stats.compute([self.user.pk])[self.user.pk]
+        for name in user_stats.COUNTERS:
+            self.assertEqual(getattr(stored, name), expected[name], name)
+        return stored
+
+    def test_write_paths_keep_totals_in_step(self):
+        with FakeGeminiServer(latency=0) as server, \
+                override_settings(GEMINI_API_BASE=server.base_url, GEMINI_API_KEY='test-key'):
+            response = self.client.post(reverse('api_chat'), json.dumps({'prompt': 'What is myopia?'}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        stored = self.assertMatchesRecount()
+        self.assertEqual((stored.sessions, stored.messages), (SMALL + 1, SMALL * SMALL + 2))
+        self.assertEqual(stored.last_activity, Message.objects.filter(session__user=self.user).latest('timestamp').timestamp)
+
+        response = self.client.post(reverse('manage_tags'), json.dumps({'name': 'Fresh'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.client.delete(reverse('delete_tag', args=[self.fixture['tag_id']]))
+        self.client.delete(reverse('delete_session', args=[self.fixture['session_id']]))
+        # Deleting twice must not count the session twice
+        self.client.delete(reverse('delete_session', args=[self.fixture['session_id']]))
+        stored = self.assertMatchesRecount()
+        self.assertEqual((stored.sessions, stored.tags), (SMALL, SMALL))
+
+    def test_missing_row_is_built_on_read_and_rebuild_repairs_drift(self):
+        UserStats.objects.all().delete()
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['user_sessions'], SMALL)
+        self.assertEqual(response.context['total_messages'], SMALL * SMALL)
+
+        UserStats.objects.filter(user=self.user).update(messages=0, sessions=99)
+        out = StringIO()
+        call_command('rebuild_user_stats', '--user', 'harness', stdout=out)
+        self.assertIn('Rebuilt stats for 1 users', out.getvalue())
+        self.assertMatchesRecount()
+        totals = self.client.get(reverse('usage_stats')).json()['totals']
+        self.assertEqual((totals['sessions'], totals['messages']), (SMALL, SMALL * SMALL))
+
+
+@override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='', RETRIEVAL_ENABLED=False)
+class ClientDisconnectTests(TestCase):
+    """A chat turn whose client goes away stops waiting on Gemini and is logged as cancelled."""
+
+    async def test_cancelled_turn_is_logged_without_a_reply(self):
+        user = await User.objects.acreate_user('leaver', 'leaver@example.com', PASSWORD)
+        await self.async_client.aforce_login(user)
+        with FakeGeminiServer(latency=5) as server, \
+                override_settings(GEMINI_API_BASE=server.base_url, GEMINI_API_KEY='test-key'):
+            task = asyncio.create_task(self.async_client.post(
+                reverse('api_chat'), {'prompt': 'How do I fit toric lenses?', 'session_id': 'leaving'},
+                content_type='application/json',
+            ))
+            while not server.requests:
+                await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertLess(time.perf_counter() - start, 1)
+
+        log = await APIUsageLog.objects.aget(user=user)
+        self.assertEqual(log.status_code, 499)
+        self.assertEqual(log.route, 'standard')
+        self.assertEqual([m.is_user async for m in Message.objects.filter(session__session_id='leaving')], [True])
+
+    async def test_asgi_disconnect_cancels_the_gemini_call(self):
+        from nicole_project.asgi import application
+        user = await User.objects.acreate_user('dropper', 'dropper@example.com', PASSWORD)
+        await self.async_client.aforce_login(user)
+        session_key = self.async_client.cookies[settings.SESSION_COOKIE_NAME].value
+        csrf_token = _get_new_csrf_string()
+        body = json.dumps({'prompt': 'How do I fit toric lenses?', 'session_id': 'dropped'}).encode()
+        path = reverse('api_chat')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            'headers': [
+                (b'host', b'testserver'), (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()), (b'x-csrftoken', csrf_token.encode()),
+                (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}; '
+                            f'{settings.CSRF_COOKIE_NAME}={csrf_token}'.encode()),
+            ],
+        }
+        inbox = asyncio.Queue()
+        await inbox.put({'type': 'http.request', 'body': body, 'more_body': False})
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        model = settings.CHAT_ROUTES['standard']['model']
+        closed = metrics.RESPONSES.values.get(('api_chat', '499'), 0)
+        cancelled = metrics.GEMINI_RESPONSES.values.get((model, 'cancelled'), 0)
+        with FakeGeminiServer(latency=5) as server, \
+                override_settings(GEMINI_API_BASE=server.base_url, GEMINI_API_KEY='test-key'):
+            app = asyncio.create_task(application(scope, inbox.get, send))
+            while not server.requests:
+                await asyncio.sleep(0.01)
+            await inbox.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(app, 1)
+
+        self.assertEqual(sent, [])
+        self.assertEqual(metrics.RESPONSES.values[('api_chat', '499')] - closed, 1)
+        self.assertEqual(metrics.GEMINI_RESPONSES.values[(model, 'cancelled')] - cancelled, 1)
+        log = await APIUsageLog.objects.aget(user=user)
+        self.assertEqual(log.status_code, 499)
+
+
+@override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='', RETRIEVAL_ENABLED=False, PROMPT_CACHE_ENABLED=True,
+                   PROMPT_CACHE_MIN_TOKENS=200, PROMPT_CACHE_MODEL_MIN_TOKENS={}, PROMPT_CACHE_MAX_TAIL=4,
+                   GEMINI_API_KEY='test-key')
+class PromptCacheTests(TestCase):
+    """Long sessions send Gemini a cached prefix handle plus the newer messages, and fall back to full requests."""
+
+    PROMPT = 'How should I practise retinoscopy at home?'
+
+    def setUp(self):
+        prompt_cache._unavailable.clear()
+        self.addCleanup(prompt_cache._unavailable.clear)
+        self.user = User.objects.create_user('cacher', 'cacher@example.com', PASSWORD)
+        self.client.force_login(self.user)
+        self.session = ChatSession.objects.create(user=self.user, session_id='long-chat', title='Long chat')
+        for i in range(6):
+            Message.objects.create(session=self.session, is_user=i % 2 == 0,
+                                   text_content=f'Turn {i}: ' + 'scleral lens fitting notes ' * 40)
+        self.model = settings.CHAT_ROUTES['standard']['model']
+
+    def turn(self):
+        response = self.client.post(reverse('api_chat'), json.dumps({'prompt': self.PROMPT, 'session_id': 'long-chat'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    @staticmethod
+    def generate_calls(server):
+        return [r['body'] for r in server.requests if r['path'].split('?')[0].endswith(':generateContent')]
+
+    def test_handle_is_reused_then_refreshed_as_history_grows(self):
+        hits = metrics.PROMPT_CACHE_EVENTS.values.get((self.model, 'hit'), 0)
+        cached_tokens = metrics.GEMINI_TOKENS.values.get((self.model, 'cached'), 0)
+        with FakeGeminiServer(latency=0) as server, override_settings(GEMINI_API_BASE=server.base_url):
+            self.turn()
+            first = self.generate_calls(server)[-1]
+            self.assertEqual(first['cachedContent'], 'cachedContents/fake1')
+            self.assertNotIn('systemInstruction', first)
+            self.assertEqual([c['parts'][0]['text'] for c in first['contents']], [self.PROMPT])
+            created = server.caches['cachedContents/fake1']
+            self.assertEqual((created['model'], len(created['contents'])), (f'models/{self.model}', 6))
+
+            # Reply + new prompt: three uncached messages, still within the tail limit
+            self.turn()
+            second = self.generate_calls(server)[-1]
+            self.assertEqual((second['cachedContent'], len(second['contents'])), ('cachedContents/fake1', 3))
+
+            # Five uncached messages: the prefix is re-cached and the old handle deleted
+            self.turn()
+            third = self.generate_calls(server)[-1]
+            self.assertEqual((third['cachedContent'], len(third['contents'])), ('cachedContents/fake2', 1))
+            self.assertEqual(list(server.caches), ['cachedContents/fake2'])
+
+        row = PromptCache.objects.get(session=self.session)
+        self.assertEqual((row.name, row.model, row.message_count), ('cachedContents/fake2', self.model, 10))
+        self.assertEqual(metrics.PROMPT_CACHE_EVENTS.values[(self.model, 'hit')] - hits, 1)
+        self.assertGreater(metrics.GEMINI_TOKENS.values[(self.model, 'cached')] - cached_tokens, 3 * 6 * 40)
+
+        handle = prompt_cache.Handle(row.pk, row.name, self.model, covered=1, context='Related notes')
+        applied = handle.apply({'contents': [{'parts': [{'text': 'a'}]}, {'role': 'user', 'parts': [{'text': 'b'}]}],
+                                'systemInstruction': {}, 'generationConfig': {}})
+        self.assertEqual(applied['contents'], [{'role': 'user', 'parts': [{'text': 'Related notes'}, {'text': 'b'}]}])
+        self.assertEqual(set(applied), {'contents', 'generationConfig', 'cachedContent'})
+
+    def test_unsupported_caching_falls_back_to_full_requests(self):
+        with FakeGeminiServer(latency=0, caching=False) as server, override_settings(GEMINI_API_BASE=server.base_url):
+            self.turn()
+            self.turn()
+        calls = self.generate_calls(server)
+        self.assertTrue(all('cachedContent' not in body and 'systemInstruction' in body for body in calls))
+        self.assertEqual([len(body['contents']) for body in calls], [7, 9])
+        # The failed create is not retried on every turn
+        self.assertEqual(sum('/cachedContents' in r['path'] for r in server.requests), 1)
+        self.assertFalse(PromptCache.objects.exists())
+
+        # Prefixes under the minimum never reach the cache API
+        prompt_cache._unavailable.clear()
+        with FakeGeminiServer(latency=0) as server, override_settings(GEMINI_API_BASE=server.base_url,
+                                                                      PROMPT_CACHE_MIN_TOKENS=10 ** 6):
+            self.turn()
+        self.assertEqual([r['path'].split('?')[0].rsplit(':', 1)[-1] for r in server.requests], ['generateContent'])
+
+    def test_minimum_prefix_depends_on_the_model(self):
+        table = {'gemini-1.5': 32768, 'gemini-2.5-flash': 1024, 'gemini-2.5-flash-lite': 2048}
+        with override_settings(PROMPT_CACHE_MODEL_MIN_TOKENS=table, PROMPT_CACHE_MIN_TOKENS=32768):
+            self.assertEqual(prompt_cache.min_tokens('gemini-1.5-flash-8b'), 32768)
+            self.assertEqual(prompt_cache.min_tokens('gemini-2.5-flash'), 1024)
+            self.assertEqual(prompt_cache.min_tokens('gemini-2.5-flash-lite-preview'), 2048)
+            self.assertEqual(prompt_cache.min_tokens('gemini-3-pro'), 32768)
+
+    def test_default_models_cache_a_history_window(self):
+        defaults = {name: getattr(project_settings, name) for name in ('PROMPT_CACHE_MIN_TOKENS',
+                                                                      'PROMPT_CACHE_MODEL_MIN_TOKENS')}
+        with override_settings(**defaults):
+            # A full window of ordinary messages reaches every default model's minimum
+            for route in project_settings.CHAT_ROUTES.values():
+                for model in (route['model'], route['fallback']):
+                    self.assertLessEqual(prompt_cache.min_tokens(model) * 4,
+                                         (project_settings.CHAT_HISTORY_WINDOW - 1) * 1000, model)
+            with FakeGeminiServer(latency=0) as server, override_settings(GEMINI_API_BASE=server.base_url):
+                self.turn()
+        self.assertEqual(self.model, project_settings.CHAT_ROUTES['standard']['model'])
+        self.assertEqual(self.generate_calls(server)[-1]['cachedContent'], 'cachedContents/fake1')
+
+    def test_expired_handle_is_dropped_and_turn_resent_in_full(self):
+        with FakeGeminiServer(latency=0) as server, override_settings(GEMINI_API_BASE=server.base_url):
+            self.turn()
+            server.caches.clear()
+            self.turn()
+            retried = self.generate_calls(server)[-2:]
+        self.assertEqual(retried[0]['cachedContent'], 'cachedContents/fake1')
+        self.assertNotIn('cachedContent', retried[1])
+        self.assertEqual(len(retried[1]['contents']), 9)
+        self.assertFalse(PromptCache.objects.exists())
+
+
+class WebSocketClient:
+    """Drives ``chat.ws.websocket_application`` in memory, as an ASGI server would."""
+
+    def __init__(self, cookies=None, origin='http://testserver', max_pending=0):
+        cookie = '; '.join(f'{key}={morsel.value}' for key, morsel in (cookies or {}).items())
+        scope = {'type': 'websocket', 'path': ws.PATH, 'headers': [
+            (b'host', b'testserver'), (b'origin', origin.encode()), (b'cookie', cookie.encode()),
+        ]}
+        self.inbox = asyncio.Queue()
+        # A bounded outbox stands in for a client that stops reading
+        self.outbox = asyncio.Queue(max_pending)
+        self.task = asyncio.create_task(ws.websocket_application(scope, self.inbox.get, self.outbox.put))
+
+    async def connect(self):
+        await self.inbox.put({'type': 'websocket.connect'})
+        return await self.receive_event()
+
+    async def receive_event(self):
+        return await asyncio.wait_for(self.outbox.get(), 5)
+
+    async def receive(self):
+        event = await self.receive_event()
+        return json.loads(event['text']) if event['type'] == 'websocket.send' else event
+
+    async def receive_until(self, kind):
+        messages = []
+        while not messages or messages[-1].get('type') != kind:
+            messages.append(await self.receive())
+        return messages
+
+    async def send(self, **message):
+        await self.inbox.put({'type': 'websocket.receive', 'text': json.dumps(message, ensure_ascii=False)})
+
+    async def disconnect(self):
+        await self.inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+@override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='', RETRIEVAL_ENABLED=False, GEMINI_API_KEY='test-key')
+class WebSocketTests(TransactionTestCase):
+    """The /ws/chat/ channel: authentication, streamed turns, pushes and per-connection limits."""
+
+    async def login(self):
+        user = await User.objects.acreate_user('socket', 'socket@example.com', PASSWORD)
+        await self.async_client.aforce_login(user)
+        return user, self.async_client.cookies
+
+    async def test_anonymous_and_cross_origin_connections_are_refused(self):
+        _, cookies = await self.login()
+        for client in (WebSocketClient(), WebSocketClient(cookies, origin='https://evil.example.com')):
+            self.assertEqual(await client.connect(), {'type': 'websocket.close', 'code': 1008})
+            await asyncio.wait_for(client.task, 5)
+
+        client = WebSocketClient(cookies)
+        self.assertEqual(await client.connect(), {'type': 'websocket.accept'})
+        self.assertEqual(await client.receive(), {'type': 'hello', 'ping_interval': settings.WS_PING_INTERVAL})
+        await client.disconnect()
+        self.assertFalse(ws.get_hub().connections)
+
+    async def test_turn_is_streamed_and_pushed_to_other_tabs(self):
+        user, cookies = await self.login()
+        tab, other = WebSocketClient(cookies), WebSocketClient(cookies)
+        for client in (tab, other):
+            await client.connect()
+            await client.receive_until('hello')
+
+        with FakeGeminiServer(latency=0, stream_chunk_words=5) as server, \
+                override_settings(GEMINI_API_BASE=server.base_url):
+            await tab.send(type='chat.send', ref='1', prompt='What is amblyopia?', session_id='ws-chat')
+            messages = await tab.receive_until('chat.done')
+        self.assertTrue(server.requests[-1]['path'].split('?')[0].endswith(':streamGenerateContent'))
+        chunks, done = messages[:-1], messages[-1]
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(m['type'] == 'chat.chunk' and m['ref'] == '1' for m in chunks))
+        self.assertEqual(''.join(m['text'] for m in chunks), done['text'])
+        self.assertEqual(done['session_id'], 'ws-chat')
+        self.assertEqual(await Message.objects.filter(session__session_id='ws-chat').acount(), 2)
+
+        for client in (tab, other):
+            updated, delta = await client.receive(), await client.receive()
+            self.assertEqual((updated['type'], updated['session']['session_id']), ('session.updated', 'ws-chat'))
+            self.assertEqual((delta['type'], delta['sessions'], delta['messages']), ('usage.delta', 1, 2))
+
+        await other.send(type='sessions.list')
+        self.assertEqual([s['session_id'] for s in (await other.receive())['sessions']], ['ws-chat'])
+        await other.send(type='tags.list')
+        self.assertEqual(await other.receive(), {'type': 'tags', 'tags': []})
+        await other.send(type='usage.get')
+        self.assertEqual((await other.receive())['usage']['totals']['messages'], 2)
+        await other.send(type='ping')
+        self.assertEqual(await other.receive(), {'type': 'pong'})
+        await other.send(type='nonsense')
+        self.assertEqual((await other.receive())['type'], 'error')
+        for client in (tab, other):
+            await client.disconnect()
+
+    async def test_turn_on_a_deactivated_login_closes_the_socket(self):
+        user, cookies = await self.login()
+        client = WebSocketClient(cookies)
+        await client.connect()
+        await client.receive_until('hello')
+        user.is_active = False
+        await user.asave()
+        closes = metrics.WS_CLOSES.values.get(('session',), 0)
+        await client.send(type='chat.send', ref='1', prompt='Still there?', session_id='ws-gone')
+        self.assertEqual(await client.receive(), {'type': 'websocket.close', 'code': ws.CLOSE_POLICY})
+        self.assertEqual(metrics.WS_CLOSES.values[('session',)] - closes, 1)
+        self.assertFalse(await ChatSession.objects.filter(session_id='ws-gone').aexists())
+        await client.disconnect()
+
+    async def test_reads_recheck_the_session_every_interval(self):
+        _, cookies = await self.login()
+        client = WebSocketClient(cookies)
+        await client.connect()
+        await client.receive_until('hello')
+        await Session.objects.all().adelete()
+        # Inside the interval the login checked on connect still stands
+        await client.send(type='tags.list')
+        self.assertEqual(await client.receive(), {'type': 'tags', 'tags': []})
+        with override_settings(WS_SESSION_CHECK_INTERVAL=0):
+            await client.send(type='tags.list')
+            self.assertEqual(await client.receive(), {'type': 'websocket.close', 'code': ws.CLOSE_POLICY})
+        await client.disconnect()
+
+    @override_settings(WS_MAX_MESSAGE_BYTES=100, WS_PING_INTERVAL=0.05, WS_IDLE_TIMEOUT=0.2)
+    async def test_oversized_and_idle_connections_are_closed(self):
+        _, cookies = await self.login()
+        big, idle = WebSocketClient(cookies), WebSocketClient(cookies)
+        for client in (big, idle):
+            await client.connect()
+            await client.receive_until('hello')
+
+        # 40 characters, but 120 bytes of UTF-8
+        await big.send(type='ping', padding='\u00e9' * 20)
+        self.assertEqual(await big.receive(), {'type': 'pong'})
+        await big.send(type='ping', padding='\u0e01' * 40)
+        self.assertEqual(await big.receive(), {'type': 'websocket.close', 'code': ws.CLOSE_TOO_BIG})
+        start = time.monotonic()
+        self.assertEqual(await idle.receive(), {'type': 'websocket.close', 'code': ws.CLOSE_IDLE})
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        for client in (big, idle):
+            await client.disconnect()
+
+    @override_settings(WS_SEND_QUEUE=2)
+    async def test_client_that_stops_reading_is_disconnected(self):
+        _, cookies = await self.login()
+        closes = metrics.WS_CLOSES.values.get(('slow',), 0)
+        client = WebSocketClient(cookies, max_pending=1)
+        await client.connect()
+        # The client reads nothing more: its outbox holds one frame and the send queue two
+        for _ in range(5):
+            await client.send(type='ping')
+        events = []
+        while not events or events[-1]['type'] != 'websocket.close':
+            events.append(await client.receive_event())
+        self.assertEqual(events[-1], {'type': 'websocket.close', 'code': ws.CLOSE_TRY_AGAIN})
+        self.assertEqual(json.loads(events[0]['text'])['type'], 'hello')
+        self.assertLess(len(events), 5)
+        self.assertEqual(metrics.WS_CLOSES.values[('slow',)] - closes, 1)
+        await client.disconnect()
+
+
+@override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='', SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+@mock.patch('chat.auth_cache.shared_cache', new=lambda alias='default': True)
+class AuthCacheTests(TestCase):
+    """Warm requests read neither django_session nor auth_user; user changes drop the cached user."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', PASSWORD)
+        self.other = Client()
+        self.other.force_login(self.user)
+        self.client.force_login(self.user)
+
+    def auth_queries(self, client=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = (client or self.client).get(reverse('get_user_sessions'))
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'django_session' in q['sql'] or 'auth_user' in q['sql']]
+
+    def test_warm_requests_do_no_auth_queries(self):
+        self.assertEqual(len(self.auth_queries()), 1)
+        self.assertEqual(self.auth_queries(), [])
+        self.assertEqual(self.auth_queries(self.other), [])
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+
+    def test_profile_and_password_changes_drop_the_cached_user(self):
+        self.auth_queries()
+        response = self.client.post(reverse('profile'), {'username': 'renamed', 'email': 'new@example.com',
+                                                         'first_name': '', 'last_name': ''})
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(cache.get(auth_cache.user_cache_key(self.user.pk)))
+        self.assertEqual(len(self.auth_queries()), 1)
+        self.assertEqual(cache.get(auth_cache.user_cache_key(self.user.pk)).username, 'renamed')
+
+        response = self.client.post(reverse('change_password'), {
+            'old_password': PASSWORD, 'new_password1': 'another-password-456', 'new_password2': 'another-password-456',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.auth_queries()
+        # The other session still has the old auth hash, and the cached user is never trusted for it
+        self.assertEqual(self.other.get(reverse('get_user_sessions')).status_code, 302)
+
+    def test_deleted_account_is_logged_out_everywhere(self):
+        self.auth_queries()
+        self.auth_queries(self.other)
+        response = self.client.post(reverse('delete_account'), {'password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(auth_cache.user_cache_key(self.user.pk)))
+        for client in (self.client, self.other):
+            self.assertEqual(client.get(reverse('get_user_sessions')).status_code, 302)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.auth_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(cache.get(auth_cache.user_cache_key(self.user.pk)))
+        self.assertEqual(self.client.get(reverse('get_user_sessions')).status_code, 302)
+        # An inactive copy in the cache is not served either
+        cache.set(auth_cache.user_cache_key(self.user.pk), self.user)
+        self.assertEqual(self.other.get(reverse('get_user_sessions')).status_code, 302)
+
+    def test_per_process_cache_is_not_used(self):
+        with mock.patch('chat.auth_cache.shared_cache', return_value=False):
+            for _ in range(2):
+                self.assertEqual(len(self.auth_queries()), 1)
+        self.assertIsNone(cache.get(auth_cache.user_cache_key(self.user.pk)))
+
+
+@override_settings(PERF_LOG_REQUESTS=False, METRICS_DIR='', RETRIEVAL_ENABLED=False)
+class LoadTestCommandTests(TransactionTestCase):
+    """seed_load_data and benchmark_api run end to end on a small data set."""
+
+    def test_seed_then_benchmark(self):
+        out = StringIO()
+        call_command('seed_load_data', users=3, sessions=2, messages=4, tags=2, usage_logs=3, stdout=out)
+        self.assertIn('Seeded 3 users', out.getvalue())
+        users = User.objects.filter(username__startswith=LOAD_TEST_PREFIX)
+        self.assertEqual(users.count(), 3)
+        self.assertTrue(Message.objects.filter(session__user__in=users).exists())
+        self.assertTrue(APIUsageLog.objects.filter(user__in=users).exists())
+
+        endpoints = ['sessions', 'history', 'chat']
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            # One client thread: the in-memory test database reports table locks instead of waiting
+            call_command('benchmark_api', endpoints=','.join(endpoints), requests=4, concurrency=1,
+                         gemini_latency_ms=0, json_path=path, stdout=StringIO())
+            with open(path) as fh:
+                report = json.load(fh)
+        self.assertEqual(set(report['endpoints']), set(endpoints))
+        for name in endpoints:
+            self.assertEqual((report['endpoints'][name]['requests'], report['endpoints'][name]['errors']), (4, 0))
+            self.assertGreater(report['endpoints'][name]['queries_mean'], 0)
+
+        out = StringIO()
+        call_command('seed_load_data', users=1, sessions=1, messages=2, clear=True, stdout=out)
+        self.assertIn("Removed", out.getvalue())
+        self.assertEqual(User.objects.filter(username__startswith=LOAD_TEST_PREFIX).count(), 1)
+
+
+@override_settings(PERF_LOG_REQUESTS=True, PERF_SERVER_TIMING=True, PERF_SLOW_REQUEST_MS=10 ** 6, METRICS_DIR='')
+class PerformanceLoggingTests(TestCase):
+    """Server-Timing header, one JSON log line per request, and query samples for slow requests."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('timed', 'timed@example.com', PASSWORD)
+        self.client.force_login(self.user)
+
+    def request(self, level='INFO', **headers):
+        with self.assertLogs('chat.perf', level) as logs:
+            response = self.client.get(reverse('get_user_sessions'), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(logs.records), 1)
+        return response, logs.records[0]
+
+    def test_server_timing_header_and_log_line(self):
+        response, record = self.request(x_request_start=f't={time.time() - 0.05:.3f}')
+        parts = response['Server-Timing'].split(', ')
+        self.assertRegex(parts[0], r'^db;dur=\d+\.\d;desc="(\d+) queries"$')
+        self.assertRegex(parts[-2], r'^queue;dur=\d+\.\d$')
+        self.assertRegex(parts[-1], r'^total;dur=\d+\.\d$')
+
+        self.assertEqual(record.levelname, 'INFO')
+        entry = json.loads(record.getMessage())
+        self.assertEqual(
+            {key: entry[key] for key in ('event', 'method', 'path', 'view', 'status', 'user_id', 'slow')},
+            {'event': 'request', 'method': 'GET', 'path': reverse('get_user_sessions'),
+             'view': 'get_user_sessions', 'status': 200, 'user_id': self.user.pk, 'slow': False},
+        )
+        self.assertEqual(entry['db_queries'], int(re.search(r'desc="(\d+) queries"', parts[0]).group(1)))
+        self.assertGreaterEqual(entry['queue_ms'], 40)
+        self.assertNotIn('queries', entry)
+
+    def test_spans_and_request_start_units(self):
+        timings, token = perf.begin()
+        with perf.span('llm'):
+            pass
+        perf.record('llm', 0.25)
+        perf.end(token)
+        self.assertEqual(timings.spans['llm'][1], 2)
+        self.assertRegex(timings.server_timing(), r'llm;dur=25\d\.\d')
+        for value in ('t=1700000000.5', '1700000000500', 't=1700000000500000'):
+            self.assertAlmostEqual(perf.parse_request_start(value, now=1700000001.0), 500.0, places=3)
+        self.assertIsNone(perf.parse_request_start('garbage'))
+
+    @override_settings(PERF_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_sampled_with_their_queries(self):
+        _, record = self.request('WARNING')
+        entry = json.loads(record.getMessage())
+        self.assertTrue(entry['slow'])
+        self.assertEqual(len(entry['queries']), entry['db_queries'])
+        self.assertTrue(all(set(query) == {'sql', 'ms'} for query in entry['queries']))
+
+        with override_settings(PERF_SLOW_SAMPLE_RATE=0.0):
+            self.client = Client()
+            self.client.force_login(self.user)
+            _, record = self.request('WARNING')
+        entry = json.loads(record.getMessage())
+        self.assertTrue(entry['slow'])
+        self.assertNotIn('queries', entry)
+
+
+@override_settings(METRICS_DIR='')
+class MetricsTests(TestCase):
+    """Counter and histogram arithmetic, the Prometheus text format, worker merging and /metrics access."""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.requests = self.registry.counter('test_requests_total', 'Requests.', ['view'])
+        self.latency = self.registry.histogram('test_latency_seconds', 'Latency.', ['view'], buckets=(0.1, 1.0))
+        self.depth = self.registry.gauge('test_depth', 'Depth.')
+
+    def test_counter_gauge_and_histogram_values(self):
+        self.requests.inc(view='a')
+        self.requests.inc(2, view='a')
+        self.requests.inc(view='b')
+        for value in (0.05, 0.1, 0.5, 3.0):
+            self.latency.observe(value, view='a')
+        self.depth.inc(3)
+        self.depth.dec()
+        self.assertEqual(self.requests.values, {('a',): 3, ('b',): 1})
+        # Bucket bounds are inclusive (le), the last slot before the sum is +Inf
+        self.assertEqual(self.latency.values[('a',)][:-1], [2, 1, 1])
+        self.assertAlmostEqual(self.latency.values[('a',)][-1], 3.65)
+        self.assertEqual(self.depth.values, {(): 2})
+
+    def test_exposition_format(self):
+        self.requests.inc(view='a"b')
+        self.latency.observe(0.05, view='x')
+        self.latency.observe(2.0, view='x')
+        self.depth.set(4)
+        self.assertEqual(self.registry.exposition(), '\n'.join([
+            '# HELP test_requests_total Requests.',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{view="a\\"b"} 1',
+            '# HELP test_latency_seconds Latency.',
+            '# TYPE test_latency_seconds histogram',
+            'test_latency_seconds_bucket{view="x",le="0.1"} 1',
+            'test_latency_seconds_bucket{view="x",le="1.0"} 1',
+            'test_latency_seconds_bucket{view="x",le="+Inf"} 2',
+            'test_latency_seconds_sum{view="x"} 2.05',
+            'test_latency_seconds_count{view="x"} 2',
+            '# HELP test_depth Depth.',
+            '# TYPE test_depth gauge',
+            'test_depth 4',
+        ]) + '\n')
+
+    def test_worker_snapshots_merge_and_retire(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory, METRICS_FLUSH_INTERVAL=3600):
+            self.requests.inc(view='a')
+            self.depth.set(1)
+            # Recording never writes files itself; the flush thread or a scrape does
+            self.assertEqual(os.listdir(directory), [])
+            dead = os.path.join(directory, '999999999.json')
+            with open(dead, 'w') as fh:
+                json.dump({'test_requests_total': {'a': 2}, 'test_depth': {'': 5}}, fh)
+
+            collected = self.registry.collect()
+            self.assertEqual(collected['test_requests_total'], {'a': 3})
+            self.assertEqual(collected['test_depth'], {'': 1})
+            self.assertFalse(os.path.exists(dead))
+            self.assertEqual(sorted(os.listdir(directory)), ['.lock', f'{os.getpid()}.json', 'retired.json'])
+            self.assertEqual(self.registry.collect()['test_requests_total'], {'a': 3})
+
+    def test_scrape_access(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 401)
+        staff = User.objects.create_user('ops', 'ops@example.com', PASSWORD, is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 401)
+            self.client.logout()
+            self.assertEqual(self.client.get(url).status_code, 401)
+            response = self.client.get(url, REMOTE_ADDR='10.0.0.5', headers={'authorization': 'Bearer s3cret'})
+            self.assertEqual(response.status_code, 200)
+
+
+class StartupImportTests(SimpleTestCase):
+    """A fresh process that sets Django up and resolves URLs must not pay for ReportLab."""
+
+    def test_reportlab_is_imported_on_first_pdf_export_only(self):
+        script = (
+            "import sys, django; django.setup(); from django.urls import resolve; "
+            "resolve('/api/chat/abc/export/pdf/'); resolve('/api/chat/'); "
+            "print('reportlab' in sys.modules)"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'nicole_project.settings'}
+        result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                                cwd=settings.BASE_DIR, check=True)
+        self.assertEqual(result.stdout.strip(), 'False')
@@ -0,0 +1,280 @@
+"""
+One chat turn: rate limit, save the prompt, call Gemini and save the reply.
+
+Shared by the ``/api/chat/`` view and the WebSocket channel (chat.ws). The
+caller passes the decoded request body and gets back a ``TurnResult`` holding
+the HTTP status and JSON body to answer with. With ``on_chunk`` the reply is
+streamed from Gemini and each piece of text is handed to ``on_chunk`` as it
+arrives; the result is the same either way.
+"""
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+
+import httpx
+from django.conf import settings
+from django.utils import timezone
+
+from .archive import arehydrate_session
+from .models import ChatSession, Message
+from .perf import span
+from .rate_limit import RateLimiter
+from .sqlite import ainsert
+from . import metrics, model_routing, prompt_cache
+from . import stats as user_stats
+
+SYSTEM_PROMPT = """
+        You are Nicole, an interactive and supportive mentor for students studying optometry.
+        Your goal is to help the user master optometry concepts and turn any idea or concept into a viable business opportunity within the optometry field.
+        Be friendly, encouraging, and highly knowledgeable. When presenting business ideas, ensure they are relevant to optometry and well-structured.
+        """
+
+
+@dataclass
+class TurnResult:
+    status: int
+    body: dict
+    session: ChatSession = None
+    created: bool = False
+    messages: int = 0
+    tokens_used: int = 0
+
+    def fail(self, status, error):
+        self.status, self.body = status, {'error': error}
+        return self
+
+
+async def run_turn(user, data, on_chunk=None):
+    """Answer the prompt in ``data`` ({prompt, session_id, is_image_request}) for ``user``."""
+    start_time = time.time()
+    routing = {}
+    turn = TurnResult(500, {})
+
+    try:
+        # CHECK RATE LIMIT FIRST
+        with span('ratelimit'):
+            is_limited, limit_message, stats = await RateLimiter.acheck_rate_limit(user)
+        if is_limited:
+            return turn.fail(429, limit_message)
+
+        prompt = data.get('prompt', '').strip()
+        session_id = data.get('session_id', '')
+        is_image_request = data.get('is_image_request', False)
+
+        if not prompt and not is_image_request:
+            return turn.fail(400, 'No prompt provided')
+
+        if not session_id:
+            session_id = str(uuid.uuid4())
+
+        # Get or create session linked to user
+        session, created = await ChatSession.objects.aget_or_create(
+            session_id=session_id,
+            defaults={'user': user, 'title': prompt[:50] or "New Chat"}
+        )
+
+        # Verify user owns this session
+        if session.user_id != user.pk:
+            return turn.fail(403, 'Unauthorized')
+
+        if not created:
+            if session.is_archived:
+                await arehydrate_session(session)
+            # Keep the session hot (and first in the sidebar) while it is in use
+            session.last_activity = timezone.now()
+            await ChatSession.objects.filter(pk=session.pk).aupdate(last_activity=session.last_activity)
+
+        # Save user message
+        user_message = await ainsert(
+            Message,
+            session=session,
+            text_content=prompt,
+            is_user=True,
+            message_type='text'
+        )
+        await user_stats.arecord(user.pk, sessions=int(created), messages=1, activity=user_message.timestamp)
+        turn.session, turn.created, turn.messages = session, created, 1
+
+        # Get conversation history
+        with span('history'):
+            # Only the most recent messages; older context comes from retrieval below
+            history_messages = session.messages.order_by('-timestamp', '-pk')[:settings.CHAT_HISTORY_WINDOW]
+            recent = [msg async for msg in history_messages]
+            recent.reverse()
+
+            # Format for API
+            conversation_for_api = []
+            for msg in recent:
+                role = 'user' if msg.is_user else 'model'
+                conversation_for_api.append({
+                    'role': role,
+                    'parts': [{'text': msg.text_content}]
+                })
+
+        context = ''
+        if settings.RETRIEVAL_ENABLED and prompt:
+            # NumPy is only needed here; importing it lazily keeps it out of worker startup.
+            from .retrieval import arelated_snippets, format_snippets
+            with span('retrieval'):
+                snippets = await arelated_snippets(user.pk, prompt, exclude_ids={msg.pk for msg in recent})
+            if snippets:
+                context = format_snippets(snippets)
+
+        api_key = settings.GEMINI_API_KEY
+
+        # Check if API key exists
+        if not api_key:
+            return turn.fail(500, 'API key not configured. Please contact administrator.')
+
+        if is_image_request:
+            return turn.fail(400, 'Image generation temporarily disabled')
+
+        # --- TEXT GENERATION - model and output budget chosen per turn ---
+        route = model_routing.choose_route(prompt, sum(len(msg.text_content) for msg in recent))
+
+        payload = {
+            "contents": conversation_for_api,
+            "generationConfig": {
+                "temperature": 0.7,
+                "topK": 40,
+                "topP": 0.95,
+                "maxOutputTokens": route.max_output_tokens,
+            },
+            "systemInstruction": {
+                "parts": [{"text": f"{SYSTEM_PROMPT}\n{context}" if context else SYSTEM_PROMPT}]
+            }
+        }
+
+        # Long histories: reuse the session's cached system prompt + history prefix on Gemini
+        handle = None
+        if settings.PROMPT_CACHE_ENABLED:
+            with span('prompt_cache'):
+                handle = await prompt_cache.aprepare(session, route.model, SYSTEM_PROMPT, recent, context)
+
+        streamed = False
+        if on_chunk is not None:
+            async def forward(text):
+                nonlocal streamed
+                streamed = True
+                await on_chunk(text)
+        else:
+            forward = None
+
+        # Primary model first; on a 429/5xx or connection error try the fallback once
+        for model in route.models:
+            routing = route.log_fields(model)
+            last_attempt = model == route.models[-1]
+            llm_start = time.perf_counter()
+            try:
+                with span('llm'):
+                    response = await prompt_cache.generate_content(model, payload, handle, on_chunk=forward)
+            except asyncio.CancelledError:
+                # Client gone: the pooled connection is dropped, so Gemini stops generating
+                metrics.GEMINI_RESPONSES.inc(model=model, status='cancelled')
+                metrics.GEMINI_LATENCY.observe(time.perf_counter() - llm_start, model=model)
+                raise
+            except httpx.HTTPError as e:
+                llm_time = time.perf_counter() - llm_start
+                timed_out = isinstance(e, httpx.TimeoutException)
+                metrics.GEMINI_RESPONSES.inc(model=model, status='timeout' if timed_out else 'error')
+                metrics.GEMINI_LATENCY.observe(llm_time, model=model)
+                model_routing.stats.record(model, llm_time, ok=False)
+                # After a timeout the user has waited long enough; don't make them wait twice.
+                # A reply that already started streaming can't be restarted on another model.
+                if timed_out or last_attempt or streamed:
+                    raise
+                continue
+            llm_time = time.perf_counter() - llm_start
+            retry = model_routing.should_retry(response.status_code)
+            metrics.GEMINI_LATENCY.observe(llm_time, model=model)
+            metrics.GEMINI_RESPONSES.inc(model=model, status=response.status_code)
+            model_routing.stats.record(model, llm_time, ok=not retry)
+            if not retry or last_attempt:
+                break
+
+        # Better error handling
+        if response.status_code == 403:
+            return turn.fail(403, 'API key is invalid or doesn\'t have access to Gemini API. Please check your API key in Render environment variables.')
+
+        response.raise_for_status()
+
+        result = response.json()
+
+        usage = result.get('usageMetadata', {})
+        tokens_used = usage.get('totalTokenCount', 0)
+        metrics.GEMINI_TOKENS.inc(usage.get('promptTokenCount', 0), model=model, direction='in')
+        metrics.GEMINI_TOKENS.inc(usage.get('candidatesTokenCount', 0), model=model, direction='out')
+        metrics.GEMINI_TOKENS.inc(usage.get('cachedContentTokenCount', 0), model=model, direction='cached')
+
+        generated_text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+
+        if not generated_text:
+            raise Exception('Empty response from API')
+
+        # Extract sources/citations (if available)
+        sources = []
+        grounding_metadata = result.get('candidates', [{}])[0].get('groundingMetadata')
+        if grounding_metadata and grounding_metadata.get('groundingAttributions'):
+            sources = [
+                {
+                    'uri': attr.get('web', {}).get('uri', ''),
+                    'title': attr.get('web', {}).get('title', '')
+                }
+                for attr in grounding_metadata['groundingAttributions']
+                if attr.get('web', {}).get('uri')
+            ]
+
+        with span('persist'):
+            # Save Nicole's response
+            reply = await ainsert(
+                Message,
+                session=session,
+                text_content=generated_text,
+                is_user=False,
+                message_type='text',
+                sources=sources
+            )
+            await user_stats.arecord(user.pk, messages=1, tokens_used=tokens_used, activity=reply.timestamp)
+
+            # Log usage
+            elapsed = time.time() - start_time
+            await RateLimiter.alog_api_usage(user, 'chat', elapsed, 200, tokens_used, **routing)
+
+        if settings.RETRIEVAL_ENABLED:
+            from .retrieval import aschedule_update
+            # Off the request path: the new messages are embedded once committed
+            await aschedule_update(user.pk)
+
+        turn.status, turn.messages, turn.tokens_used = 200, 2, tokens_used
+        turn.body = {
+            'text': generated_text,
+            'sources': sources,
+            'session_id': session.session_id
+        }
+        return turn
+
+    except asyncio.CancelledError:
+        # The client disconnected (closed the tab, pressed stop or started a new chat) and the
+        # ASGI handler cancelled this view. Record the turn as 499 "client closed request"
+        # without saving a reply, then let the cancellation finish.
+        elapsed = time.time() - start_time
+        await RateLimiter.alog_api_usage(user, 'chat', elapsed, 499, **routing)
+        raise
+    except httpx.TimeoutException:
+        elapsed = time.time() - start_time
+        await RateLimiter.alog_api_usage(user, 'chat', elapsed, 504, **routing)
+        return turn.fail(504, 'API request timed out. Please try again.')
+    except httpx.HTTPError as e:
+        elapsed = time.time() - start_time
+        await RateLimiter.alog_api_usage(user, 'chat', elapsed, 502, **routing)
+        error_detail = str(e)
+        if '403' in error_detail:
+            return turn.fail(502, 'API authentication failed. Please verify your Gemini API key is correct and has proper permissions.')
+        return turn.fail(502, f'API Error: {error_detail}')
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        elapsed = time.time() - start_time
+        await RateLimiter.alog_api_usage(user, 'chat', elapsed, 500, **routing)
+        return turn.fail(500, f'Server error: {str(e)}')
+
@@ -0,0 +1,41 @@
+"""
+Small helpers shared by the app and its management commands.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Backends whose entries live in (or never leave) one worker process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@contextmanager
+def disable_auto_now(model, *field_names):
+    """Temporarily turn off auto_now/auto_now_add so bulk inserts keep explicit timestamps."""
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    try:
+        for field in fields:
+            field.auto_now = field.auto_now_add = False
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def percentile(sorted_values, pct):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def shared_cache(alias='default'):
+    """Whether the cache is shared by every worker, so an invalidation in one reaches the others."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHES
@@ -0,0 +1,14 @@
+"""
+Views, split by area so each module only pulls in what it needs:
+
+- ``auth``: signup, login, profile and account management
+- ``chat``: the chat page and the chat/history/sessions/search/usage API
+- ``exports``: PDF and JSON export (ReportLab is imported on first PDF export)
+- ``tags``: tag management
+- ``monitoring``: the Prometheus metrics endpoint
+
+The URLconf imports these modules directly: Django needs the real view
+callables when it resolves a URL (to tell sync from async views and to read
+attributes such as ``csrf_exempt``), and the modules are cheap to import. Only
+heavy, rarely used dependencies are deferred into the views that use them.
+"""
@@ -0,0 +1,98 @@
+from django.shortcuts import render, redirect
+from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
+from ..deletion import soft_delete_account
+from .. import stats as user_stats
+from ..forms import SignUpForm, LoginForm, UserProfileForm, PasswordChangeFormCustom
+
+# ==================== AUTH VIEWS ====================
+
+def signup_view(request):
+    """Handle user signup."""
+    if request.user.is_authenticated:
+        return redirect('nicole_chat')
+    
+    if request.method == 'POST':
+        form = SignUpForm(request.POST)
+        if form.is_valid():
+            user = form.save()
+            login(request, user)
+            return redirect('nicole_chat')
+    else:
+        form = SignUpForm()
+    
+    return render(request, 'chat/signup.html', {'form': form})
+
+def login_view(request):
+    """Handle user login."""
+    if request.user.is_authenticated:
+        return redirect('nicole_chat')
+    
+    if request.method == 'POST':
+        form = LoginForm(request.POST)
+        if form.is_valid():
+            username = form.cleaned_data['username']
+            password = form.cleaned_data['password']
+            user = authenticate(request, username=username, password=password)
+            if user is not None:
+                login(request, user)
+                return redirect('nicole_chat')
+            else:
+                form.add_error(None, "Invalid username or password.")
+    else:
+        form = LoginForm()
+    
+    return render(request, 'chat/login.html', {'form': form})
+
+def logout_view(request):
+    """Handle user logout."""
+    logout(request)
+    return redirect('login')
+
+def profile_view(request):
+    """Handle user profile page."""
+    if request.method == 'POST':
+        form = UserProfileForm(request.POST, instance=request.user)
+        if form.is_valid():
+            form.save()
+            return redirect('profile')
+    else:
+        form = UserProfileForm(instance=request.user)
+    
+    # Get user stats (one row, kept current by the write paths)
+    stats = user_stats.get(request.user.pk)
+    
+    return render(request, 'chat/profile.html', {
+        'form': form,
+        'user_sessions': stats.sessions,
+        'total_messages': stats.messages
+    })
+
+def change_password_view(request):
+    """Handle password change."""
+    if request.method == 'POST':
+        form = PasswordChangeFormCustom(request.user, request.POST)
+        if form.is_valid():
+            user = form.save()
+            update_session_auth_hash(request, user)
+            return redirect('profile')
+    else:
+        form = PasswordChangeFormCustom(request.user)
+    
+    return render(request, 'chat/change_password.html', {'form': form})
+
+def delete_account_view(request):
+    """Handle account deletion."""
+    if request.method == 'POST':
+        password = request.POST.get('password')
+        user = request.user
+        
+        if user.check_password(password):
+            username = user.username
+            # Rows are removed in the background by reap_deletions
+            soft_delete_account(user)
+            logout(request)
+            return render(request, 'chat/account_deleted.html', {'username': username})
+        else:
+            return render(request, 'chat/delete_account.html', {'error': 'Incorrect password'})
+    
+    return render(request, 'chat/delete_account.html')
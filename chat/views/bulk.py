@@ -0,0 +1,161 @@
+import json
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+from ..http import JsonResponse, dumps
+from ..archive import archived_messages
+from ..deletion import soft_delete_sessions
+from ..models import ChatSession, ChatTag, Message
+from ..perf import span
+from ..routers import use_replica
+from ..ws import notify
+from .exports import export_data
+
+# ==================== BULK SESSION VIEWS ====================
+# Each view takes {"session_ids": [...]} (and "tag_ids" for tagging), checks
+# ownership of all of them in one query and answers per session id.
+
+
+class BulkRequestError(ValueError):
+    pass
+
+
+def _read_ids(request, keys):
+    """The id lists named by ``keys`` from the JSON body, de-duplicated in order."""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise BulkRequestError('Invalid JSON')
+    lists = []
+    for key in keys:
+        ids = data.get(key) if isinstance(data, dict) else None
+        if not isinstance(ids, list) or not ids:
+            raise BulkRequestError(f'{key} must be a non-empty list')
+        if key == 'session_ids' and len(ids) > settings.BULK_MAX_SESSIONS:
+            raise BulkRequestError(f'At most {settings.BULK_MAX_SESSIONS} sessions per request')
+        if key == 'tag_ids':
+            try:
+                ids = [int(i) for i in ids]
+            except (TypeError, ValueError):
+                raise BulkRequestError('tag_ids must be integers')
+        else:
+            ids = [str(i) for i in ids]
+        lists.append(list(dict.fromkeys(ids)))
+    return lists
+
+
+def _owned_sessions(user, session_ids):
+    """{session_id: ChatSession} for the ids that exist and belong to ``user``."""
+    sessions = ChatSession.objects.filter(user=user, session_id__in=session_ids).order_by()
+    return {s.session_id: s for s in sessions}
+
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def bulk_delete_sessions(request):
+    """Delete several chat sessions."""
+    try:
+        session_ids, = _read_ids(request, ['session_ids'])
+    except BulkRequestError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    sessions = _owned_sessions(request.user, session_ids)
+    if sessions:
+        soft_delete_sessions(request.user.pk, list(sessions.values()))
+        notify(request.user.pk, {'type': 'sessions.changed'})
+    return JsonResponse({
+        'deleted': len(sessions),
+        'results': [
+            {'session_id': sid, 'status': 'deleted' if sid in sessions else 'not_found'}
+            for sid in session_ids
+        ],
+    })
+
+
+def _bulk_tags(request, add):
+    try:
+        session_ids, tag_ids = _read_ids(request, ['session_ids', 'tag_ids'])
+    except BulkRequestError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    sessions = _owned_sessions(request.user, session_ids)
+    tags = set(ChatTag.objects.filter(user=request.user, pk__in=tag_ids).order_by().values_list(
+        'pk', flat=True))
+    through = ChatSession.tags.through
+    pks = [s.pk for s in sessions.values()]
+    linked = set(through.objects.filter(chatsession_id__in=pks, chattag_id__in=tags).values_list(
+        'chatsession_id', 'chattag_id'))
+
+    changed = {}
+    if add:
+        links = [
+            through(chatsession_id=pk, chattag_id=tag_id)
+            for pk in pks for tag_id in tags if (pk, tag_id) not in linked
+        ]
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        for link in links:
+            changed[link.chatsession_id] = changed.get(link.chatsession_id, 0) + 1
+    elif linked:
+        through.objects.filter(chatsession_id__in=pks, chattag_id__in=tags).delete()
+        for pk, _ in linked:
+            changed[pk] = changed.get(pk, 0) + 1
+
+    if changed:
+        notify(request.user.pk, {'type': 'tags.changed'})
+    key = 'added' if add else 'removed'
+    return JsonResponse({
+        key: sum(changed.values()),
+        'tags_not_found': [tag_id for tag_id in tag_ids if tag_id not in tags],
+        'results': [
+            {'session_id': sid, 'status': 'ok', key: changed.get(sessions[sid].pk, 0)}
+            if sid in sessions else {'session_id': sid, 'status': 'not_found'}
+            for sid in session_ids
+        ],
+    })
+
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def bulk_tag_sessions(request):
+    """Add every given tag to every given session."""
+    return _bulk_tags(request, add=True)
+
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def bulk_untag_sessions(request):
+    """Remove every given tag from every given session."""
+    return _bulk_tags(request, add=False)
+
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+@use_replica
+def bulk_export_sessions(request):
+    """Export several chats as one JSON file."""
+    try:
+        session_ids, = _read_ids(request, ['session_ids'])
+    except BulkRequestError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    sessions = _owned_sessions(request.user, session_ids)
+    by_session = {}
+    live = [s.pk for s in sessions.values() if not s.is_archived]
+    if live:
+        for msg in Message.objects.filter(session_id__in=live).order_by('session_id', 'timestamp'):
+            by_session.setdefault(msg.session_id, []).append(msg)
+    data = {
+        'user': request.user.username,
+        'sessions': [
+            export_data(s, archived_messages(s) if s.is_archived else by_session.get(s.pk, []),
+                        request.user.username)
+            for s in (sessions[sid] for sid in session_ids if sid in sessions)
+        ],
+        'not_found': [sid for sid in session_ids if sid not in sessions],
+    }
+
+    with span('serialize'):
+        response = HttpResponse(dumps(data, indent=True), content_type='application/json')
+    response['Content-Disposition'] = 'attachment; filename="nicole-chats.json"'
+    return response
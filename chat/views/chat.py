@@ -0,0 +1,145 @@
+import json
+from django.conf import settings
+from django.shortcuts import render
+from ..http import JsonResponse
+from django.db.models import Q
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_http_methods
+from ..models import ChatSession, Message
+from ..fields import MARKER as COMPRESSED_MARKER
+from ..archive import arehydrate_session
+from ..deletion import soft_delete_session
+from ..rate_limit import RateLimiter
+from ..perf import span
+from ..routers import use_replica
+from ..session_query import session_list
+from ..turns import run_turn
+from ..ws import notify, notify_turn
+
+# Candidate messages decoded per database round trip in search_chats
+SEARCH_CHUNK = 50
+
+# ==================== CHAT VIEWS ====================
+
+@login_required(login_url='login')
+@ensure_csrf_cookie
+def nicole_chat(request):
+    """Renders the main chat interface."""
+    return render(request, 'chat/index.html')
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+async def process_chat_message(request):
+    """
+    Handles POST requests, saves messages to database,
+    calls the Gemini API, and returns the result.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    user = await request.auser()
+    turn = await run_turn(user, data)
+    # Other tabs with a socket open refresh their sidebar and usage
+    notify_turn(user.pk, turn)
+    with span('serialize'):
+        return JsonResponse(turn.body, status=turn.status)
+
+@login_required(login_url='login')
+@use_replica
+async def get_usage_stats(request):
+    """Get user's current usage statistics"""
+    try:
+        stats = await RateLimiter.aget_user_stats(await request.auser())
+        return JsonResponse(stats)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required(login_url='login')
+@use_replica
+async def get_chat_history(request, session_id):
+    """Get chat history for a session."""
+    try:
+        session = await ChatSession.objects.aget(session_id=session_id, user=await request.auser())
+        if session.is_archived:
+            await arehydrate_session(session)
+        messages = [msg async for msg in session.messages.all().order_by('timestamp').values(
+            'text_content', 'is_user', 'message_type', 'sources', 'timestamp'
+        )]
+        
+        history = [
+            {
+                'text': msg['text_content'],
+                'isUser': msg['is_user'],
+                'type': msg['message_type'],
+                'sources': msg['sources']
+            }
+            for msg in messages
+        ]
+        
+        with span('serialize'):
+            return JsonResponse({'history': history})
+    except ChatSession.DoesNotExist:
+        return JsonResponse({'error': 'Session not found'}, status=404)
+
+@login_required(login_url='login')
+@use_replica
+async def get_user_sessions(request):
+    """Get all chat sessions for the user."""
+    try:
+        sessions = [session async for session in session_list(await request.auser())]
+        with span('serialize'):
+            return JsonResponse({'sessions': sessions})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required(login_url='login')
+@require_http_methods(["DELETE"])
+def delete_session(request, session_id):
+    """Delete a chat session."""
+    try:
+        session = ChatSession.objects.get(session_id=session_id, user=request.user)
+        soft_delete_session(session)
+        notify(request.user.pk, {'type': 'sessions.changed'})
+        return JsonResponse({'message': 'Session deleted'})
+    except ChatSession.DoesNotExist:
+        return JsonResponse({'error': 'Session not found'}, status=404)
+
+@login_required(login_url='login')
+@use_replica
+async def search_chats(request):
+    """Search through chat messages."""
+    query = request.GET.get('q', '').strip()
+    results = []
+    
+    if query:
+        # Compressed rows can't be matched in SQL; fetch them as candidates and match after decoding.
+        # Candidates are read in chunks so the loop stops fetching at 20 matches, and a search
+        # that matches nothing reads at most SEARCH_SCAN_LIMIT of the newest rows.
+        candidates = Message.objects.filter(
+            Q(text_content__icontains=query) | Q(text_content__startswith=COMPRESSED_MARKER),
+            session__user=await request.auser(),
+            session__deleted_at__isnull=True,
+        ).select_related('session').order_by('-timestamp')[:settings.SEARCH_SCAN_LIMIT]
+        needle = query.lower()
+        messages = []
+        async for msg in candidates.aiterator(chunk_size=SEARCH_CHUNK):
+            if needle in msg.text_content.lower():
+                messages.append(msg)
+                if len(messages) == 20:
+                    break
+        
+        results = [
+            {
+                'session_id': msg.session.session_id,
+                'session_title': msg.session.title,
+                'message_snippet': msg.text_content[:100],
+                'is_user': msg.is_user,
+                'timestamp': msg.timestamp
+            }
+            for msg in messages
+        ]
+    
+    with span('serialize'):
+        return JsonResponse({'results': results})
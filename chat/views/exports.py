@@ -0,0 +1,108 @@
+import io
+from datetime import datetime
+from django.http import HttpResponse
+from ..http import JsonResponse, dumps
+from django.contrib.auth.decorators import login_required
+from ..models import ChatSession
+from ..archive import archived_messages
+from ..perf import span
+from ..routers import use_replica
+
+# ==================== EXPORT VIEWS ====================
+
+def export_data(session, messages, username):
+    """The JSON export of one session."""
+    return {
+        'session_id': session.session_id,
+        'title': session.title,
+        'created_at': session.created_at.isoformat(),
+        'last_activity': session.last_activity.isoformat(),
+        'user': username,
+        'messages': [
+            {
+                'sender': 'user' if msg.is_user else 'nicole',
+                'text': msg.text_content,
+                'timestamp': msg.timestamp.isoformat(),
+                'type': msg.message_type
+            }
+            for msg in messages
+        ]
+    }
+
+@login_required(login_url='login')
+@use_replica
+def export_chat_pdf(request, session_id):
+    """Export chat as PDF."""
+    # ReportLab is only needed here; importing it lazily keeps it out of worker startup.
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+
+    try:
+        session = ChatSession.objects.get(session_id=session_id, user=request.user)
+        # Exporting reads the archive directly; it shouldn't make a cold session hot again
+        messages = archived_messages(session) if session.is_archived else session.messages.all().order_by('timestamp')
+
+        pdf_buffer = io.BytesIO()
+        doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
+        story = []
+
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#522888'),
+            spaceAfter=12
+        )
+        normal_style = styles['Normal']
+
+        story.append(Paragraph(f"Nicole Chat: {session.title}", title_style))
+        story.append(Spacer(1, 0.3 * inch))
+
+        meta_text = f"<b>Date:</b> {datetime.now().strftime('%B %d, %Y')}<br/><b>User:</b> {request.user.username}<br/><b>Messages:</b> {len(messages)}"
+        story.append(Paragraph(meta_text, normal_style))
+        story.append(Spacer(1, 0.3 * inch))
+
+        for msg in messages:
+            sender = "You" if msg.is_user else "Nicole"
+            sender_style = ParagraphStyle(
+                'Sender',
+                parent=styles['Normal'],
+                fontSize=11,
+                textColor=colors.HexColor('#BF9553'),
+                spaceAfter=6,
+                fontName='Helvetica-Bold'
+            )
+            story.append(Paragraph(f"{sender}:", sender_style))
+            story.append(Paragraph(msg.text_content, normal_style))
+            story.append(Spacer(1, 0.2 * inch))
+
+        doc.build(story)
+        pdf_buffer.seek(0)
+
+        response = HttpResponse(pdf_buffer.read(), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="nicole-chat-{session_id}.pdf"'
+        return response
+
+    except ChatSession.DoesNotExist:
+        return JsonResponse({'error': 'Session not found'}, status=404)
+
+@login_required(login_url='login')
+@use_replica
+def export_chat_json(request, session_id):
+    """Export chat as JSON."""
+    try:
+        session = ChatSession.objects.get(session_id=session_id, user=request.user)
+        messages = archived_messages(session) if session.is_archived else session.messages.all().order_by('timestamp')
+        data = export_data(session, messages, request.user.username)
+
+        with span('serialize'):
+            response = HttpResponse(dumps(data, indent=True), content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="nicole-chat-{session_id}.json"'
+        return response 
+
+    except ChatSession.DoesNotExist:
+        return JsonResponse({'error': 'Session not found'}, status=404)
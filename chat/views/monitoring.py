@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from .. import metrics
+
+# ==================== MONITORING VIEWS ====================
+
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+
+
+def _may_scrape(request):
+    """With METRICS_TOKEN set only its bearer token is accepted; otherwise localhost and staff."""
+    token = settings.METRICS_TOKEN
+    if token:
+        return constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+    return request.META.get('REMOTE_ADDR') in LOCAL_ADDRESSES or request.user.is_staff
+
+
+def metrics_view(request):
+    """Expose application metrics in Prometheus text format."""
+    if not _may_scrape(request):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(
+        metrics.registry.exposition(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,143 @@
+import json
+from ..http import JsonResponse
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_http_methods
+from ..models import ChatSession, ChatTag
+from ..routers import use_replica
+from ..session_query import SESSION_FIELDS, QueryError, parse_tag_ids, parse_when, query_sessions, tag_facets
+from .. import stats as user_stats
+from ..ws import notify
+
+# ==================== TAG VIEWS ====================
+
+@login_required(login_url='login')
+@require_http_methods(["GET", "POST"])
+def manage_tags(request):
+    """Get all tags or create a new tag"""
+    if request.method == 'GET':
+        try:
+            tags = tag_facets(request.user, ChatSession.objects.filter(user=request.user))
+            return JsonResponse({'tags': list(tags)})
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    elif request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            name = data.get('name', '').strip()
+            color = data.get('color', '#522888')
+            
+            if not name:
+                return JsonResponse({'error': 'Tag name required'}, status=400)
+            
+            tag, created = ChatTag.objects.get_or_create(
+                user=request.user,
+                name=name,
+                defaults={'color': color}
+            )
+            if created:
+                user_stats.record(request.user.pk, tags=1)
+                notify(request.user.pk, {'type': 'tags.changed'})
+            
+            return JsonResponse({
+                'id': tag.id,
+                'name': tag.name,
+                'color': tag.color,
+                'created': created
+            })
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+@login_required(login_url='login')
+@require_http_methods(["DELETE"])
+def delete_tag(request, tag_id):
+    """Delete a tag"""
+    try:
+        tag = ChatTag.objects.get(id=tag_id, user=request.user)
+        tag.delete()
+        user_stats.record(request.user.pk, tags=-1)
+        notify(request.user.pk, {'type': 'tags.changed'})
+        return JsonResponse({'message': 'Tag deleted'})
+    except ChatTag.DoesNotExist:
+        return JsonResponse({'error': 'Tag not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def add_tag_to_session(request, session_id):
+    """Add a tag to a chat session"""
+    try:
+        data = json.loads(request.body)
+        tag_id = data.get('tag_id')
+        
+        session = ChatSession.objects.get(session_id=session_id, user=request.user)
+        tag = ChatTag.objects.get(id=tag_id, user=request.user)
+        
+        session.tags.add(tag)
+        notify(request.user.pk, {'type': 'tags.changed'})
+        
+        return JsonResponse({'message': 'Tag added'})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def remove_tag_from_session(request, session_id):
+    """Remove a tag from a chat session"""
+    try:
+        data = json.loads(request.body)
+        tag_id = data.get('tag_id')
+        
+        session = ChatSession.objects.get(session_id=session_id, user=request.user)
+        tag = ChatTag.objects.get(id=tag_id, user=request.user)
+        
+        session.tags.remove(tag)
+        notify(request.user.pk, {'type': 'tags.changed'})
+        
+        return JsonResponse({'message': 'Tag removed'})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required(login_url='login')
+@use_replica
+def get_sessions_by_tag(request, tag_id):
+    """Get all sessions with a specific tag"""
+    try:
+        tag = ChatTag.objects.get(id=tag_id, user=request.user)
+        sessions = tag.sessions.filter(user=request.user).order_by('-last_activity').values(
+            'session_id', 'title', 'created_at', 'last_activity'
+        )
+        return JsonResponse({'sessions': list(sessions)})
+    except ChatTag.DoesNotExist:
+        return JsonResponse({'error': 'Tag not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required(login_url='login')
+@use_replica
+def filter_sessions(request):
+    """
+    Sessions matching tags (match=all|any), title text and a last-activity date range,
+    with per-tag counts for the sidebar.
+    """
+    try:
+        tag_ids = parse_tag_ids(request.GET.get('tags', ''))
+        sessions, facet_base = query_sessions(
+            request.user, tag_ids,
+            match=request.GET.get('match', 'all'),
+            q=request.GET.get('q', '').strip(),
+            start=parse_when(request.GET.get('from')),
+            end=parse_when(request.GET.get('to'), end=True),
+        )
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 200)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except (QueryError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    page = sessions.order_by('-last_activity').values(*SESSION_FIELDS)[offset:offset + limit]
+    return JsonResponse({
+        'sessions': list(page),
+        'total': sessions.count(),
+        'facets': list(tag_facets(request.user, facet_base)),
+    })
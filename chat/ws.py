@@ -0,0 +1,385 @@
+"""
+WebSocket channel for the chat page at ``/ws/chat/``.
+
+One authenticated connection per tab carries what the page otherwise fetches
+separately. Every frame is a JSON object with a ``type``:
+
+client -> server
+    chat.send {ref, prompt, session_id}   answer a prompt; the reply is streamed back
+    chat.cancel {ref}                     stop the turn in flight
+    sessions.list, tags.list, usage.get   current sidebar, tag and usage state
+    ping                                  answered with pong
+
+server -> client
+    hello {ping_interval}                 sent once the connection is accepted
+    chat.chunk {ref, text}..., then chat.done {ref, text, sources, session_id},
+        chat.error {ref, status, error} or chat.cancelled {ref}
+    sessions, tags, usage                 answers to the list/get requests
+    session.updated {session}             pushed to all of the user's tabs after a turn
+    usage.delta {sessions, messages, tokens_used}
+    sessions.changed, tags.changed        re-read the list; sent by the HTTP views that change it
+    pong, error {error}
+
+Only same-origin (or ``CSRF_TRUSTED_ORIGINS``) connections with a logged-in
+session cookie are accepted. The login is checked again before every chat turn
+and, at most every ``WS_SESSION_CHECK_INTERVAL`` seconds, before list requests:
+once the session is logged out or flushed, the password changed or the user
+deactivated, the connection is closed with 1008. Each connection has a send queue of at most
+``WS_SEND_QUEUE`` frames drained by its own writer task: a streamed reply waits
+while the queue is full, so a slow client slows its own read from Gemini
+instead of buffering the reply, and a pushed update for a client that stopped
+reading closes it with 1013 (the page reconnects and re-reads its state). Turns
+run as tasks, one at a time per connection, so pings, cancels and list requests
+are answered while a reply streams.
+
+An idle connection costs a reader coroutine, a writer task and no timers: one
+sweeper task per process closes connections that sent nothing, not even a
+ping, for ``WS_IDLE_TIMEOUT`` seconds (pages ping every ``WS_PING_INTERVAL``;
+uvicorn's protocol pings drop dead TCP peers sooner). Pushes reach the user's
+tabs connected to the same worker process; tabs on other workers catch up when
+they next list or reconnect.
+"""
+import asyncio
+import json
+import time
+import weakref
+from contextlib import asynccontextmanager
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+
+from . import auth_cache, metrics, routers, sharding
+from .http import dumps
+from .models import ChatSession
+from .rate_limit import RateLimiter
+from .session_query import SESSION_FIELDS, session_list, tag_facets
+from .turns import run_turn
+
+PATH = '/ws/chat/'
+
+# Close codes
+CLOSE_POLICY = 1008
+CLOSE_TOO_BIG = 1009
+CLOSE_TRY_AGAIN = 1013
+CLOSE_IDLE = 4408
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+class Hub:
+    """The open connections of one event loop, by user id."""
+
+    def __init__(self):
+        self.connections = {}
+        self.count = 0
+        self._sweeper = None
+
+    def add(self, conn):
+        self.connections.setdefault(conn.user.pk, set()).add(conn)
+        self.count += 1
+        metrics.WS_CONNECTIONS.inc()
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    def remove(self, conn):
+        conns = self.connections.get(conn.user.pk)
+        if conns is None or conn not in conns:
+            return
+        conns.discard(conn)
+        if not conns:
+            del self.connections[conn.user.pk]
+        self.count -= 1
+        metrics.WS_CONNECTIONS.dec()
+        if not self.count and self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def publish(self, user_id, message):
+        for conn in list(self.connections.get(user_id, ())):
+            conn.offer(message)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL)
+            cutoff = time.monotonic() - settings.WS_IDLE_TIMEOUT
+            for conns in list(self.connections.values()):
+                for conn in list(conns):
+                    if conn.last_seen < cutoff:
+                        conn.close(CLOSE_IDLE, 'idle')
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = Hub()
+    return hub
+
+
+def notify(user_id, message):
+    """Push ``message`` to the user's open connections in this process; callable from any thread."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    for loop, hub in list(_hubs.items()):
+        if user_id not in hub.connections:
+            continue
+        if loop is running:
+            hub.publish(user_id, message)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(hub.publish, user_id, message)
+
+
+def notify_turn(user_id, turn):
+    """The pushes that follow a chat turn, whether it came over HTTP or a socket."""
+    if turn.session is None:
+        return
+    session = turn.session
+    notify(user_id, {'type': 'session.updated', 'session': {field: getattr(session, field) for field in SESSION_FIELDS}})
+    notify(user_id, {'type': 'usage.delta', 'sessions': int(turn.created), 'messages': turn.messages,
+                     'tokens_used': turn.tokens_used})
+
+
+class Connection:
+    def __init__(self, user, send, headers=None):
+        self.user = user
+        self.headers = headers or {}
+        self.last_seen = self.session_checked = time.monotonic()
+        self.closed = False
+        self.turn_ref = None
+        self.turn = None
+        self._send = send
+        self._queue = asyncio.Queue(settings.WS_SEND_QUEUE)
+        self._writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        try:
+            while True:
+                message = await self._queue.get()
+                if isinstance(message, tuple):
+                    code, reason = message
+                    metrics.WS_CLOSES.inc(reason=reason)
+                    await self._send({'type': 'websocket.close', 'code': code})
+                    return
+                await self._send({'type': 'websocket.send', 'text': dumps(message).decode()})
+                metrics.WS_FRAMES.inc(direction='out', type=message['type'])
+        except OSError:
+            # The client went away mid-send; the reader sees the disconnect
+            pass
+        finally:
+            self.closed = True
+            # Release anyone waiting in put()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+    async def put(self, message):
+        """Queue ``message``, waiting while the client is behind (backpressure)."""
+        if not self.closed:
+            await self._queue.put(message)
+
+    def offer(self, message):
+        """Queue ``message`` without waiting; a client too far behind is disconnected."""
+        if self.closed:
+            return
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close(CLOSE_TRY_AGAIN, 'slow')
+
+    def close(self, code, reason):
+        if self.closed:
+            return
+        self.closed = True
+        # Queued frames are dropped; the close frame goes out next
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait((code, reason))
+
+    async def finish(self):
+        if self.turn is not None:
+            self.turn.cancel()
+            await asyncio.gather(self.turn, return_exceptions=True)
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+
+
+@asynccontextmanager
+async def _db_scope():
+    """ORM work on a thread of its own, with its connection closed after, as for an HTTP request."""
+    async with ThreadSensitiveContext():
+        try:
+            yield
+        finally:
+            await sync_to_async(close_old_connections)()
+
+
+def _origin_allowed(headers):
+    origin = headers.get(b'origin', b'').decode('latin-1')
+    if not origin:
+        return False
+    return urlsplit(origin).netloc == headers.get(b'host', b'').decode('latin-1') \
+        or origin in settings.CSRF_TRUSTED_ORIGINS
+
+
+async def _authenticate(headers):
+    """(request, user) for the session cookie in ``headers``."""
+    request = HttpRequest()
+    request.COOKIES = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    async with _db_scope():
+        user = await auth_cache.aget_user(request)
+    return request, user
+
+
+async def _check_session(conn, always=False):
+    """Whether the connection's login still stands; if not, the connection is closed with 1008."""
+    now = time.monotonic()
+    if not always and now - conn.session_checked < settings.WS_SESSION_CHECK_INTERVAL:
+        return True
+    # A fresh session read: logout and flush delete it, a password change breaks its auth hash
+    _, user = await _authenticate(conn.headers)
+    if not user.is_authenticated or not user.is_active or user.pk != conn.user.pk:
+        conn.close(CLOSE_POLICY, 'session')
+        return False
+    conn.user, conn.session_checked = user, now
+    return True
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI application for ``websocket`` scopes."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    headers = dict(scope.get('headers', ()))
+    if scope['path'] != PATH or not _origin_allowed(headers):
+        await send({'type': 'websocket.close', 'code': CLOSE_POLICY})
+        return
+    request, user = await _authenticate(headers)
+    if not user.is_authenticated:
+        await send({'type': 'websocket.close', 'code': CLOSE_POLICY})
+        return
+
+    hub = get_hub()
+    await send({'type': 'websocket.accept'})
+    conn = Connection(user, send, headers)
+    if hub.count >= settings.WS_MAX_CONNECTIONS:
+        conn.close(CLOSE_TRY_AGAIN, 'full')
+    else:
+        hub.add(conn)
+        conn.offer({'type': 'hello', 'ping_interval': settings.WS_PING_INTERVAL})
+
+    # Same scoping as ShardMiddleware and ReplicaPinMiddleware; a socket reads its own writes
+    shard_token = sharding.begin_request(request) if sharding.sharding_enabled() else None
+    _, router_token = routers.begin_request(pinned=True)
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message['type'] != 'websocket.receive' or conn.closed:
+                continue
+            conn.last_seen = time.monotonic()
+            # The limit is in bytes, like uvicorn's ws_max_size: non-ASCII text is up to 4 per character
+            text = message.get('text')
+            raw = text.encode() if text is not None else message.get('bytes') or b''
+            if len(raw) > settings.WS_MAX_MESSAGE_BYTES:
+                conn.close(CLOSE_TOO_BIG, 'too_big')
+                continue
+            try:
+                data = json.loads(raw)
+                kind = data['type']
+            except (ValueError, TypeError, KeyError):
+                conn.offer({'type': 'error', 'error': 'Messages must be JSON objects with a type'})
+                continue
+            metrics.WS_FRAMES.inc(direction='in', type=kind if kind in HANDLERS else 'unknown')
+            handler = HANDLERS.get(kind)
+            if handler is None:
+                conn.offer({'type': 'error', 'error': f'Unknown message type: {kind}'})
+                continue
+            await handler(conn, data)
+    finally:
+        hub.remove(conn)
+        await conn.finish()
+        routers.end_request(router_token)
+        if shard_token is not None:
+            sharding.end_request(shard_token)
+
+
+# ==================== MESSAGE HANDLERS ====================
+
+async def _ping(conn, data):
+    conn.offer({'type': 'pong'})
+
+
+async def _chat_send(conn, data):
+    ref = data.get('ref')
+    if conn.turn is not None and not conn.turn.done():
+        conn.offer({'type': 'chat.error', 'ref': ref, 'status': 429, 'error': 'A reply is already in progress'})
+        return
+    if not await _check_session(conn, always=True):
+        return
+    conn.turn_ref = ref
+    conn.turn = asyncio.create_task(_turn(conn, ref, data))
+
+
+async def _turn(conn, ref, data):
+    async def on_chunk(text):
+        await conn.put({'type': 'chat.chunk', 'ref': ref, 'text': text})
+
+    async with _db_scope():
+        try:
+            turn = await run_turn(conn.user, data, on_chunk)
+        except asyncio.CancelledError:
+            conn.offer({'type': 'chat.cancelled', 'ref': ref})
+            raise
+    if turn.status == 200:
+        await conn.put({'type': 'chat.done', 'ref': ref, **turn.body})
+    else:
+        await conn.put({'type': 'chat.error', 'ref': ref, 'status': turn.status, **turn.body})
+    notify_turn(conn.user.pk, turn)
+
+
+async def _chat_cancel(conn, data):
+    if conn.turn is not None and data.get('ref', conn.turn_ref) == conn.turn_ref:
+        conn.turn.cancel()
+
+
+async def _sessions_list(conn, data):
+    if not await _check_session(conn):
+        return
+    async with _db_scope():
+        sessions = [session async for session in session_list(conn.user)]
+    await conn.put({'type': 'sessions', 'sessions': sessions})
+
+
+async def _tags_list(conn, data):
+    if not await _check_session(conn):
+        return
+    async with _db_scope():
+        tags = [tag async for tag in tag_facets(conn.user, ChatSession.objects.filter(user=conn.user))]
+    await conn.put({'type': 'tags', 'tags': tags})
+
+
+async def _usage_get(conn, data):
+    if not await _check_session(conn):
+        return
+    async with _db_scope():
+        usage = await RateLimiter.aget_user_stats(conn.user)
+    await conn.put({'type': 'usage', 'usage': usage})
+
+
+HANDLERS = {
+    'ping': _ping,
+    'chat.send': _chat_send,
+    'chat.cancel': _chat_cancel,
+    'sessions.list': _sessions_list,
+    'tags.list': _tags_list,
+    'usage.get': _usage_get,
+}
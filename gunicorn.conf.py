@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for the production ASGI profile.
+
+Each worker runs an event loop (uvicorn), so a chat request waiting on Gemini
+no longer blocks the whole worker; WEB_CONCURRENCY sets the worker count and
+UVICORN_LIMIT_CONCURRENCY caps in-flight connections per worker.
+
+Gunicorn loads this file automatically from the project root; to run the
+WSGI app instead, pass ``--worker-class sync`` on the command line.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "nicole_project.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+
+# Must exceed GEMINI_TIMEOUT so slow upstream calls are not killed mid-request.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "90"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+accesslog = "-"
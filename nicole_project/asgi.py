@@ -12,5 +12,18 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nicole_project.settings")
+# Each ASGI request runs its sync ORM work on a fresh thread, so persistent
+# per-thread connections would leak; close them at the end of every request.
+os.environ.setdefault("DB_CONN_MAX_AGE", "0")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup: chat.ws needs the app registry
+from chat.ws import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Django for HTTP; the chat WebSocket channel (chat.ws) for ``websocket`` scopes."""
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
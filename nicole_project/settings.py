@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 from pathlib import Path
 import dj_database_url
 
@@ -6,14 +8,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # Load environment variables
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '30'))
+# Pooled connections per worker process (chat.gemini)
+GEMINI_MAX_CONNECTIONS = int(os.environ.get('GEMINI_MAX_CONNECTIONS', '100'))
+GEMINI_MAX_KEEPALIVE = int(os.environ.get('GEMINI_MAX_KEEPALIVE', '20'))
 SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-fallback-key')
 DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '*').split(',')
 
-# Print for debugging (remove after fixing)
-print(f"DEBUG: GEMINI_API_KEY exists: {bool(GEMINI_API_KEY)}")
-print(f"DEBUG: GEMINI_API_KEY length: {len(GEMINI_API_KEY)}")
-
 # CSRF Settings
 CSRF_TRUSTED_ORIGINS = [
     'https://*.onrender.com',
@@ -42,10 +45,15 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "chat.middleware.MetricsMiddleware",
+    "chat.middleware.PerformanceMiddleware",
+    "chat.middleware.CompressionMiddleware",
+    "chat.middleware.ReplicaPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "chat.middleware.CachedAuthenticationMiddleware",
+    "chat.middleware.ShardMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -74,7 +82,7 @@ if os.environ.get('DATABASE_URL'):
     DATABASES = {
         'default': dj_database_url.config(
             default=os.environ.get('DATABASE_URL'),
-            conn_max_age=600,
+            conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '600')),
             conn_health_checks=True,
         )
     }
@@ -86,6 +94,198 @@ else:
         }
     }
 
+# Per-user sharding of chat data (chat.sharding). DATABASE_SHARD_URLS lists the shard
+# databases; without it SQLITE_SHARDS local files are declared when CHAT_SHARDING is on
+# (and always under the test runner, whose sharding tests turn it on). Sharding needs a
+# cache shared by all workers (REDIS_URL); a system check enforces it.
+CHAT_SHARDING = os.environ.get('CHAT_SHARDING', 'False') == 'True'
+TESTING = sys.argv[1:2] == ['test']
+SHARD_URLS = [url.strip() for url in os.environ.get('DATABASE_SHARD_URLS', '').split(',') if url.strip()]
+if SHARD_URLS:
+    for index, url in enumerate(SHARD_URLS):
+        DATABASES[f'shard_{index}'] = dj_database_url.parse(
+            url,
+            conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+            conn_health_checks=True,
+        )
+elif CHAT_SHARDING or TESTING:
+    for index in range(int(os.environ.get('SQLITE_SHARDS', '2'))):
+        DATABASES[f'shard_{index}'] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / f"db_shard_{index}.sqlite3",
+        }
+CHAT_SHARDS = [alias for alias in DATABASES if alias.startswith('shard_')]
+# Directory lookups: shared cache TTL, and how long a worker trusts its own copy
+# (move_user_shard waits this long between switching steps, so keep it short)
+SHARD_DIRECTORY_CACHE_TTL = int(os.environ.get('SHARD_DIRECTORY_CACHE_TTL', '86400'))
+SHARD_DIRECTORY_LOCAL_TTL = float(os.environ.get('SHARD_DIRECTORY_LOCAL_TTL', '30'))
+
+# SQLite production profile: WAL (readers never block the writer), relaxed fsync,
+# memory-mapped reads and a larger page cache on every connection; write
+# transactions start with BEGIN IMMEDIATE so lock waits go through the busy timeout
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', 'True') == 'True'
+for database in DATABASES.values():
+    if SQLITE_TUNING and database['ENGINE'] == 'django.db.backends.sqlite3':
+        database.setdefault('OPTIONS', {}).update({
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA cache_size=-32000;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA wal_autocheckpoint=1000'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '20')),
+        })
+
+# Group-commit Message/APIUsageLog inserts through one writer thread per process
+# (chat.sqlite.WriteQueue); only used when the default database is SQLite
+SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE', 'True') == 'True'
+SQLITE_WRITE_BATCH = int(os.environ.get('SQLITE_WRITE_BATCH', '200'))
+SQLITE_WRITE_WAIT_MS = float(os.environ.get('SQLITE_WRITE_WAIT_MS', '2'))
+
+# Optional read replica for read-only API views (chat.routers.ReplicaRouter).
+# Tests mirror it onto the default test database.
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ.get('DATABASE_REPLICA_URL'),
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['chat.sharding.ShardRouter', 'chat.routers.ReplicaRouter']
+# Seconds a client keeps reading from the primary after it writes
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+# Fall back to the primary when the replica lags more than this
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '5'))
+
+# Cache: Redis when REDIS_URL is set (shared by all workers), otherwise per-process memory
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Sessions: cached_db answers from the cache and falls back to the database, so it is only
+# the default with Redis; a per-process cache would keep a logged-out session alive on the
+# other workers. Expired rows are removed by the clearsessions cron job (render.yaml).
+SESSION_ENGINE = os.environ.get(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if os.environ.get('REDIS_URL') else 'django.contrib.sessions.backends.db',
+)
+# The session's user (chat.auth_cache): saving or deleting the user drops the entry. Only
+# cached with a shared cache (Redis); per process, a deactivation would not reach the other workers
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', '300'))
+
+# Per-user rate-limit configs (chat.rate_limit): shared cache TTL, and how long each
+# worker may keep its own copy before re-reading the shared cache after an admin edit.
+# Without Redis the "shared" cache is per process too, so it is capped at the local TTL.
+RATE_LIMIT_CACHE_TTL = int(os.environ.get('RATE_LIMIT_CACHE_TTL', '86400'))
+RATE_LIMIT_LOCAL_TTL = float(os.environ.get('RATE_LIMIT_LOCAL_TTL', '60'))
+
+# Message.text_content compression (chat.fields.CompressedTextField): 'zlib', 'zstd'
+# (needs the zstandard package) or 'none'. Shorter messages are stored as plain text.
+MESSAGE_COMPRESSION = os.environ.get('MESSAGE_COMPRESSION', 'zlib')
+MESSAGE_COMPRESSION_MIN_LENGTH = int(os.environ.get('MESSAGE_COMPRESSION_MIN_LENGTH', '512'))
+# Chat search matches compressed messages after decoding them; it reads at most this many
+# of the user's newest candidate messages
+SEARCH_SCAN_LIMIT = int(os.environ.get('SEARCH_SCAN_LIMIT', '2000'))
+
+# Sessions idle this long are moved to ArchivedSession by the archive_sessions command
+CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', '14'))
+
+# Most sessions one bulk request (/api/sessions/bulk/...) may delete, tag or export
+BULK_MAX_SESSIONS = int(os.environ.get('BULK_MAX_SESSIONS', '500'))
+
+# Chat context (chat.retrieval): the last CHAT_HISTORY_WINDOW messages of the session are
+# sent as history, plus up to RETRIEVAL_TOP_K similar snippets from the user's older
+# messages and other sessions, found in a per-user hashed-embedding index
+CHAT_HISTORY_WINDOW = int(os.environ.get('CHAT_HISTORY_WINDOW', '20'))
+RETRIEVAL_ENABLED = os.environ.get('RETRIEVAL_ENABLED', 'True') == 'True'
+RETRIEVAL_DIM = int(os.environ.get('RETRIEVAL_DIM', '256'))
+RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '4'))
+RETRIEVAL_MIN_SCORE = float(os.environ.get('RETRIEVAL_MIN_SCORE', '0.25'))
+RETRIEVAL_SNIPPET_CHARS = int(os.environ.get('RETRIEVAL_SNIPPET_CHARS', '400'))
+# Vectors per stored block, and messages embedded per step by the background indexer
+RETRIEVAL_SEGMENT_SIZE = int(os.environ.get('RETRIEVAL_SEGMENT_SIZE', '512'))
+RETRIEVAL_UPDATE_LIMIT = int(os.environ.get('RETRIEVAL_UPDATE_LIMIT', '500'))
+# Memory each worker may use to keep recently used indexes loaded between turns
+RETRIEVAL_INDEX_CACHE_MB = float(os.environ.get('RETRIEVAL_INDEX_CACHE_MB', '64'))
+
+# Model routing (chat.model_routing): each chat turn is classified as light, standard or heavy
+# and sent to that tier's model with its output budget. While a model's rolling p95 latency or
+# error rate is over the thresholds, its tier is served by the tier's fallback model. The
+# defaults are Gemini 2.5 models, whose context-cache minimums (below) a history window reaches.
+CHAT_ROUTES = {
+    'light': {
+        'model': os.environ.get('CHAT_MODEL_LIGHT', 'gemini-2.5-flash-lite'),
+        'fallback': os.environ.get('CHAT_FALLBACK_LIGHT', 'gemini-2.5-flash'),
+        'max_output_tokens': int(os.environ.get('CHAT_MAX_TOKENS_LIGHT', '512')),
+    },
+    'standard': {
+        'model': os.environ.get('CHAT_MODEL_STANDARD', 'gemini-2.5-flash'),
+        'fallback': os.environ.get('CHAT_FALLBACK_STANDARD', 'gemini-2.5-flash-lite'),
+        'max_output_tokens': int(os.environ.get('CHAT_MAX_TOKENS_STANDARD', '2048')),
+    },
+    'heavy': {
+        'model': os.environ.get('CHAT_MODEL_HEAVY', 'gemini-2.5-pro'),
+        'fallback': os.environ.get('CHAT_FALLBACK_HEAVY', 'gemini-2.5-flash'),
+        'max_output_tokens': int(os.environ.get('CHAT_MAX_TOKENS_HEAVY', '4096')),
+    },
+}
+# Classification thresholds, in characters
+ROUTING_LIGHT_CHARS = int(os.environ.get('ROUTING_LIGHT_CHARS', '120'))
+ROUTING_HEAVY_CHARS = int(os.environ.get('ROUTING_HEAVY_CHARS', '800'))
+# Shortest prompt in which words like "compare" or "budget" ask for a heavy answer
+ROUTING_HEAVY_HINT_CHARS = int(os.environ.get('ROUTING_HEAVY_HINT_CHARS', '200'))
+ROUTING_LONG_HISTORY_CHARS = int(os.environ.get('ROUTING_LONG_HISTORY_CHARS', '6000'))
+# Failover: last ROUTING_STATS_WINDOW calls per model, no older than ROUTING_STATS_MAX_AGE seconds
+ROUTING_STATS_WINDOW = int(os.environ.get('ROUTING_STATS_WINDOW', '100'))
+ROUTING_STATS_MAX_AGE = float(os.environ.get('ROUTING_STATS_MAX_AGE', '300'))
+ROUTING_MIN_SAMPLES = int(os.environ.get('ROUTING_MIN_SAMPLES', '10'))
+ROUTING_MAX_P95 = float(os.environ.get('ROUTING_MAX_P95', '12'))
+ROUTING_MAX_ERROR_RATE = float(os.environ.get('ROUTING_MAX_ERROR_RATE', '0.2'))
+
+# Gemini context caching (chat.prompt_cache): the system instruction and the start of a long
+# history are stored as a cachedContents handle for PROMPT_CACHE_TTL seconds and reused while at
+# most PROMPT_CACHE_MAX_TAIL newer messages follow it. Prefixes estimated under the model's
+# minimum are sent in full: Gemini's minimum by model name prefix (longest match wins), and
+# PROMPT_CACHE_MIN_TOKENS, the largest of them, for models not listed.
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'True') == 'True'
+PROMPT_CACHE_TTL = int(os.environ.get('PROMPT_CACHE_TTL', '600'))
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get('PROMPT_CACHE_MIN_TOKENS', '32768'))
+PROMPT_CACHE_MODEL_MIN_TOKENS = {
+    'gemini-1.5': 32768,
+    'gemini-2.0': 4096,
+    'gemini-2.5-pro': 4096,
+    'gemini-2.5-flash': 1024,
+}
+PROMPT_CACHE_MAX_TAIL = int(os.environ.get('PROMPT_CACHE_MAX_TAIL', '10'))
+# Seconds a model is skipped after creating a handle for it failed (e.g. no caching support)
+PROMPT_CACHE_RETRY_AFTER = float(os.environ.get('PROMPT_CACHE_RETRY_AFTER', '300'))
+
+# Chat WebSocket (chat.ws, /ws/chat/): pages ping every WS_PING_INTERVAL seconds and connections
+# silent for WS_IDLE_TIMEOUT are closed. At most WS_SEND_QUEUE frames wait for a slow client;
+# WS_MAX_CONNECTIONS per worker process (see nicole_project.workers for uvicorn's own limits).
+WS_PING_INTERVAL = float(os.environ.get('WS_PING_INTERVAL', '25'))
+WS_IDLE_TIMEOUT = float(os.environ.get('WS_IDLE_TIMEOUT', '120'))
+WS_SEND_QUEUE = int(os.environ.get('WS_SEND_QUEUE', '64'))
+WS_MAX_MESSAGE_BYTES = int(os.environ.get('WS_MAX_MESSAGE_BYTES', '65536'))
+WS_MAX_CONNECTIONS = int(os.environ.get('WS_MAX_CONNECTIONS', '5000'))
+# Chat turns always re-check the socket's login; list requests at most this often (seconds)
+WS_SESSION_CHECK_INTERVAL = float(os.environ.get('WS_SESSION_CHECK_INTERVAL', '60'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -98,12 +298,63 @@ TIME_ZONE = "UTC"
 USE_I18N = True
 USE_TZ = True
 
+# Response compression (chat.middleware.CompressionMiddleware): JSON responses at least this
+# big are sent brotli- or gzip-compressed, as negotiated with Accept-Encoding. Higher levels
+# cost far more CPU per request than they save in bytes (see the benchmark_json command).
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+
+# Admin change lists (chat.admin) count at most this many rows; unfiltered tables bigger
+# than this show the database's row estimate instead of running COUNT(*)
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('ADMIN_EXACT_COUNT_LIMIT', '10000'))
+
 # Static files
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# collectstatic writes content-hashed copies plus .gz and .br (with Brotli installed) next to
+# each file; WhiteNoise serves the hashed names with a ten-year immutable Cache-Control.
+# (STATICFILES_STORAGE was removed in Django 5.1 and is ignored, so this must be STORAGES.)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'nicole_chat'
+
+# Performance instrumentation (chat.middleware.PerformanceMiddleware)
+PERF_SERVER_TIMING = os.environ.get('PERF_SERVER_TIMING', 'True') == 'True'
+PERF_LOG_REQUESTS = os.environ.get('PERF_LOG_REQUESTS', 'True') == 'True'
+PERF_SLOW_REQUEST_MS = float(os.environ.get('PERF_SLOW_REQUEST_MS', '1000'))
+PERF_SLOW_SAMPLE_RATE = float(os.environ.get('PERF_SLOW_SAMPLE_RATE', '1.0'))
+
+# Metrics (chat.metrics), scraped at /metrics in Prometheus text format.
+# Worker snapshots are merged through METRICS_DIR; set it to '' for single-process mode.
+# Scrapes need 'Authorization: Bearer <METRICS_TOKEN>'; without a token only staff
+# users and requests from localhost can read the endpoint.
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'nicole-metrics'))
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json_line": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+        "perf": {"class": "logging.StreamHandler", "formatter": "json_line"},
+    },
+    "loggers": {
+        "chat.perf": {
+            "handlers": ["perf"],
+            "level": os.environ.get('PERF_LOG_LEVEL', 'INFO'),
+            "propagate": False,
+        },
+    },
+    "root": {"handlers": ["console"], "level": "WARNING"},
+}
@@ -0,0 +1,26 @@
+"""
+Gunicorn worker classes.
+"""
+import os
+
+from uvicorn_worker import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """
+    Uvicorn worker tuned for Django: no lifespan protocol, bounded concurrency.
+
+    Uvicorn counts open WebSockets against ``limit_concurrency``, so the limit
+    is the HTTP budget plus ``WS_MAX_CONNECTIONS`` (which chat.ws enforces for
+    sockets). Frames over ``WS_MAX_MESSAGE_BYTES`` are refused by the protocol.
+    """
+
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        "ws": "auto",
+        "lifespan": "off",
+        "limit_concurrency": int(os.environ.get("UVICORN_LIMIT_CONCURRENCY", "500"))
+        + int(os.environ.get("WS_MAX_CONNECTIONS", "5000")),
+        "ws_max_size": int(os.environ.get("WS_MAX_MESSAGE_BYTES", "65536")),
+    }